@@ -2,7 +2,10 @@ from qdev_wrappers import logger
 from qdev_wrappers.file_setup import my_init
 from qdev_wrappers.device_annotator.device_image import save_device_image
 from qdev_wrappers.show_num import show_num
-from qdev_wrappers.sweep_functions import do0d, do1d, do2d, do1dDiagonal
+from qdev_wrappers.sweep_functions import do0d, do1d, do2d, do1dDiagonal, \
+    do1d_adaptive, do2d_adaptive
+from qdev_wrappers.background_rendering import start_background_rendering, \
+    stop_background_rendering, pending_renders, wait_for_renders
 
 from qcodes.monitor.monitor import Monitor
 from qcodes.instrument.base import Instrument
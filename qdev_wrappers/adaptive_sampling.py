@@ -0,0 +1,270 @@
+"""
+Learners which choose the points of a sweep adaptively, used by
+do1d_adaptive and do2d_adaptive in sweep_functions.
+
+The learners work on the grid of a normal sweep (the target resolution)
+and only pick points of that grid, so the result can be stored in the
+same dataset as a normal sweep. Points which are not measured are filled
+in by linear interpolation of the measured ones.
+
+A learner is used by asking it for the grid index of the next point to
+measure and telling it the measured value:
+
+    while learner.loss() > loss_goal:
+        index = learner.ask()
+        if index is None:
+            break
+        learner.tell(index, measure(index))
+"""
+import logging
+import math
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import Delaunay
+
+log = logging.getLogger(__name__)
+
+
+class IntervalLearner:
+    """
+    Samples a 1D sweep of num_points points, refining the intervals
+    between neighbouring measured points with the largest loss.
+
+    The loss of an interval is its length in the plot of the measured
+    values with both axes scaled to the unit interval, i.e. intervals in
+    which the values change fast are split first and flat regions are
+    sampled sparsely. An interval between neighbouring points of the
+    grid cannot be split further.
+
+    Args:
+        num_points: number of points of the sweep
+        initial_points: number of evenly spaced points measured first
+    """
+
+    def __init__(self, num_points: int, initial_points: int=10) -> None:
+        if num_points < 2:
+            raise ValueError('An adaptive sweep needs at least 2 points')
+        self.num_points = num_points
+        initial_points = min(max(initial_points, 2), num_points)
+        self._initial = [(int(i),) for i in np.unique(np.round(
+            np.linspace(0, num_points - 1, initial_points)).astype(int))]
+        # measured grid indices and values in the order they were told
+        self.points = []
+        self.values = []
+        self._sampled = set()
+
+    def ask(self) -> Optional[Tuple[int]]:
+        """
+        Grid index of the next point to measure, None if the sweep is
+        sampled at full resolution.
+        """
+        while self._initial:
+            index = self._initial.pop(0)
+            if index not in self._sampled:
+                return index
+        intervals, losses = self._losses()
+        if len(losses) == 0:
+            return None
+        lower, upper = intervals[np.argmax(losses)]
+        return ((lower + upper) // 2,)
+
+    def tell(self, index: Tuple[int], value: float) -> None:
+        self.points.append(tuple(index))
+        self.values.append(value)
+        self._sampled.add(tuple(index))
+
+    def loss(self) -> float:
+        """
+        Largest loss of an interval which can still be split, infinite
+        until the initial points are measured.
+        """
+        if self._initial:
+            return math.inf
+        _, losses = self._losses()
+        return float(np.max(losses)) if len(losses) else 0.0
+
+    def interpolate(self, values: Optional[Sequence[float]]=None) -> np.ndarray:
+        """
+        The values on the full grid, linearly interpolated between the
+        measured points.
+
+        Args:
+            values: values measured at self.points, defaults to the values
+                told to the learner
+        """
+        if values is None:
+            values = self.values
+        indices = np.array([point[0] for point in self.points])
+        order = np.argsort(indices)
+        return np.interp(np.arange(self.num_points), indices[order],
+                         np.asarray(values, dtype=float)[order])
+
+    def _losses(self) -> Tuple[np.ndarray, np.ndarray]:
+        indices = np.array(sorted(point[0] for point in self._sampled))
+        if len(indices) < 2:
+            return np.empty((0, 2), dtype=int), np.empty(0)
+        values = dict(zip((point[0] for point in self.points), self.values))
+        sorted_values = np.array([values[i] for i in indices], dtype=float)
+        intervals = np.stack((indices[:-1], indices[1:]), axis=1)
+        refinable = intervals[:, 1] - intervals[:, 0] > 1
+        dx = (intervals[:, 1] - intervals[:, 0]) / (self.num_points - 1)
+        dy = np.abs(np.diff(sorted_values)) / _value_range(sorted_values)
+        losses = np.hypot(dx, np.nan_to_num(dy))
+        return intervals[refinable], losses[refinable]
+
+
+class TriangulationLearner:
+    """
+    Samples a 2D sweep on a grid of shape points, refining the triangles
+    of the Delaunay triangulation of the measured points with the largest
+    loss.
+
+    The loss of a triangle is sqrt(area) times the spread of the values
+    at its corners plus area_weight times its area, with the sweep and the
+    values scaled to the unit interval. Triangles across which the values
+    change are split first, the area term makes sure that flat regions
+    are eventually sampled too. A triangle is split at the grid point
+    nearest to its centroid (or to the middle of its longest edge), it
+    cannot be split if those points are already measured.
+
+    Args:
+        shape: number of points of the outer and the inner sweep
+        initial_points: approximate number of points of the coarse grid
+            (including the corners) measured first, at least 3 along each
+            axis as qhull cannot triangulate the 4 corners alone
+        area_weight: weight of the area term of the loss
+    """
+
+    def __init__(self, shape: Tuple[int, int], initial_points: int=100,
+                 area_weight: float=0.3) -> None:
+        if min(shape) < 3:
+            raise ValueError('An adaptive 2D sweep needs at least 3 points '
+                             'along each axis')
+        self.shape = tuple(shape)
+        self.area_weight = area_weight
+        per_axis = max(3, int(math.ceil(math.sqrt(initial_points))))
+        outer, inner = (np.unique(np.round(np.linspace(
+            0, n - 1, min(per_axis, n))).astype(int)) for n in self.shape)
+        self._initial = [(int(i), int(j)) for i in outer for j in inner]
+        self._scale = np.array([1 / (n - 1) for n in self.shape])
+        self.points = []
+        self.values = []
+        self._sampled = set()
+        self._triangulation = None
+        self._triangulated = 0
+        # triangles which cannot be split, see _simplex_keys
+        self._exhausted = set()
+
+    def ask(self) -> Optional[Tuple[int, int]]:
+        """
+        Grid index of the next point to measure, None if no triangle can
+        be split any more.
+        """
+        while self._initial:
+            index = self._initial.pop(0)
+            if index not in self._sampled:
+                return index
+        simplices, losses = self._losses()
+        for k in np.argsort(-losses):
+            if not np.isfinite(losses[k]):
+                break
+            corners = np.array([self.points[p] for p in simplices[k]])
+            for candidate in self._candidates(corners):
+                if candidate not in self._sampled:
+                    return candidate
+            self._exhausted.add(int(self._simplex_keys(simplices[k:k + 1])[0]))
+        return None
+
+    def tell(self, index: Tuple[int, int], value: float) -> None:
+        self.points.append(tuple(index))
+        self.values.append(value)
+        self._sampled.add(tuple(index))
+
+    def loss(self) -> float:
+        """
+        Largest loss of a triangle which can still be split, infinite
+        until the initial points are measured.
+        """
+        if self._initial:
+            return math.inf
+        _, losses = self._losses()
+        finite = losses[np.isfinite(losses)]
+        return float(np.max(finite)) if len(finite) else 0.0
+
+    def interpolate(self, values: Optional[Sequence[float]]=None) -> np.ndarray:
+        """
+        The values on the full grid, linearly interpolated over the
+        triangulation of the measured points.
+
+        Args:
+            values: values measured at self.points, defaults to the values
+                told to the learner
+        """
+        if values is None:
+            values = self.values
+        values = np.asarray(values, dtype=float)
+        grid = np.stack(np.meshgrid(*(np.arange(n) for n in self.shape),
+                                    indexing='ij'), axis=-1) * self._scale
+        interpolator = LinearNDInterpolator(self._update_triangulation(),
+                                            values)
+        interpolated = interpolator(grid)
+        for point, value in zip(self.points, values):
+            interpolated[point] = value
+        return interpolated
+
+    def _update_triangulation(self) -> Delaunay:
+        new_points = self.points[self._triangulated:]
+        if new_points:
+            coordinates = np.array(new_points, dtype=float) * self._scale
+            if self._triangulation is None:
+                self._triangulation = Delaunay(coordinates, incremental=True)
+            else:
+                self._triangulation.add_points(coordinates)
+            self._triangulated = len(self.points)
+        return self._triangulation
+
+    def _losses(self) -> Tuple[np.ndarray, np.ndarray]:
+        triangulation = self._update_triangulation()
+        simplices = triangulation.simplices
+        coordinates = triangulation.points
+        values = np.array(self.values, dtype=float)
+        corners = coordinates[simplices]
+        edges = corners[:, 1:] - corners[:, :1]
+        areas = 0.5 * np.abs(edges[:, 0, 0] * edges[:, 1, 1] -
+                             edges[:, 0, 1] * edges[:, 1, 0])
+        corner_values = values[simplices]
+        spread = ((np.nanmax(corner_values, axis=1) -
+                   np.nanmin(corner_values, axis=1)) /
+                  _value_range(values))
+        losses = np.sqrt(areas) * np.nan_to_num(spread) + \
+            self.area_weight * areas
+        if self._exhausted:
+            exhausted = np.isin(self._simplex_keys(simplices),
+                                np.fromiter(self._exhausted, dtype=np.int64))
+            losses[exhausted] = -math.inf
+        return simplices, losses
+
+    def _simplex_keys(self, simplices: np.ndarray) -> np.ndarray:
+        # the point numbers of a triangle in increasing order, encoded as
+        # a single integer
+        size = self.shape[0] * self.shape[1]
+        corners = np.sort(simplices, axis=1).astype(np.int64)
+        return (corners[:, 0] * size + corners[:, 1]) * size + corners[:, 2]
+
+    @staticmethod
+    def _candidates(corners: np.ndarray):
+        yield tuple(int(i) for i in np.round(corners.mean(axis=0)))
+        lengths = [np.sum((corners[k] - corners[k - 1])**2) for k in range(3)]
+        k = int(np.argmax(lengths))
+        yield tuple(int(i) for i in
+                    np.round((corners[k] + corners[k - 1]) / 2))
+
+
+def _value_range(values: np.ndarray) -> float:
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return 1.0
+    value_range = np.max(finite) - np.min(finite)
+    return value_range if value_range > 0 else 1.0
@@ -1,12 +1,15 @@
 import logging
+from typing import List
 from qcodes.instrument_drivers.AlazarTech.ATS import AcquisitionController
 import numpy as np
+from qcodes.utils import validators as vals
 import qdev_wrappers.alazar_controllers.acq_helpers as helpers
-from qdev_wrappers.alazar_controllers.demodulator import filter_ls, filter_win
+from qdev_wrappers.alazar_controllers.demodulator import demodulator_cache
 from .acquisition_parametersold import AcqVariablesParam, \
                                        ExpandingAlazarArrayMultiParameter, \
                                        NonSettableDerivedParameter, \
                                        DemodFreqParameter
+from .stage_timings import StageTimings, disabled_timings, store_timings
 
 log = logging.getLogger(__name__)
 class ATS9360Controller(AcquisitionController):
@@ -15,6 +18,19 @@ class ATS9360Controller(AcquisitionController):
     averaging over records and buffers and demodulating with software reference
     signal(s). It may optionally integrate over the samples following the post processing
 
+    The demodulation uses the shared Demodulator (see demodulator.py) from
+    the demodulator cache, as the ATSChannelController does, so the
+    references and integration weights are computed once and integrating
+    over samples is a single matrix product for all demodulation
+    frequencies. The raw samples are summed as integers and converted to
+    volts once.
+
+    When integrating over samples the magnitude and phase are by default
+    the mean of the magnitude and phase of the demodulated samples in the
+    integration window, as they have always been. With integrate_iq they
+    are those of the integrated I/Q point instead, as in the
+    ATSChannelController, which is faster but gives different values.
+
 
     Args:
         name: name for this acquisition_controller as an instrument
@@ -23,30 +39,49 @@ class ATS9360Controller(AcquisitionController):
         filter (default 'win'): filter to be used to filter out double freq
             component ('win' - window, 'ls' - least squared, 'ave' - averaging)
         numtaps (default 101): number of freq components used in filter
-        chan_b (default False): whether there is also a second channel of data
-            to be processed and returned. Not currently fully implemented.
+        chan_b (default False): whether channel B is acquired and its data
+            processed and returned after the data of channel A. Otherwise
+            only channel A is acquired.
+        integrate_samples (default False): whether to integrate over samples
+        integrate_iq (default False): whether the integrated magnitude and
+            phase are those of the integrated I/Q point instead of the mean
+            magnitude and phase of the samples
+        average_records (default True): whether to average over records
+        average_buffers (default True): whether to average over buffers.
+            Otherwise the data of each buffer is returned and
+            buffers_per_acquisition can be set.
         **kwargs: kwargs are forwarded to the Instrument base class
 
+    With 'profile_stages' set the time spent in each stage of an
+    acquisition is recorded in the 'timings' parameter, see
+    ATSChannelController.
+
     TODO(nataliejpg) test filter options
     TODO(JHN) Use filtfit for better performance?
     TODO(JHN) Test demod+filtering and make it more modular
-    TODO(nataliejpg) finish implementation of channel b option
-    TODO(JHN) Option to not read channel b at all (Speedup)
     TODO(nataliejpg) what should be private?
     TODO(nataliejpg) where should filter_dict live?
     """
 
     filter_dict = {'win': 0, 'ls': 1, 'ave': 2}
 
+    # approximate size of the raw data processed at once when processing
+    # non averaged buffers
+    processing_chunk_bytes = 64 * 1024**2
+
     def __init__(self, name, alazar_name, filter: str = 'win',
                  numtaps: int =101, chan_b: bool = False,
                  integrate_samples: bool = False,
+                 integrate_iq: bool = False,
                  average_records: bool = True,
+                 average_buffers: bool = True,
                  **kwargs):
         self.filter_settings = {'filter': self.filter_dict[filter],
                                 'numtaps': numtaps}
         self.chan_b = chan_b
-        self.number_of_channels = 2
+        # number of Alazar channels acquired, updated from the channel
+        # selection of the Alazar before each acquisition
+        self.number_of_channels = 2 if chan_b else 1
         if not integrate_samples and not average_records:
             raise RuntimeError("You need to either average records or integrate over samples")
 
@@ -55,9 +90,12 @@ class ATS9360Controller(AcquisitionController):
         self.add_parameter(name='acquisition',
                            integrate_samples=integrate_samples,
                            average_records=average_records,
+                           average_buffers=average_buffers,
                            parameter_class=ExpandingAlazarArrayMultiParameter)
 
         self._integrate_samples = integrate_samples
+        self._integrate_iq = integrate_iq
+        self._average_buffers = average_buffers
 
         self.add_parameter(name='int_time',
                            check_and_update_fn=self._update_int_time,
@@ -74,9 +112,15 @@ class ATS9360Controller(AcquisitionController):
         self.add_parameter(name='allocated_buffers',
                            alternative='not controllable in this controller',
                            parameter_class=NonSettableDerivedParameter)
-        self.add_parameter(name='buffers_per_acquisition',
-                           alternative='not controllable in this controller',
-                           parameter_class=NonSettableDerivedParameter)
+        if average_buffers:
+            self.add_parameter(name='buffers_per_acquisition',
+                               alternative='not controllable in this controller',
+                               parameter_class=NonSettableDerivedParameter)
+        else:
+            self.add_parameter(name='buffers_per_acquisition',
+                               parameter_class=AcqVariablesParam,
+                               default_fn= lambda : 1,
+                               check_and_update_fn=self._update_buffers_per_acquisition)
         if average_records:
             self.add_parameter(name='records_per_buffer',
                                alternative='num_avg',
@@ -94,6 +138,30 @@ class ATS9360Controller(AcquisitionController):
                            shape=(),
                            parameter_class=DemodFreqParameter)
 
+        self.add_parameter(name='profile_stages',
+                           label='profile stages',
+                           docstring='Record the time spent in each stage '
+                                     'of the acquisition in timings.',
+                           initial_value=False,
+                           vals=vals.Bool(),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='timings_to_metadata',
+                           label='timings to metadata',
+                           docstring='Sum up the timings of the '
+                                     'acquisitions in the metadata of the '
+                                     'active dataset. Only used if '
+                                     'profile_stages is set.',
+                           initial_value=False,
+                           vals=vals.Bool(),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='timings',
+                           label='timings',
+                           alternative='profile_stages',
+                           parameter_class=NonSettableDerivedParameter)
+        self._timings = disabled_timings
+        self.buffer = None
+        self.demodulator = None
+
         self.samples_divisor = self._get_alazar().samples_divisor
         self.board_info = self._get_alazar().get_idn()
 
@@ -146,6 +214,16 @@ class ATS9360Controller(AcquisitionController):
         self.records_per_buffer._save_val(value)
         self.acquisition.set_setpoints_and_labels()
 
+    def _update_buffers_per_acquisition(self, value, **kwargs):
+        if not isinstance(value, int) or value < 1:
+            raise ValueError('buffers per acquisition must be a positive integer')
+        self._save_buffers_per_acquisition(value)
+        self.acquisition.set_setpoints_and_labels()
+
+    def _save_buffers_per_acquisition(self, value):
+        self.buffers_per_acquisition._save_val(value)
+        self.allocated_buffers._save_val(4 if value > 1 else 1)
+
     def _update_int_delay(self, value, **kwargs):
         """
         Function to validate value for int_delay before setting parameter
@@ -189,11 +267,15 @@ class ATS9360Controller(AcquisitionController):
 
         if self.acquisition._average_records:
             self.records_per_buffer._save_val(value)
-            self.buffers_per_acquisition._save_val(1)
-            self.allocated_buffers._save_val(1)
-        else:
-            self.buffers_per_acquisition._save_val(value)
-            self.allocated_buffers._save_val(2)
+            if self._average_buffers:
+                self._save_buffers_per_acquisition(1)
+        elif self._average_buffers:
+            self._save_buffers_per_acquisition(value)
+        elif value != 1:
+            raise ValueError('Cannot average over {} records or buffers as '
+                             'neither records nor buffers are '
+                             'averaged'.format(value))
+        self.acquisition.set_setpoints_and_labels()
 
     def _int_delay_default(self):
         """
@@ -261,11 +343,31 @@ class ATS9360Controller(AcquisitionController):
         self.acquisition.acquisition_kwargs.update(**kwargs)
         self.acquisition.set_setpoints_and_labels()
 
+    def channel_selection(self) -> str:
+        """
+        Value of the Alazar channel_selection which acquires the channels
+        processed by this controller.
+        """
+        return 'AB' if self.chan_b else 'A'
+
     def pre_start_capture(self):
         """
         Called before capture start to update Acquisition Controller with
         Alazar acquisition params and set up software wave for demodulation.
         """
+        if self.profile_stages.get():
+            self._timings = StageTimings()
+        else:
+            self._timings = disabled_timings
+        with self._timings.stage('setup'):
+            self._prepare_processing()
+        self._timings.allocated('buffer', self.buffer.nbytes)
+
+    def _prepare_processing(self):
+        """
+        Checks the Alazar settings and sets up the buffer and the
+        demodulator.
+        """
         alazar = self._get_alazar()
         acq_s_p_r = self.samples_per_record.get()
         inst_s_p_r = alazar.samples_per_record.get()
@@ -274,64 +376,89 @@ class ATS9360Controller(AcquisitionController):
             raise Exception('acq controller samples per record {} does not match'
                             ' instrument value {}, most likely need '
                             'to set and check int_time and int_delay'.format(acq_s_p_r, inst_s_p_r))
-        # if acq_s_r != inst_s_r:
-        #     raise Exception('acq controller sample rate {} does not match '
-        #                     'instrument value {}, most likely need '
-        #                     'to set and check int_time and int_delay'.format(acq_s_r, inst_s_r))
-        samples_per_record = inst_s_p_r
-        demod_freqs = self.demod_freqs.get()
-        # if len(demod_freqs) == 0:
-        #     raise Exception('no demod_freqs set')
+        # the layout of the buffers follows the channels actually acquired
+        acquired_channels = alazar.channel_selection.get()
+        for channel in self.channel_selection():
+            if channel not in acquired_channels:
+                raise Exception('channel {} is processed but instrument '
+                                'channel selection is {}'.format(
+                                    channel, acquired_channels))
+        self._positions = [acquired_channels.index(channel)
+                           for channel in self.channel_selection()]
+        self.number_of_channels = len(acquired_channels)
 
+        samples_per_record = inst_s_p_r
         records_per_buffer = alazar.records_per_buffer.get()
+        buffers_per_acquisition = alazar.buffers_per_acquisition.get()
         max_samples = self.board_info['max_samples']
         samples_per_buffer = records_per_buffer * samples_per_record
         if samples_per_buffer > max_samples:
             raise RuntimeError("Trying to acquire {} samples in one buffer maximum supported is {}".format(samples_per_buffer, max_samples))
-
-        self.buffer = np.zeros(samples_per_record *
-                               records_per_buffer *
-                               self.number_of_channels)
-        avg_buffers = True
-        if avg_buffers:
-            len_buffers = 1
+        self._samples_per_record = samples_per_record
+        self._records_per_buffer = records_per_buffer
+        self._buffers_per_acquisition = buffers_per_acquisition
+
+        if self._average_buffers:
+            # running integer sum of the raw samples
+            self.buffer = np.zeros(samples_per_record *
+                                   records_per_buffer *
+                                   self.number_of_channels,
+                                   dtype=np.int64)
         else:
-            pass # not implemented yet
+            self.buffer = np.zeros((buffers_per_acquisition,
+                                    records_per_buffer,
+                                    samples_per_record,
+                                    self.number_of_channels),
+                                   dtype=np.uint16)
+
+        output_shape = ()
+        if not self._average_buffers:
+            output_shape += (buffers_per_acquisition,)
+        if not self.acquisition._average_records:
+            output_shape += (records_per_buffer,)
+        if not self._integrate_samples:
+            output_shape += (samples_per_record,)
+        self._output_shape = output_shape
 
-        if self.acquisition._average_records:
-            len_records = 1
+        demod_freqs = self.demod_freqs.get()
+        if len(demod_freqs):
+            self.demodulator = demodulator_cache.get(samples_per_record,
+                                                     sample_rate,
+                                                     self.filter_settings,
+                                                     demod_freqs,
+                                                     self._integrate_samples and
+                                                     self._integrate_iq)
         else:
-            len_records = records_per_buffer
-
-        num_demods = self.demod_freqs.get_num_demods()
-        if num_demods:
-            mat_shape = (num_demods, len_buffers,
-                         len_records, self.samples_per_record.get())
-            self.mat_shape = mat_shape
-            integer_list = np.arange(samples_per_record)
-            integer_mat = (np.outer(np.ones(len_buffers),
-                                    np.outer(np.ones(len_records), integer_list)))
-            angle_mat = 2 * np.pi * \
-                np.outer(demod_freqs, integer_mat).reshape(mat_shape)  / sample_rate
-            self.cos_mat = np.cos(angle_mat)
-            self.sin_mat = np.sin(angle_mat)
+            self.demodulator = None
+        self._int_delay = self.int_delay.get()
+        self._int_time = self.int_time.get()
+        beginning = int(self._int_delay * sample_rate)
+        self._integration_window = slice(
+            beginning, beginning + int(self._int_time * sample_rate))
 
     def pre_acquire(self):
-        pass
+        self._timings.mark()
 
-    def handle_buffer(self, data, i=None):
+    def handle_buffer(self, data, buffernum=0):
         """
-        Adds data from Alazar to buffer (effectively averaging)
-
+        Adds data from Alazar to buffer, either averaging or storing the
+        buffer depending on average_buffers.
         """
-        self.buffer += data
+        timings = self._timings
+        timings.lap('dma_wait')
+        with timings.stage('handle_buffer', data.nbytes):
+            if self._average_buffers:
+                self.buffer += data
+            else:
+                self.buffer[buffernum] = data.reshape(self.buffer.shape[1:])
+        timings.mark()
 
     def post_acquire(self):
         """
         Processes the data according to ATS9360 settings, splitting into
-        records and averaging over them, then applying demodulation fit
-        nb: currently only channel A. Depending on the value of integrate_samples
-        it may either sum over all samples or return arrays of individual samples
+        records and averaging over them, then applying demodulation fit.
+        Depending on the value of integrate_samples it may either
+        integrate over the samples or return arrays of individual samples
         for all the data given below.
 
         Returns:
@@ -339,129 +466,118 @@ class ATS9360Controller(AcquisitionController):
             - For each demodulation frequency:
                 * magnitude
                 * phase
+            followed by the same for channel B if chan_b is set
+        """
+        timings = self._timings
+        timings.lap('dma_wait')
+        with timings.stage('post_acquire'):
+            unpacked = self._process_acquisition(timings)
+        for output in unpacked:
+            timings.allocated('output', output.nbytes)
+        store_timings(self, timings)
+        return tuple(unpacked)
+
+    def _process_acquisition(self, timings) -> List[np.ndarray]:
+        """
+        Processes the summed buffer or, if buffers are not averaged, the
+        stored buffers in chunks, see post_acquire.
+        """
+        if self._average_buffers:
+            outputs = self._process_buffers(self.buffer, 1, timings)
+        else:
+            bytes_per_buffer = self.buffer[0].nbytes
+            chunk = max(1, self.processing_chunk_bytes // bytes_per_buffer)
+            outputs = None
+            for start in range(0, self._buffers_per_acquisition, chunk):
+                stop = min(start + chunk, self._buffers_per_acquisition)
+                chunk_outputs = self._process_buffers(self.buffer[start:stop],
+                                                      stop - start, timings)
+                if outputs is None:
+                    outputs = [np.empty((self._buffers_per_acquisition,) +
+                                        output.shape[1:], dtype=output.dtype)
+                               for output in chunk_outputs]
+                for output, chunk_output in zip(outputs, chunk_outputs):
+                    output[start:stop] = chunk_output
+        return [output.reshape(self._output_shape) for output in outputs]
+
+    def _process_buffers(self, data, number_of_buffers,
+                         timings) -> List[np.ndarray]:
         """
+        Splits one or more buffers into records and channels, converts
+        them to volts and demodulates them.
 
+        Returns:
+            list of the outputs of channel A followed by those of channel B
+            if chan_b is set. The first axis of the outputs is the buffer
+            axis.
+        """
         # for ATS9360 samples are arranged in the buffer as follows:
         # S00A, S00B, S01A, S01B...S10A, S10B, S11A, S11B...
         # where SXYZ is record X, sample Y, channel Z.
-
-        # break buffer up into records and averages over them
-        alazar = self._get_alazar()
-        samples_per_record = alazar.samples_per_record.get()
-        records_per_buffer = alazar.records_per_buffer.get()
-        buffers_per_acquisition = alazar.buffers_per_acquisition.get()
-        number_of_buffers = 1 # Hardcoded for now assuming all buffers go to the same array
-        reshaped_buf = self.buffer.reshape(number_of_buffers,
-                                           records_per_buffer,
-                                           samples_per_record,
-                                           self.number_of_channels)
-
-        channelAData = reshaped_buf[:, :, :, 0]
-        if self.acquisition._average_records:
-            recordA = np.uint16(np.mean(channelAData, axis=1, keepdims=True) /
-                                buffers_per_acquisition)
-        else:
-            recordA = np.uint16(channelAData/buffers_per_acquisition)
-
-        recordA = self._to_volts(recordA)
-
-        # do demodulation
-        if self.demod_freqs.get_num_demods():
-            magA, phaseA = self._fit(recordA)
-            if self._integrate_samples:
-                magA = np.mean(magA, axis=-1)
-                phaseA = np.mean(phaseA, axis=-1)
-
+        # If only one channel is acquired the buffer only contains
+        # the samples of that channel.
+        reshaped_buf = data.reshape(number_of_buffers,
+                                    self._records_per_buffer,
+                                    self._samples_per_record,
+                                    self.number_of_channels)
         unpacked = []
-        if self._integrate_samples:
-            unpacked.append(np.mean(recordA, axis=-1))
+        for position in self._positions:
+            channel_data = reshaped_buf[..., position]
+            with timings.stage('to_volts', channel_data.nbytes):
+                volt_rec = self._channel_to_volts(channel_data)
+            if self._integrate_samples:
+                unpacked.append(np.mean(volt_rec, axis=-1))
+            else:
+                unpacked.append(volt_rec)
+            if self.demodulator is not None:
+                with timings.stage('demodulate', volt_rec.nbytes):
+                    demodulated = self.demodulator.demodulate(volt_rec,
+                                                              self._int_delay,
+                                                              self._int_time)
+                with timings.stage('reduce', demodulated.nbytes):
+                    for demod in demodulated:
+                        unpacked += self._magnitude_and_phase(demod)
+        return unpacked
+
+    def _magnitude_and_phase(self, demod) -> List[np.ndarray]:
+        if self._integrate_samples and not self._integrate_iq:
+            # the demodulator returns the samples, average their magnitude
+            # and phase over the integration window
+            window = demod[..., self._integration_window]
+            return [np.mean(np.abs(window), axis=-1),
+                    np.mean(np.angle(window, deg=True), axis=-1)]
+        return [np.abs(demod), np.angle(demod, deg=True)]
+
+    def _channel_to_volts(self, channel_data):
+        """
+        Averages the raw data of one Alazar channel over records and
+        buffers as requested and converts it to volts.
+        """
+        # average by summing the raw integer samples and let the volts
+        # conversion divide by the number of averages
+        if self.acquisition._average_records:
+            record = np.sum(channel_data, axis=1, keepdims=True,
+                            dtype=np.int64)
+            count = self._records_per_buffer
         else:
-            unpacked.append(np.squeeze(recordA))
-
-        if self.demod_freqs.get_num_demods():
-            for i in range(magA.shape[0]):
-                unpacked.append(magA[i])
-                unpacked.append(phaseA[i])
-        # same for chan b
-        if self.chan_b:
-            raise NotImplementedError('chan b code not complete')
+            record = channel_data
+            count = 1
+        if self._average_buffers:
+            count *= self._buffers_per_acquisition
+        return self._to_volts(record, count)
 
-
-        return tuple(unpacked)
-
-    def _to_volts(self, record):
-        # convert rec to volts
+    def _to_volts(self, record, count=1):
+        """
+        Converts the sum of count raw records to the averaged record in
+        volts.
+        """
         bps = self.board_info['bits_per_sample']
         if bps == 12:
-            volt_rec = helpers.sample_to_volt_u12(record, bps, input_range_volts=0.4)
+            volt_rec = helpers.sum_to_volt_u12(record, count, bps,
+                                               input_range_volts=0.4)
         else:
             logging.warning('sample to volt conversion does not exist for'
                             ' bps != 12, centered raw samples returned')
-            volt_rec = record - np.mean(record)
+            volt_rec = record / count
+            volt_rec = volt_rec - np.mean(volt_rec)
         return volt_rec
-
-    def _fit(self, volt_rec):
-        """
-        Applies low bandpass filter and demodulation fit,
-        and integration limits to samples array
-
-        Args:
-            record (numpy array): record from alazar to be multiplied
-                                  with the software signal, filtered and limited
-                                  to ifantegration limits shape = (samples_taken, )
-
-        Returns:
-            magnitude (numpy array): shape = (demod_length, samples_after_limiting)
-            phase (numpy array): shape = (demod_length, samples_after_limiting)
-        """
-
-        # volt_rec to matrix and multiply with demodulation signal matrices
-        alazar = self._get_alazar()
-        sample_rate = alazar.get_sample_rate()
-        demod_length = self.demod_freqs.get_num_demods()
-        volt_rec_mat = np.outer(np.ones(demod_length), volt_rec).reshape(self.mat_shape)
-        re_mat = np.multiply(volt_rec_mat, self.cos_mat)
-        im_mat = np.multiply(volt_rec_mat, self.sin_mat)
-
-        # filter out higher freq component
-        cutoff = self.demod_freqs.get_max_demod_freq() / 10
-        if self.filter_settings['filter'] == 0:
-            re_filtered = filter_win(re_mat, cutoff,
-                                             sample_rate,
-                                             self.filter_settings['numtaps'],
-                                             axis=-1)
-            im_filtered = filter_win(im_mat, cutoff,
-                                             sample_rate,
-                                             self.filter_settings['numtaps'],
-                                             axis=-1)
-        elif self.filter_settings['filter'] == 1:
-            re_filtered = filter_ls(re_mat, cutoff,
-                                            sample_rate,
-                                            self.filter_settings['numtaps'],
-                                            axis=-1)
-            im_filtered = filter_ls(im_mat, cutoff,
-                                            sample_rate,
-                                            self.filter_settings['numtaps'],
-                                            axis=-1)
-        elif self.filter_settings['filter'] == 2:
-            re_filtered = re_mat
-            im_filtered = im_mat
-
-        if self._integrate_samples:
-            # apply integration limits
-            beginning = int(self.int_delay() * sample_rate)
-            end = beginning + int(self.int_time() * sample_rate)
-
-            re_limited = re_filtered[..., beginning:end]
-            im_limited = im_filtered[..., beginning:end]
-        else:
-            re_limited = re_filtered
-            im_limited = im_filtered
-
-        # convert to magnitude and phase
-        complex_mat = re_limited + im_limited * 1j
-        magnitude = abs(complex_mat)
-        phase = np.angle(complex_mat, deg=True)
-
-        return magnitude, phase
-
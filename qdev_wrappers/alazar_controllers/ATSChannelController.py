@@ -1,15 +1,31 @@
 import logging
-from typing import Union, Sequence, Tuple, List
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from functools import partial
+from typing import Union, Sequence, Tuple, List, Callable, Optional
 
 import numpy as np
 
 import qdev_wrappers.alazar_controllers.acq_helpers as helpers
 from qcodes import ChannelList
+from qcodes.loops import active_data_set
+from qcodes.utils import validators as vals
 from .alazar_channel import AlazarChannel
 from .alazar_multidim_parameters import AlazarMultiChannelParameter
 from qcodes.instrument_drivers.AlazarTech.ATS import AcquisitionController
 from .acquisition_parameters import AcqVariablesParam, NonSettableDerivedParameter
-from .demodulator import Demodulator
+from .acquisition_plan import AcquisitionPlan
+from .buffer_geometry import BufferTimingModel, BufferGeometry, \
+    optimize_buffer_geometry, optimal_allocated_buffers, \
+    expected_acquisition_time
+from .demodulator import Demodulator, demodulator_cache, decimation_factor
+from .discriminator import Discriminator
+from .running_statistics import RunningStatistics
+from .stage_timings import StageTimings, disabled_timings, store_timings
 
 logger = logging.getLogger(__name__)
 
@@ -26,28 +42,63 @@ class ATSChannelController(AcquisitionController):
         alazar_name: name of the alazar instrument such that this
             controller can communicate with the Alazar
         filter (default 'win'): filter to be used to filter out double freq
-            component ('win' - window, 'ls' - least squared, 'ave' - averaging)
+            component ('win' - hamming window, 'ls' - least squared,
+            'ave' - averaging, 'ham' - alias of 'win',
+            'poly' - decimating polyphase window,
+            'cic' - decimating cascaded integrator comb)
         numtaps (default 101): number of freq components used in filter
+        decimation (default 1): decimation factor of the decimating filters
+            'poly' and 'cic'. Non integrated demodulated traces are returned
+            at the sample rate divided by this factor.
+        cic_order (default 3): number of integrator/comb stages of the 'cic'
+            filter
         **kwargs: kwargs are forwarded to the Instrument base class
 
+    The data parameters of the channels acquire via a cached
+    AcquisitionPlan (see acquisition_plan) and can defer the processing to
+    a worker thread (see acquire_plan). The processing is configured by
+    the parameters of the controller, see their docstrings.
+
     TODO(nataliejpg) test filter options
     TODO(JHN) Use filtfit for better performance?
     TODO(JHN) Test demod+filtering and make it more modular
-    TODO(JHN) Option to not read channel b at all (Speedup)
     TODO(nataliejpg) what should be private?
     TODO(nataliejpg) where should filter_dict live?
     """
 
-    filter_dict = {'win': 0, 'ls': 1, 'ave': 2}
+    # 'ham' is an alias of 'win' as the window filter uses a hamming window
+    filter_dict = {'win': 0, 'ls': 1, 'ave': 2, 'ham': 0, 'poly': 4, 'cic': 5}
+
+    # approximate size of the raw data processed at once when processing
+    # non averaged buffers after the acquisition
+    processing_chunk_bytes = 64 * 1024**2
+
+    # number of compiled acquisition plans kept for reuse
+    acquisition_plan_cache_size = 4
+
+    # attributes set up by _prepare_processing which are stored in the
+    # acquisition plan
+    _plan_state = ('_acquired_channels', 'number_of_channels',
+                   '_samples_per_record', '_records_per_buffer',
+                   '_buffers_per_acquisition', '_summed_outputs',
+                   '_statistics_positions', '_output_dtype', '_streaming',
+                   'buffer', '_threads', 'demodulators',
+                   '_statistics_demodulators', '_int_delay', '_int_time')
 
     def __init__(self, name,
                  alazar_name: str,
                  filter: str = 'win',
                  numtaps: int =101,
+                 decimation: int = 1,
+                 cic_order: int = 3,
                  **kwargs) -> None:
         super().__init__(name, alazar_name, **kwargs)
         self.filter_settings = {'filter': self.filter_dict[filter],
-                                'numtaps': numtaps}
+                                'numtaps': numtaps,
+                                'decimation': decimation,
+                                'cic_order': cic_order}
+        # number of Alazar channels acquired, updated from the active
+        # channels before each acquisition
         self.number_of_channels = 2
 
         channels = ChannelList(self, "Channels", AlazarChannel,
@@ -65,6 +116,119 @@ class ATSChannelController(AcquisitionController):
         self.add_parameter(name='samples_per_record',
                            alternative='int_time and int_delay',
                            parameter_class=NonSettableDerivedParameter)
+        self.add_parameter(name='stream_buffers',
+                           label='stream buffers',
+                           docstring='Process each buffer in handle_buffer, '
+                                     'while the next buffer is filled, '
+                                     'rather than after the acquisition '
+                                     'and only keep the reduced output. '
+                                     'Only used if buffers are not '
+                                     'averaged.',
+                           initial_value=False,
+                           vals=vals.Bool(),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='processing_threads',
+                           label='processing threads',
+                           docstring='Number of threads used to process the '
+                                     'Alazar channels and groups of '
+                                     'demodulation frequencies '
+                                     'concurrently. NumPy and SciPy release '
+                                     'the GIL in the heavy kernels.',
+                           initial_value=1,
+                           vals=vals.Ints(min_value=1),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='output_precision',
+                           label='output precision',
+                           docstring='Floating point type used for the volts '
+                                     'conversion and the processed output. '
+                                     'Averages are summed as integers and '
+                                     'only the sums are converted.',
+                           initial_value='float64',
+                           vals=vals.Enum('float32', 'float64'),
+                           get_cmd=None, set_cmd=None)
+
+        self.add_parameter(name='raw_capture_dir',
+                           label='raw capture dir',
+                           docstring="Directory for the raw capture files "
+                                     "of channels with raw_capture 'memmap' "
+                                     "when no qcodes dataset is active. "
+                                     "Defaults to the temporary directory.",
+                           initial_value=None,
+                           vals=vals.MultiType(vals.Strings(), vals.Enum(None)),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='raw_capture_file',
+                           label='raw capture file',
+                           alternative='raw_capture of the channels',
+                           parameter_class=NonSettableDerivedParameter)
+
+        self.add_parameter(name='histogram_bins',
+                           label='histogram bins',
+                           docstring='Number of bins per axis of the IQ '
+                                     'histograms of the buffer statistics, '
+                                     'None for no histograms.',
+                           initial_value=None,
+                           vals=vals.MultiType(vals.Ints(min_value=1),
+                                               vals.Enum(None)),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='histogram_range',
+                           label='histogram range',
+                           unit='V',
+                           docstring='The IQ histograms span -range to '
+                                     'range on both axes.',
+                           initial_value=0.4,
+                           vals=vals.Numbers(min_value=0),
+                           get_cmd=None, set_cmd=None)
+
+        self.add_parameter(name='buffer_geometry',
+                           label='buffer geometry',
+                           docstring="'fixed' allocates 4 buffers (1 for a "
+                                     "single buffer), 'optimized' picks the "
+                                     "buffer geometry from "
+                                     "buffer_timing_model, see "
+                                     "optimize_buffer_geometry.",
+                           initial_value='fixed',
+                           vals=vals.Enum('fixed', 'optimized'),
+                           get_cmd=None, set_cmd=None)
+
+        self.add_parameter(name='profile_stages',
+                           label='profile stages',
+                           docstring='Record the wall time, calls and bytes '
+                                     'of each stage of the acquisition and '
+                                     'the arrays allocated for it in '
+                                     'timings. Stages are not timed at all '
+                                     'when off.',
+                           initial_value=False,
+                           vals=vals.Bool(),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='timings_to_metadata',
+                           label='timings to metadata',
+                           docstring='Sum up the timings of the '
+                                     'acquisitions in the metadata of the '
+                                     'active dataset. Only used if '
+                                     'profile_stages is set.',
+                           initial_value=False,
+                           vals=vals.Bool(),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='timings',
+                           label='timings',
+                           alternative='profile_stages',
+                           parameter_class=NonSettableDerivedParameter)
+
+        self._executor = None
+        self._executor_threads = 0
+        self._volts_buffers = {}
+        self._statistics = {}
+        self._statistics_demodulators = {}
+        self._acquisition_plans = OrderedDict()
+        self._plan = None
+        self._deferred = False
+        self._pipeline_executor = None
+        self._pending = None
+        self._pending_plan = None
+        self._timings = disabled_timings
+        self.buffer_timing_model = BufferTimingModel()
+        self._raw_capture_data_set = None
+        self._raw_capture_files = []
 
         self.samples_divisor = self._get_alazar().samples_divisor
 
@@ -139,7 +303,7 @@ class ATSChannelController(AcquisitionController):
                                                                                   value))
         alazar = self._get_alazar()
         sample_rate = alazar.get_sample_rate()
-        samples_delay_min = (self.filter_settings['numtaps'] - 1)
+        samples_delay_min = self._filter_delay_samples()
         int_delay_min = samples_delay_min / sample_rate
         if value < int_delay_min:
             logger.warning(
@@ -158,9 +322,19 @@ class ATSChannelController(AcquisitionController):
         """
         alazar = self._get_alazar()
         sample_rate = alazar.get_sample_rate()
-        samp_delay = self.filter_settings['numtaps'] - 1
+        samp_delay = self._filter_delay_samples()
         return samp_delay / sample_rate
 
+    def _filter_delay_samples(self) -> int:
+        """
+        Number of samples it takes for the filter to settle, i.e. the
+        length of its impulse response minus one.
+        """
+        if self.filter_settings['filter'] == self.filter_dict['cic']:
+            return (self.filter_settings['cic_order'] *
+                    (self.filter_settings['decimation'] - 1))
+        return self.filter_settings['numtaps'] - 1
+
     def _int_time_default(self) -> float:
         """
         Function to generate default int_time value
@@ -181,22 +355,196 @@ class ATSChannelController(AcquisitionController):
                       (self.int_delay() or 0))
         return total_time
 
-    def update_filter_settings(self, filter: str, numtaps: int):
+    def update_filter_settings(self, filter: str, numtaps: int,
+                               decimation: int = None,
+                               cic_order: int = None):
         """
         Updates the settings of the filter for filtering out
         double frequency component for demodulation.
 
         Args:
-            filter: filter type ('win' or 'ls')
+            filter: filter type (one of the keys of filter_dict)
             numtaps: numtaps for filter
+            decimation: decimation factor for the decimating filters
+                ('poly' and 'cic'), unchanged if None
+            cic_order: number of stages of the 'cic' filter, unchanged
+                if None
         """
         self.filter_settings.update({'filter': self.filter_dict[filter],
                                      'numtaps': numtaps})
+        if decimation is not None:
+            if decimation < 1:
+                raise ValueError('decimation must be a positive integer')
+            self.filter_settings['decimation'] = decimation
+        if cic_order is not None:
+            self.filter_settings['cic_order'] = cic_order
+
+    def demod_decimation(self) -> int:
+        """
+        Factor by which non integrated demodulated traces are decimated
+        by the current filter.
+        """
+        return decimation_factor(self.filter_settings)
+
+    def active_alazar_channels(self) -> List[int]:
+        """
+        Numbers of the Alazar channels (0 for A, 1 for B) which are used
+        by the active channels.
+        """
+        return [channel_number for channel_number, channel_info
+                in enumerate(self.active_channels_nested)
+                if channel_info['nsignals'] > 0]
+
+    def channel_selection(self) -> str:
+        """
+        Value of the Alazar channel_selection ('A', 'B' or 'AB') which
+        acquires exactly the Alazar channels used by the active channels.
+        """
+        return ''.join('AB'[channel_number] for channel_number
+                       in self.active_alazar_channels())
+
+    def optimize_buffer_geometry(self, num_averages: int) -> BufferGeometry:
+        """
+        The buffer geometry with the shortest expected acquisition time for
+        averaging num_averages records over records and buffers, see
+        buffer_geometry.optimize_buffer_geometry. The timing model can be
+        fitted to profiled acquisitions with BufferTimingModel.from_timings.
+        """
+        alazar = self._get_alazar()
+        return optimize_buffer_geometry(self.buffer_timing_model,
+                                        num_averages,
+                                        self.samples_per_record.get(),
+                                        alazar.get_sample_rate(),
+                                        self.board_info['max_samples'],
+                                        self.number_of_channels)
+
+    def allocated_buffers(self, records_per_buffer: int,
+                          buffers_per_acquisition: int,
+                          number_of_channels: int) -> int:
+        """
+        Number of buffers to allocate for an acquisition, following the
+        'buffer_geometry' parameter.
+        """
+        if self.buffer_geometry.get() == 'fixed':
+            return 4 if buffers_per_acquisition > 1 else 1
+        return optimal_allocated_buffers(self.buffer_timing_model,
+                                         records_per_buffer,
+                                         buffers_per_acquisition,
+                                         self.samples_per_record.get(),
+                                         self._get_alazar().get_sample_rate(),
+                                         number_of_channels)
+
+    def expected_acquisition_time(self, records_per_buffer: int,
+                                  buffers_per_acquisition: int,
+                                  allocated_buffers: int,
+                                  number_of_channels: int,
+                                  average_buffers: bool=True) -> float:
+        """
+        Expected duration of an acquisition according to the timing model,
+        see buffer_geometry.expected_acquisition_time.
+        """
+        return expected_acquisition_time(self.buffer_timing_model,
+                                         records_per_buffer,
+                                         buffers_per_acquisition,
+                                         allocated_buffers,
+                                         self.samples_per_record.get(),
+                                         self._get_alazar().get_sample_rate(),
+                                         number_of_channels,
+                                         average_buffers)
+
+    def acquisition_plan(self,
+                         channels: Sequence[AlazarChannel]) -> AcquisitionPlan:
+        """
+        The compiled acquisition plan of the channels. Plans are cached and
+        reused as long as the parameters of the channels, the controller
+        and the Alazar are unchanged.
+        """
+        key = tuple(channels)
+        signature = AcquisitionPlan.configuration_signature(self, channels)
+        plan = self._acquisition_plans.pop(key, None)
+        if plan is None or plan.signature != signature:
+            plan = AcquisitionPlan(self, channels, signature)
+        self._acquisition_plans[key] = plan
+        while len(self._acquisition_plans) > self.acquisition_plan_cache_size:
+            self._acquisition_plans.popitem(last=False)
+        return plan
+
+    def clear_acquisition_plans(self) -> None:
+        """
+        Drops all cached acquisition plans and the buffers they hold.
+        """
+        self._acquisition_plans.clear()
+        self._volts_buffers.clear()
+
+    def acquire_plan(self, plan: AcquisitionPlan, deferred: bool=False):
+        """
+        Acquires and processes the data of an acquisition plan.
+
+        If deferred the data is processed in a worker thread and a future
+        of the data is returned as soon as the acquisition is done, so the
+        next acquisition (of the same plan) can be set up and acquired
+        while the data is processed. Deferred acquisitions are processed
+        one at a time in order.
+        """
+        # the worker shares the prepared state which is only the same
+        # for acquisitions of the same plan
+        if not deferred or plan is not self._pending_plan:
+            self._wait_for_pending()
+        self.shape_info = plan.shape_info
+        self.active_channels_nested = plan.active_channels_nested
+        self._plan = plan
+        self._deferred = deferred
+        logger.info("calling acquire with {}".format(plan.acquire_kwargs))
+        try:
+            return self._get_alazar().acquire(acquisition_controller=self,
+                                              **plan.acquire_kwargs)
+        finally:
+            self._plan = None
+            self._deferred = False
 
     def pre_start_capture(self) -> None:
         """
         Called before capture start to update Acquisition Controller with
         Alazar acquisition params and set up software wave for demodulation.
+
+        The prepared state is stored in the acquisition plan being acquired
+        and restored directly when the plan is acquired again.
+        """
+        plan = self._plan
+        if plan is None:
+            self._wait_for_pending()
+        if self.profile_stages.get():
+            self._timings = StageTimings()
+        else:
+            self._timings = disabled_timings
+        timings = self._timings
+        with timings.stage('setup'):
+            if plan is None or plan.controller_state is None:
+                self._prepare_processing()
+                if plan is not None:
+                    plan.controller_state = {name: getattr(self, name)
+                                             for name in self._plan_state}
+            else:
+                for name, value in plan.controller_state.items():
+                    setattr(self, name, value)
+            self._stream_output = None
+            self._statistics = {}
+            if self.shape_info['average_buffers']:
+                self.buffer.fill(0)
+            elif self.shape_info.get('raw_capture', False):
+                self.buffer = np.lib.format.open_memmap(
+                    self._new_raw_capture_file(), mode='w+', dtype=np.uint16,
+                    shape=(self._buffers_per_acquisition,
+                           self._records_per_buffer,
+                           self._samples_per_record, self.number_of_channels))
+        if self.buffer is not None:
+            timings.allocated('buffer', self.buffer.nbytes)
+
+    def _prepare_processing(self) -> None:
+        """
+        Checks the Alazar settings against the active channels and sets up
+        the buffers and demodulators. Only the Alazar channels used by the
+        active channels are acquired.
         """
         alazar = self._get_alazar()
         acq_s_p_r = self.samples_per_record.get()
@@ -206,6 +554,17 @@ class ATSChannelController(AcquisitionController):
             raise Exception('acq controller samples per record {} does not match'
                             ' instrument value {}, most likely need '
                             'to set and check int_time and int_delay'.format(acq_s_p_r, inst_s_p_r))
+        # the layout of the buffers follows the channels actually acquired
+        acquired_channels = alazar.channel_selection.get()
+        for channel_number in self.active_alazar_channels():
+            if 'AB'[channel_number] not in acquired_channels:
+                raise Exception('channel {} is used but instrument channel '
+                                'selection is {}, most likely need to acquire '
+                                'with channel_selection={}'.format(
+                                    'AB'[channel_number], acquired_channels,
+                                    self.channel_selection()))
+        self._acquired_channels = acquired_channels
+        self.number_of_channels = len(acquired_channels)
 
         samples_per_record = inst_s_p_r
         records_per_buffer = alazar.records_per_buffer.get()
@@ -217,48 +576,117 @@ class ATSChannelController(AcquisitionController):
                                " supported is {}".format(samples_per_buffer, max_samples))
 
 
+        self._samples_per_record = samples_per_record
+        self._records_per_buffer = records_per_buffer
+        self._buffers_per_acquisition = buffers_per_acquisition
+        if (self.shape_info.get('raw_capture', False) and
+                self.shape_info['average_buffers']):
+            raise RuntimeError('Raw capture requires that buffers are not '
+                               'averaged')
+        self._summed_outputs = self._population_outputs()
+        self._statistics_positions = self._statistics_outputs()
+        self._output_dtype = np.dtype(self.output_precision.get())
+        self._streaming = (self.stream_buffers.get() and
+                           not self.shape_info['average_buffers'])
+
         # We currently enforce the shape to be identical for all channels
         # so it's safe to take the first
         if self.shape_info['average_buffers']:
+            # running integer sum of the raw samples
             self.buffer = np.zeros(samples_per_record *
                                    records_per_buffer *
-                                   self.number_of_channels)
+                                   self.number_of_channels,
+                                   dtype=np.int64)
+        elif self._streaming or self.shape_info.get('raw_capture', False):
+            # the reduced output is allocated when the first buffer
+            # has been processed, a raw capture file is opened for each
+            # acquisition
+            self.buffer = None
         else:
             self.buffer = np.zeros((buffers_per_acquisition,
-                                   samples_per_record *
-                                   records_per_buffer *
-                                   self.number_of_channels))
+                                    records_per_buffer,
+                                    samples_per_record,
+                                    self.number_of_channels),
+                                   dtype=np.uint16)
+        # each channel gets a list of (demod indices, demodulator) with one
+        # group of demodulation frequencies per processing thread
+        self._threads = self.processing_threads.get()
         self.demodulators = []
-
         for channel in self.active_channels_nested:
+            groups = []
             if channel['ndemods'] > 0:
-                self.demodulators.append(Demodulator(buffers_per_acquisition,
-                                                     records_per_buffer,
-                                                     samples_per_record,
-                                                     sample_rate,
-                                                     self.filter_settings,
-                                                     channel['demod_freqs'],
-                                                     self.shape_info['average_buffers'],
-                                                     self.shape_info['average_records'],
-                                                     self.shape_info['integrate_samples']
-                                                     ))
-            else:
-                self.demodulators.append(None)
+                # all groups filter with the cutoff of the full set
+                cutoff = max(channel['demod_freqs']) / 10
+                ngroups = min(self._threads, channel['ndemods'])
+                for indices in np.array_split(np.arange(channel['ndemods']),
+                                              ngroups):
+                    indices = indices.tolist()
+                    groups.append((indices, demodulator_cache.get(
+                        samples_per_record,
+                        sample_rate,
+                        self.filter_settings,
+                        [channel['demod_freqs'][i] for i in indices],
+                        self.shape_info['integrate_samples'],
+                        cutoff)))
+            self.demodulators.append(groups)
+
+        # frequencies, integration weights and demodulator of the
+        # frequencies with running statistics over the buffers, keyed by
+        # Alazar channel
+        self._statistics_demodulators = {}
+        self._int_delay = self.int_delay.get()
+        self._int_time = self.int_time.get()
+        output_demod_types = self._output_demod_types()
+        for i in self._statistics_positions:
+            channel_number, index, _ = output_demod_types[i]
+            channel = self.active_channels_nested[channel_number]
+            freqs, weights = self._statistics_demodulators.setdefault(
+                channel_number, ([], []))
+            if channel['demod_freqs'][index] not in freqs:
+                freqs.append(channel['demod_freqs'][index])
+                weights.append(channel['integration_weights'][index])
+        for channel_number, (freqs, weights) in \
+                self._statistics_demodulators.items():
+            channel = self.active_channels_nested[channel_number]
+            self._statistics_demodulators[channel_number] = (
+                freqs, weights, demodulator_cache.get(
+                    samples_per_record,
+                    sample_rate,
+                    self.filter_settings,
+                    freqs,
+                    self.shape_info['integrate_samples'],
+                    max(channel['demod_freqs']) / 10))
 
     def pre_acquire(self):
-        pass
+        self._timings.mark()
 
     def handle_buffer(self, data: np.ndarray, buffernum: int=0):
         """
         Adds data from Alazar to buffer either averaging or appending
-        depending on output type.
+        depending on output type. When streaming the buffer is processed
+        straight away and only the reduced output is stored.
         """
-        if self.shape_info['average_buffers']:
-            self.buffer += data
-        else:
-            self.buffer[buffernum] = data
+        timings = self._timings
+        timings.lap('dma_wait')
+        with timings.stage('handle_buffer', data.nbytes):
+            if self.shape_info['average_buffers']:
+                self.buffer += data
+                if self._statistics_demodulators:
+                    self._update_statistics(data)
+            else:
+                if self.buffer is not None:
+                    self.buffer[buffernum] = data.reshape(
+                        self.buffer.shape[1:])
+                if self._streaming:
+                    self._stream_output = self._store_output(
+                        self._stream_output,
+                        self._process_buffers(data, number_of_buffers=1,
+                                              timings=timings),
+                        buffernum)
+        timings.mark()
 
-    def post_acquire(self) -> Union[np.ndarray, Tuple[np.ndarray, ...]]:
+    def post_acquire(self) -> Union[np.ndarray, Tuple[np.ndarray, ...],
+                                    Future]:
         """
         Processes the data according to ATS9360 settings, splitting into
         records and optionally averaging over them, then applying demodulation fit
@@ -267,106 +695,475 @@ class ATSChannelController(AcquisitionController):
         for all the data given below. It may return either raw data or demodulated magnitude
         or phase.
 
+        Non averaged buffers are processed in chunks of buffers.
+
+        For a deferred acquisition (see acquire_plan) the processing is
+        submitted to a worker thread and a future of the data is returned.
         """
+        timings = self._timings
+        timings.lap('dma_wait')
+        buffer = self.buffer
+        if isinstance(buffer, np.memmap):
+            buffer.flush()
+            self._register_raw_capture_file(buffer.filename)
+            self.buffer = None
+        if not self._deferred:
+            return self._process_acquisition(buffer, self._stream_output,
+                                             self._statistics, timings)
+        # only one acquisition is processed at a time so the plan can
+        # alternate between two buffers
+        self._wait_for_pending()
+        plan = self._plan
+        if buffer is not None and buffer is plan.controller_state['buffer']:
+            spare = plan.spare_buffer
+            if spare is None:
+                spare = np.empty_like(buffer)
+            plan.controller_state['buffer'] = spare
+            plan.spare_buffer = buffer
+        if self._pipeline_executor is None:
+            self._pipeline_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = self._pipeline_executor.submit(
+            self._process_acquisition, buffer, self._stream_output,
+            self._statistics, timings)
+        self._pending_plan = plan
+        return self._pending
 
-        # for ATS9360 samples are arranged in the buffer as follows:
-        # S00A, S00B, S01A, S01B...S10A, S10B, S11A, S11B...
-        # where SXYZ is record X, sample Y, channel Z.
+    def _process_acquisition(self, buffer: Optional[np.ndarray],
+                             stream_output: Optional[List[np.ndarray]],
+                             statistics: dict,
+                             timings: StageTimings=disabled_timings
+                             ) -> Union[np.ndarray, Tuple[np.ndarray, ...]]:
+        """
+        Processes the buffer (and/or the output of the streamed buffers and
+        the running statistics) of an acquisition into the output data.
+        The timings of the acquisition are stored when the processing is
+        done.
+        """
+        with timings.stage('post_acquire'):
+            outputdata = self._reduce_acquisition(buffer, stream_output,
+                                                  statistics, timings)
+        for output in outputdata:
+            timings.allocated('output', output.nbytes)
+        store_timings(self, timings)
+        if len(outputdata) == 1:
+            return outputdata[0]
+        else:
+            return tuple(outputdata)
 
-        # break buffer up into records and averages over them
-        alazar = self._get_alazar()
-        samples_per_record = alazar.samples_per_record.get()
-        records_per_buffer = alazar.records_per_buffer.get()
-        buffers_per_acquisition = alazar.buffers_per_acquisition.get()
+    def _reduce_acquisition(self, buffer: Optional[np.ndarray],
+                            stream_output: Optional[List[np.ndarray]],
+                            statistics: dict,
+                            timings: StageTimings) -> List[np.ndarray]:
         if self.shape_info['average_buffers']:
-            number_of_buffers = 1
+            outputs = self._process_buffers(buffer, number_of_buffers=1,
+                                            timings=timings)
+            output_demod_types = self._output_demod_types()
+            for i in self._statistics_positions:
+                channel_number, index, demod_type = output_demod_types[i]
+                freq = self.active_channels_nested[channel_number][
+                    'demod_freqs'][index]
+                channel_statistics = statistics[(channel_number, freq)]
+                if demod_type == 'std':
+                    output = channel_statistics.std
+                else:
+                    output = channel_statistics.snr
+                outputs[i] = output[np.newaxis].astype(self._output_dtype)
         else:
-            number_of_buffers = buffers_per_acquisition
-        reshaped_buf = self.buffer.reshape(number_of_buffers,
-                                           records_per_buffer,
-                                           samples_per_record,
-                                           self.number_of_channels)
-        channelAData = reshaped_buf[..., 0]
-        channelBData = reshaped_buf[..., 1]
-
-        def handle_alazar_channel(channelData,
-                                  channel_number: int,
-                                  raw: bool,
-                                  settings: dict,
-                                  demod_freqs: Sequence[float],
-                                  demod_types: Sequence[str]) -> List[np.ndarray]:
-            # TODO(JHN) could probably get better precision
-            # if we avoid casting back to uint16 after taking the average.
-            # either change the conversion to something that supports floats
-            # or
-            if settings['average_records'] and settings['average_buffers']:
-                recordA = np.uint16(np.mean(channelData, axis=1, keepdims=True) /
-                                    buffers_per_acquisition)
-            elif settings['average_records']:
-                recordA = np.uint16(np.mean(channelData, axis=1, keepdims=True))
-            elif settings['average_buffers']:
-                recordA = np.uint16(channelData/buffers_per_acquisition)
+            outputs = stream_output
+            if not self._streaming:
+                bytes_per_buffer = buffer[0].nbytes
+                chunk = max(1, self.processing_chunk_bytes // bytes_per_buffer)
+                for start in range(0, self._buffers_per_acquisition, chunk):
+                    stop = min(start + chunk, self._buffers_per_acquisition)
+                    outputs = self._store_output(
+                        outputs,
+                        self._process_buffers(buffer[start:stop],
+                                              stop - start, timings),
+                        start)
+            # populations are accumulated as counts over all buffers
+            for i in self._summed_outputs:
+                outputs[i] = outputs[i] / self._buffers_per_acquisition
+
+        return [self._squeeze_averaged(output, i)
+                for i, output in enumerate(outputs)]
+
+    def _squeeze_averaged(self, output: np.ndarray,
+                          position: int) -> np.ndarray:
+        """
+        Removes the averaged buffer and record axes of the output at
+        position. Other axes are kept even if they have length one, e.g.
+        the records of a single record per buffer.
+        """
+        axes = []
+        if (self.shape_info['average_buffers'] or
+                position in self._summed_outputs):
+            axes.append(0)
+        if self.shape_info['average_records']:
+            axes.append(1)
+        return np.squeeze(output, axis=tuple(axes))
+
+    def _wait_for_pending(self) -> None:
+        """
+        Waits until the processing of a deferred acquisition is done.
+        Errors are raised by the future of the acquisition.
+        """
+        if self._pending is not None:
+            wait([self._pending])
+            self._pending = None
+            self._pending_plan = None
+
+    def _store_output(self, stored_outputs: Optional[List[np.ndarray]],
+                      outputs: List[np.ndarray],
+                      start: int) -> List[np.ndarray]:
+        """
+        Stores the processed outputs of the buffers starting at buffer
+        number start in the full output arrays, which are allocated when
+        the first outputs are stored.
+        """
+        if stored_outputs is None:
+            stored_outputs = [
+                np.zeros_like(output) if i in self._summed_outputs else
+                np.empty((self._buffers_per_acquisition,) +
+                         output.shape[1:], dtype=output.dtype)
+                for i, output in enumerate(outputs)]
+        for i, (stored, output) in enumerate(zip(stored_outputs, outputs)):
+            if i in self._summed_outputs:
+                stored += output
             else:
-                recordA = np.uint16(channelData)
-            recordA = self._to_volts(recordA)
+                stored[start:start + len(output)] = output
+        return stored_outputs
 
-            data = []
-            if raw:
-                if settings['integrate_samples']:
-                    data.append(np.squeeze(np.mean(recordA, axis=-1)))
-                else:
-                    data.append(np.squeeze(recordA))
-            # do demodulation
-            if demod_freqs:
-                re_limited, im_limited = self.demodulators[channel_number].demodulate(recordA, self.int_delay(), self.int_time())
-                for i, demodtype in enumerate(demod_types):
-                    Real_data = np.squeeze(re_limited[i])
-                    Imag_data = np.squeeze(im_limited[i])
-                    if settings['integrate_samples']:
-                        Real_data = np.mean(Real_data, axis=-1)
-                        Imag_data = np.mean(Imag_data, axis=-1)
-                    if demodtype=='magnitude':
-                        mydata = abs(Real_data+1j*Imag_data)
-                    elif demodtype == 'phase':
-                        mydata = np.angle(Real_data+1j*Imag_data, deg=True)
-                    elif demodtype == 'real':
-                        mydata = Real_data
-                    elif demodtype == 'imag':
-                        mydata = Imag_data
-                    else:
-                        raise RuntimeError(f"Unknown demodulator type {demodtype} supplied")
-                    data.append(mydata)
-            return data
-
-        if self.active_channels_nested[0]['nsignals']>0:
-            outputdataA = handle_alazar_channel(channelAData, 0, self.active_channels_nested[0]['raw'],
-                                                self.shape_info,
-                                                self.active_channels_nested[0]['demod_freqs'],
-                                                self.active_channels_nested[0]['demod_types'])
-        else:
-            outputdataA = []
-        if self.active_channels_nested[1]['nsignals'] > 0:
-            outputdataB = handle_alazar_channel(channelBData, 1, self.active_channels_nested[1]['raw'],
-                                                self.shape_info,
-                                                self.active_channels_nested[1]['demod_freqs'],
-                                                self.active_channels_nested[1]['demod_types'])
+    def _population_outputs(self) -> List[int]:
+        """
+        Positions of the outputs with demod type 'populations'. These are
+        reduced over the buffers so the counts of all buffers are summed
+        rather than stored per buffer.
+        """
+        positions = [i for i, (_, _, demod_type)
+                     in enumerate(self._output_demod_types())
+                     if demod_type == 'populations']
+        if positions:
+            settings = self.shape_info
+            if (settings['average_buffers'] or settings['average_records'] or
+                    not settings['integrate_samples']):
+                raise RuntimeError("Demod type 'populations' requires "
+                                   "integrated samples of records that are "
+                                   "not averaged")
+            for channel_info in self.active_channels_nested:
+                for demod_type, discriminator in zip(
+                        channel_info['demod_types'],
+                        channel_info['discriminators']):
+                    if demod_type == 'populations' and discriminator is None:
+                        raise RuntimeError("Demod type 'populations' requires "
+                                           "a discriminator, see "
+                                           "AlazarChannel.set_discriminator")
+        return positions
+
+    def _statistics_outputs(self) -> List[int]:
+        """
+        Positions of the outputs with demod type 'std' or 'snr'. These are
+        taken from the running statistics of the buffers.
+        """
+        positions = [i for i, (_, _, demod_type)
+                     in enumerate(self._output_demod_types())
+                     if demod_type in ('std', 'snr')]
+        if positions and not self.shape_info['average_buffers']:
+            raise RuntimeError("Demod types 'std' and 'snr' require that "
+                               "buffers are averaged")
+        return positions
+
+    def _output_demod_types(self) -> List[Tuple[int, Optional[int],
+                                                Optional[str]]]:
+        """
+        Alazar channel, demodulation index and demod type of each output in
+        the order of the outputs. Raw outputs have no demodulation index
+        and demod type.
+        """
+        outputs = []
+        for channel_number in self.active_alazar_channels():
+            channel_info = self.active_channels_nested[channel_number]
+            if channel_info['raw']:
+                outputs.append((channel_number, None, None))
+            outputs += [(channel_number, index, demod_type) for index, demod_type
+                        in enumerate(channel_info['demod_types'])]
+        return [outputs[i] for i in self.shape_info['output_order']]
+
+    def buffer_statistics(self, channel: AlazarChannel) -> RunningStatistics:
+        """
+        Running statistics over the buffers of the demodulated signal of a
+        channel with demod type 'std' or 'snr' in the last acquisition.
+        The statistics are accumulated while the buffers are summed and
+        include IQ histograms if histogram_bins is set.
+        """
+        key = (channel.alazar_channel.raw_value, channel.demod_freq.get())
+        if key not in self._statistics:
+            raise KeyError('No buffer statistics of channel {} in the last '
+                           'acquisition'.format(channel.short_name))
+        return self._statistics[key]
+
+    def _update_statistics(self, data: np.ndarray) -> None:
+        """
+        Demodulates a single buffer and adds it to the running statistics.
+        """
+        reshaped_buf = data.reshape(1,
+                                    self._records_per_buffer,
+                                    self._samples_per_record,
+                                    self.number_of_channels)
+        for channel_number, (freqs, weights, demodulator) in \
+                self._statistics_demodulators.items():
+            position = self._acquired_channels.index('AB'[channel_number])
+            volt_rec = self._channel_to_volts(reshaped_buf[..., position],
+                                              buffer_sum=False)
+            demodulated = demodulator.demodulate(volt_rec, self._int_delay,
+                                                 self._int_time, weights)
+            for freq, signal in zip(freqs, demodulated):
+                key = (channel_number, freq)
+                if key not in self._statistics:
+                    histogram_range = self.histogram_range.get()
+                    self._statistics[key] = RunningStatistics(
+                        signal.shape[1:], complex_data=True,
+                        histogram_bins=self.histogram_bins.get(),
+                        histogram_range=(-histogram_range, histogram_range))
+                self._statistics[key].update(signal)
+
+    def _new_raw_capture_file(self) -> str:
+        """
+        Path of a new raw capture file in the folder of the active dataset
+        or if there is none in raw_capture_dir. The file holds the raw
+        buffers as an array of shape (buffers, records, samples, channels)
+        and is referenced in the metadata of the dataset.
+        """
+        data_set = active_data_set()
+        if data_set is not None:
+            if data_set is not self._raw_capture_data_set:
+                self._raw_capture_data_set = data_set
+                self._raw_capture_files = []
+            directory = data_set.io.to_path(data_set.location)
+            filename = '{}_raw_{:05d}.npy'.format(self.name,
+                                                  len(self._raw_capture_files))
         else:
-            outputdataB = []
+            directory = self.raw_capture_dir() or tempfile.gettempdir()
+            filename = '{}_raw_{}_{:05d}.npy'.format(
+                self.name, time.strftime('%Y-%m-%d_%H-%M-%S'),
+                len(self._raw_capture_files))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def _register_raw_capture_file(self, filename: str) -> None:
+        """
+        Makes the raw capture file available via the raw_capture_file
+        parameter and references it in the metadata of the active dataset.
+        """
+        self.raw_capture_file._save_val(filename)
+        self._raw_capture_files.append(filename)
+        data_set = active_data_set()
+        if data_set is not None and data_set is self._raw_capture_data_set:
+            data_set.add_metadata({'alazar_raw_capture': {
+                self.name: {'files': list(self._raw_capture_files),
+                            'layout': ('buffers', 'records', 'samples',
+                                       'channels'),
+                            'channels': self._acquired_channels}}})
+
+    def _process_buffers(self, data: np.ndarray,
+                         number_of_buffers: int,
+                         timings: StageTimings=disabled_timings
+                         ) -> List[np.ndarray]:
+        """
+        Splits one or more buffers into records and channels and processes
+        each active Alazar channel.
+
+        Args:
+            data: raw buffer data containing number_of_buffers buffers
+            number_of_buffers: number of buffers contained in data
+            timings: timings of the acquisition
+
+        Returns:
+            list of processed arrays in the order given by
+            shape_info['output_order']. The arrays are not squeezed so the
+            first axis is always the buffer axis.
+        """
+        # for ATS9360 samples are arranged in the buffer as follows:
+        # S00A, S00B, S01A, S01B...S10A, S10B, S11A, S11B...
+        # where SXYZ is record X, sample Y, channel Z.
+        # If only one channel is acquired the buffer only contains
+        # the samples of that channel.
+
+        # break buffer up into records and averages over them
+        reshaped_buf = data.reshape(number_of_buffers,
+                                    self._records_per_buffer,
+                                    self._samples_per_record,
+                                    self.number_of_channels)
+        channel_numbers = self.active_alazar_channels()
+        positions = [self._acquired_channels.index('AB'[channel_number])
+                     for channel_number in channel_numbers]
+        # the volts are copied to the output arrays unless buffers are
+        # averaged, so the arrays can be reused by the next call from the
+        # same thread
+        reuse_volts = not self.shape_info['average_buffers']
+        caller = threading.get_ident()
+
+        def to_volts(position):
+            channel_data = reshaped_buf[..., position]
+            out = None
+            if reuse_volts:
+                out = self._volts_buffer((caller, position),
+                                         self._volts_shape(channel_data))
+            with timings.stage('to_volts', channel_data.nbytes):
+                return self._channel_to_volts(channel_data, out=out)
+        volt_recs = self._map(to_volts, positions)
+
+        # one task for the raw output and one per group of demodulation
+        # frequencies of each channel, in the order of the outputs
+        int_delay = self._int_delay
+        int_time = self._int_time
+        tasks = []
+        for channel_number, volt_rec in zip(channel_numbers, volt_recs):
+            channel_info = self.active_channels_nested[channel_number]
+            if channel_info['raw']:
+                tasks.append(partial(self._raw_output, volt_rec))
+            for indices, demodulator in self.demodulators[channel_number]:
+                demod_types = [channel_info['demod_types'][i] for i in indices]
+                discriminators = [channel_info['discriminators'][i]
+                                  for i in indices]
+                weights = [channel_info['integration_weights'][i]
+                           for i in indices]
+                tasks.append(partial(self._demodulated_output, volt_rec,
+                                     demodulator, demod_types,
+                                     int_delay, int_time, discriminators,
+                                     weights, timings))
+        outputdata = []
+        for task_output in self._map(lambda task: task(), tasks):
+            outputdata += task_output
         # ensure that data gets back in the same order
-        outputdata = outputdataA + outputdataB
-        outputdata = [outputdata[i] for i in self.shape_info['output_order']]
-        if len(outputdata) == 1:
-            return outputdata[0]
+        return [outputdata[i] for i in self.shape_info['output_order']]
+
+    def _map(self, function: Callable, items: Sequence) -> List:
+        """
+        Applies function to all items, concurrently if more than one
+        processing thread is used.
+        """
+        if self._threads <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        if self._executor is None or self._executor_threads != self._threads:
+            if self._executor is not None:
+                self._executor.shutdown()
+            self._executor = ThreadPoolExecutor(max_workers=self._threads)
+            self._executor_threads = self._threads
+        return list(self._executor.map(function, items))
+
+    def _volts_shape(self, channelData) -> Tuple[int, ...]:
+        if self.shape_info['average_records']:
+            return channelData.shape[:1] + (1,) + channelData.shape[2:]
+        return channelData.shape
+
+    def _volts_buffer(self, key: Tuple[int, int],
+                      shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Array for the volts of an Alazar channel which is reused as long as
+        the shape and precision are unchanged. key is the calling thread
+        and the position of the channel in the buffer so concurrent
+        processing never shares an array.
+        """
+        buffer = self._volts_buffers.get(key)
+        if (buffer is None or buffer.shape != shape or
+                buffer.dtype != self._output_dtype):
+            buffer = np.empty(shape, dtype=self._output_dtype)
+            self._volts_buffers[key] = buffer
+        return buffer
+
+    def _channel_to_volts(self, channelData,
+                          buffer_sum: bool=True,
+                          out: Optional[np.ndarray]=None) -> np.ndarray:
+        """
+        Averages the raw data of one Alazar channel as requested by
+        shape_info and converts it to volts. If buffer_sum is False the data
+        of a single buffer is converted even if buffers are averaged. The
+        volts are written to out if given.
+        """
+        settings = self.shape_info
+        # average by summing the raw integer samples and let the volts
+        # conversion divide by the number of averages
+        if settings['average_records']:
+            recordA = np.sum(channelData, axis=1, keepdims=True,
+                             dtype=np.int64)
+            count = self._records_per_buffer
         else:
-            return tuple(outputdata)
+            recordA = channelData
+            count = 1
+        if settings['average_buffers'] and buffer_sum:
+            count *= self._buffers_per_acquisition
+        return self._to_volts(recordA, count, out)
+
+    def _raw_output(self, volt_rec) -> List[np.ndarray]:
+        if self.shape_info['integrate_samples']:
+            return [np.mean(volt_rec, axis=-1)]
+        else:
+            return [volt_rec]
+
+    @staticmethod
+    def _demodulated_output(volt_rec, demodulator: Demodulator,
+                            demod_types: Sequence[str],
+                            int_delay: float,
+                            int_time: float,
+                            discriminators: Sequence[Optional[Discriminator]]=None,
+                            integration_weights: Sequence[Optional[np.ndarray]]=None,
+                            timings: StageTimings=disabled_timings
+                            ) -> List[np.ndarray]:
+        data = []
+        with timings.stage('demodulate', volt_rec.nbytes):
+            demodulated = demodulator.demodulate(volt_rec, int_delay, int_time,
+                                                 integration_weights)
+        with timings.stage('reduce', demodulated.nbytes):
+            for i, demodtype in enumerate(demod_types):
+                if demodtype=='magnitude':
+                    mydata = np.abs(demodulated[i])
+                elif demodtype == 'phase':
+                    mydata = np.angle(demodulated[i], deg=True)
+                elif demodtype == 'real':
+                    mydata = demodulated[i].real
+                elif demodtype == 'imag':
+                    mydata = demodulated[i].imag
+                elif demodtype == 'populations':
+                    # state counts of each record summed over the buffers
+                    mydata = discriminators[i].counts(demodulated[i],
+                                                      axis=0)[np.newaxis]
+                elif demodtype in ('std', 'snr'):
+                    # taken from the running statistics over the buffers
+                    mydata = None
+                else:
+                    raise RuntimeError(f"Unknown demodulator type {demodtype} supplied")
+                data.append(mydata)
+        return data
 
-    def _to_volts(self, record):
-        # convert rec to volts
+    def _to_volts(self, record, count: int=1,
+                  out: Optional[np.ndarray]=None):
+        """
+        Converts the sum of count raw records to the averaged record in
+        volts, written to out if given.
+        """
         bps = self.board_info['bits_per_sample']
         if bps == 12:
-            volt_rec = helpers.sample_to_volt_u12(record, bps, input_range_volts=0.4)
+            volt_rec = helpers.sum_to_volt_u12(record, count, bps,
+                                               input_range_volts=0.4,
+                                               dtype=self._output_dtype,
+                                               out=out)
         else:
             logger.warning('sample to volt conversion does not exist for'
                             ' bps != 12, centered raw samples returned')
-            volt_rec = record - np.mean(record)
+            if out is None:
+                out = np.empty(record.shape, dtype=self._output_dtype)
+            np.divide(record, count, out=out, casting='unsafe')
+            out -= np.mean(out)
+            volt_rec = out
         return volt_rec
+
+    def close(self):
+        self._wait_for_pending()
+        if self._pipeline_executor is not None:
+            self._pipeline_executor.shutdown()
+            self._pipeline_executor = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._volts_buffers.clear()
+        super().close()
@@ -1,28 +1,97 @@
 import numpy as np
 import math
+from functools import lru_cache
 
-def sample_to_volt_u12(raw_samples, bps, input_range_volts):
+
+@lru_cache(maxsize=16)
+def volt_lookup_table_u12(bps, input_range_volts, dtype=np.float64):
+    """
+    Volts of each of the 2**bps sample codes, e.g. 4096 entries for 12 bit
+    samples. The table is shared between callers so it is read only.
+
+    Args:
+        bps: bits per sample
+        input_range_volts: input range of the channel
+        dtype: floating point type of the table
+    """
+    # Alazar calibration
+    code_zero = (1 << (bps - 1)) - 0.5
+    code_range = (1 << (bps - 1)) - 0.5
+    codes = np.arange(1 << bps)
+    table = (input_range_volts * (codes - code_zero) / code_range).astype(dtype)
+    table.setflags(write=False)
+    return table
+
+
+def sample_to_volt_u12(raw_samples, bps, input_range_volts,
+                       dtype=np.float64, out=None):
     """
     Applies volts conversion for 12 bit sample data stored
-    in 2 bytes
+    in 2 bytes by looking up the volts of each sample code, see
+    volt_lookup_table_u12. Only the table and the shifted codes are
+    allocated besides the output.
+
+    Args:
+        raw_samples: raw 16-bit samples
+        bps: bits per sample
+        input_range_volts: input range of the channel
+        dtype: floating point type of the returned array, ignored if out
+            is given
+        out: optional array of the shape of raw_samples to write the volts
+            to
 
     return:
-        samples_magnitude_array
-        samples_phase_array
+        samples in volts
     """
-
+    if out is not None:
+        dtype = out.dtype
+    table = volt_lookup_table_u12(bps, input_range_volts, np.dtype(dtype))
     # right_shift 16-bit sample by 4 to get 12 bit sample
-    shifted_samples = np.right_shift(raw_samples, 4)
+    codes = np.right_shift(raw_samples, 4)
+    # the codes of 16-bit samples are always within the table
+    return np.take(table, codes, out=out, mode='clip')
+
 
+def sum_to_volt_u12(sample_sum, count, bps, input_range_volts,
+                    dtype=np.float64, out=None):
+    """
+    Applies volts conversion to the sum of count 12 bit samples stored
+    in 2 bytes, i.e. returns the average of the samples in volts. The
+    sum is scaled directly so no precision is lost by rounding the
+    average back to an integer and the conversion is only applied to
+    the reduced array. Raw (not summed) 16-bit samples are converted with
+    sample_to_volt_u12.
+
+    Args:
+        sample_sum: sum of the raw 16-bit samples (any integer type)
+        count: number of samples that have been summed
+        bps: bits per sample
+        input_range_volts: input range of the channel
+        dtype: floating point type of the returned array, ignored if out
+            is given
+        out: optional array of the shape of sample_sum to write the volts
+            to
+
+    return:
+        averaged samples in volts
+    """
+    sample_sum = np.asarray(sample_sum)
+    if count == 1 and sample_sum.dtype == np.uint16:
+        return sample_to_volt_u12(sample_sum, bps, input_range_volts,
+                                  dtype=dtype, out=out)
     # Alazar calibration
     code_zero = (1 << (bps - 1)) - 0.5
     code_range = (1 << (bps - 1)) - 0.5
+    # right_shift 16-bit sample by 4 to get 12 bit sample
+    shift_factor = 1 << 4
 
-    # Convert to volts
-    volt_samples = np.float64(input_range_volts *
-                              (shifted_samples - code_zero) / code_range)
-
-    return volt_samples
+    scale = input_range_volts / (code_range * shift_factor * count)
+    offset = input_range_volts * code_zero / code_range
+    if out is None:
+        out = np.empty(sample_sum.shape, dtype=dtype)
+    np.multiply(sample_sum, scale, out=out, casting='unsafe')
+    out -= offset
+    return out
 
 
 def roundup(num, to_nearest):
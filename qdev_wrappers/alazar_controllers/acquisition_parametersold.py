@@ -219,10 +219,12 @@ class ExpandingAlazarArrayMultiParameter(MultiParameter):
                  setpoint_labels = None,
                  setpoint_units = None,
                  integrate_samples=False,
-                 average_records=True):
+                 average_records=True,
+                 average_buffers=True):
         self.acquisition_kwargs = {}
         self._integrate_samples = integrate_samples
         self._average_records = average_records
+        self._average_buffers = average_buffers
 
         if setpoint_names:
             self.setpoint_names_base = setpoint_names[0]
@@ -302,32 +304,56 @@ class ExpandingAlazarArrayMultiParameter(MultiParameter):
         else:
             arraysetpoints = ()
             base_shape = ()
-        setpoints = [arraysetpoints]
-        names = [self.names[0]]
-        labels = [self.labels[0]]
-        setpoint_names = [self.setpoint_names_base]
-        setpoint_labels = [self.setpoint_labels_base]
-        setpoint_units = [self.setpoint_units_base]
-        units = [self.units[0]]
-        shapes = [base_shape]
-        demod_freqs = self._instrument.demod_freqs.get()
-        for i, demod_freq in enumerate(demod_freqs):
-            names.append("demod_freq_{}_mag".format(i))
-            labels.append("demod freq {} mag".format(i))
-            names.append("demod_freq_{}_phase".format(i))
-            labels.append("demod freq {} phase".format(i))
-            units.append('v')
-            units.append('v')
-            shapes.append(base_shape)
+        setpoint_names_base = self.setpoint_names_base
+        setpoint_labels_base = self.setpoint_labels_base
+        setpoint_units_base = self.setpoint_units_base
+        if not self._average_buffers:
+            # the data of each buffer along an outer axis
+            num_buffers = self._instrument.buffers_per_acquisition.get() or 1
+            buffer_setpoints = tuple(np.linspace(0, num_buffers - 1,
+                                                 num_buffers))
+            if arraysetpoints:
+                arraysetpoints = (buffer_setpoints,
+                                  (arraysetpoints[0],) * num_buffers)
+            else:
+                arraysetpoints = (buffer_setpoints,)
+            base_shape = (num_buffers,) + base_shape
+            setpoint_names_base = ('buffer_num',) + setpoint_names_base
+            setpoint_labels_base = ('buffer num',) + setpoint_labels_base
+            setpoint_units_base = ('',) + setpoint_units_base
+        setpoints = []
+        names = []
+        labels = []
+        setpoint_names = []
+        setpoint_labels = []
+        setpoint_units = []
+        units = []
+        shapes = []
+
+        def add_output(name, label, unit):
+            names.append(name)
+            labels.append(label)
+            units.append(unit)
             shapes.append(base_shape)
             setpoints.append(arraysetpoints)
-            setpoint_names.append(self.setpoint_names_base)
-            setpoint_labels.append(self.setpoint_labels_base)
-            setpoint_units.append(self.setpoint_units_base)
-            setpoints.append(arraysetpoints)
-            setpoint_names.append(self.setpoint_names_base)
-            setpoint_labels.append(self.setpoint_labels_base)
-            setpoint_units.append(self.setpoint_units_base)
+            setpoint_names.append(setpoint_names_base)
+            setpoint_labels.append(setpoint_labels_base)
+            setpoint_units.append(setpoint_units_base)
+
+        # the outputs of channel A followed by those of channel B
+        channel_suffixes = [('', '')]
+        if self._instrument.chan_b:
+            channel_suffixes.append(('_b', ' b'))
+        demod_freqs = self._instrument.demod_freqs.get()
+        for name_suffix, label_suffix in channel_suffixes:
+            add_output(self.names[0] + name_suffix,
+                       self.labels[0] + label_suffix, self.units[0])
+            for i, demod_freq in enumerate(demod_freqs):
+                add_output("demod_freq_{}_mag{}".format(i, name_suffix),
+                           "demod freq {} mag{}".format(i, label_suffix), 'v')
+                add_output("demod_freq_{}_phase{}".format(i, name_suffix),
+                           "demod freq {} phase{}".format(i, label_suffix),
+                           'v')
         self.names = tuple(names)
         self.labels = tuple(labels)
         self.units = tuple(units)
@@ -345,6 +371,7 @@ class ExpandingAlazarArrayMultiParameter(MultiParameter):
         additional_acq_kwargs = {key: val.get() for key, val in inst.parameters.items() if
              key in params_to_kwargs}
         acq_kwargs.update(additional_acq_kwargs)
+        acq_kwargs.setdefault('channel_selection', inst.channel_selection())
 
         output = self._instrument._get_alazar().acquire(
             acquisition_controller=self._instrument,
@@ -0,0 +1,156 @@
+import logging
+from typing import Sequence, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+
+class AcquisitionPlan:
+    """
+    The configuration of an acquisition of one or more AlazarChannels,
+    compiled once from the parameters of the channels: the nested channel
+    info and the shape info used by the ATSChannelController to process
+    the buffers and the kwargs of the Alazar acquire call.
+
+    When the plan is used for the first time the controller stores its
+    prepared processing state (demodulators, preallocated buffers, ...) in
+    controller_state, so repeated acquisitions with the same configuration
+    skip all setup work. A plan is only valid as long as the signature of
+    the channels, the controller and the Alazar is unchanged, see
+    ATSChannelController.acquisition_plan.
+
+    Args:
+        controller: the ATSChannelController of the channels
+        channels: the channels acquired together, their outputs are
+            returned in this order
+        signature: the signature of the configuration, see
+            configuration_signature
+    """
+
+    # parameters of the Alazar which are set from the acquire kwargs
+    acquire_kwarg_names = ('samples_per_record', 'records_per_buffer',
+                           'buffers_per_acquisition', 'allocated_buffers',
+                           'channel_selection')
+
+    # parameters of the controller which do not change the processing
+    unplanned_parameters = ('raw_capture_file', 'profile_stages',
+                            'timings_to_metadata', 'timings')
+
+    def __init__(self, controller, channels: Sequence,
+                 signature: Tuple[Any, ...]) -> None:
+        self.signature = signature
+        self.controller_state = None
+        # second buffer used while a deferred acquisition is processed
+        self.spare_buffer = None
+        self.shape_info = {}
+        alazar_channels = 2
+        self.active_channels_nested = [{'ndemods': 0,
+                                        'nsignals': 0,
+                                        'demod_freqs': [],
+                                        'demod_types': [],
+                                        'discriminators': [],
+                                        'integration_weights': [],
+                                        'demod_order': [],
+                                        'raw_order': [],
+                                        'numbers': [],
+                                        'raw': False}
+                                       for _ in range(alazar_channels)]
+
+        for i, channel in enumerate(channels):
+            alazar_channel = channel.alazar_channel.raw_value
+            channel_info = self.active_channels_nested[alazar_channel]
+            channel_info['nsignals'] += 1
+
+            if channel._demod:
+                channel_info['ndemods'] += 1
+                channel_info['demod_order'].append(i)
+                channel_info['demod_freqs'].append(channel.demod_freq.get())
+                channel_info['demod_types'].append(channel.demod_type.get())
+                channel_info['discriminators'].append(channel.discriminator)
+                channel_info['integration_weights'].append(
+                    channel.integration_weights)
+            else:
+                channel_info['raw'] = True
+                channel_info['raw_order'].append(i)
+            self.shape_info['average_buffers'] = channel._average_buffers
+            self.shape_info['average_records'] = channel._average_records
+            self.shape_info['integrate_samples'] = channel._integrate_samples
+            self.shape_info['channel'] = channel.alazar_channel.get()
+
+        output_order = []
+        for achan in self.active_channels_nested:
+            output_order += achan['raw_order']
+            output_order += achan['demod_order']
+        self.shape_info['output_order'] = output_order
+        self.shape_info['raw_capture'] = any(
+            'raw_capture' in channel.parameters and
+            channel.raw_capture.get() == 'memmap' for channel in channels)
+
+        params_to_kwargs = ['samples_per_record', 'records_per_buffer',
+                            'buffers_per_acquisition', 'allocated_buffers']
+        acq_kwargs = channels[0].acquisition_kwargs.copy()
+        controller_acq_kwargs = {key: val.get() for key, val in
+                                 controller.parameters.items()
+                                 if key in params_to_kwargs}
+        channels_acq_kwargs = []
+        for i, channel in enumerate(channels):
+            channels_acq_kwargs.append({key: val.get() for key, val in
+                                        channel.parameters.items()
+                                        if key in params_to_kwargs})
+            if channels_acq_kwargs[i] != channels_acq_kwargs[0]:
+                raise RuntimeError("Found non matching kwargs. Got {} and {}".format(
+                    channels_acq_kwargs[0], channels_acq_kwargs[i]))
+        acq_kwargs.update(controller_acq_kwargs)
+        acq_kwargs.update(channels_acq_kwargs[0])
+        # only acquire the Alazar channels that are used
+        acq_kwargs['channel_selection'] = ''.join(
+            'AB'[channel_number] for channel_number, channel_info
+            in enumerate(self.active_channels_nested)
+            if channel_info['nsignals'] > 0)
+        number_of_channels = len(acq_kwargs['channel_selection'])
+        acq_kwargs['allocated_buffers'] = controller.allocated_buffers(
+            acq_kwargs['records_per_buffer'],
+            acq_kwargs['buffers_per_acquisition'],
+            number_of_channels)
+        self.acquire_kwargs = acq_kwargs
+        # expected duration of the acquisition according to the timing
+        # model of the controller
+        self.expected_time = controller.expected_acquisition_time(
+            acq_kwargs['records_per_buffer'],
+            acq_kwargs['buffers_per_acquisition'],
+            acq_kwargs['allocated_buffers'],
+            number_of_channels,
+            self.shape_info['average_buffers'])
+        logger.debug("compiled acquisition plan with {}, expected to take "
+                     "{} s".format(acq_kwargs, self.expected_time))
+
+    @classmethod
+    def configuration_signature(cls, controller, channels: Sequence) -> Tuple[Any, ...]:
+        """
+        The values of all parameters of the channels, the controller and
+        the Alazar which the plan and the prepared processing depend on.
+        Reading the cached raw values is much cheaper than compiling the
+        plan.
+        """
+        alazar = controller._get_alazar()
+        signature = [tuple(sorted(controller.filter_settings.items())),
+                     controller.buffer_timing_model]
+        signature += _parameter_values(controller, cls.unplanned_parameters)
+        exclude = set(cls.acquire_kwarg_names)
+        for channel in channels:
+            exclude.update(channel.acquisition_kwargs)
+            signature.append((channel._demod, channel._average_buffers,
+                              channel._average_records,
+                              channel._integrate_samples))
+            signature.append(channel.discriminator)
+            weights = channel.integration_weights
+            signature.append(None if weights is None else weights.tobytes())
+            signature.append(tuple(sorted(channel.acquisition_kwargs.items())))
+            signature += _parameter_values(channel, ('data',))
+        signature += _parameter_values(alazar, exclude)
+        return tuple(signature)
+
+
+def _parameter_values(instrument, exclude: Sequence[str]) -> Tuple[Any, ...]:
+    return tuple(parameter.raw_value
+                 for name, parameter in instrument.parameters.items()
+                 if name not in exclude)
@@ -1,8 +1,13 @@
 import math
+from typing import Optional
+
+import numpy as np
+
 from qcodes.instrument.channel import InstrumentChannel
 from qcodes.utils import validators as vals
 from .alazar_multidim_parameters import Alazar0DParameter, Alazar1DParameter, Alazar2DParameter
 from .acquisition_parameters import AcqVariablesParam, NonSettableDerivedParameter
+from .discriminator import Discriminator
 
 class AlazarChannel(InstrumentChannel):
     """
@@ -18,6 +23,26 @@ class AlazarChannel(InstrumentChannel):
     samples_trace: Averaged over buffers and records. 1D trace as a function of samples (time)
     records_vs_samples_trace: Averaged over buffers. 2D array of records vs samples
 
+    For single shot readout a demodulated buffers_vs_records_trace can use
+    demod_type 'populations'. The integrated IQ point of every record is
+    classified by the discriminator (see set_discriminator) and the
+    fraction of buffers in each state is returned as a 2D array of
+    records vs states.
+
+    Buffer averaged demodulated channels can use demod_type 'std' or 'snr'
+    to get the standard deviation of the demodulated signal over the
+    buffers or the signal to noise ratio (magnitude of the mean over the
+    standard deviation) from the same acquisition (see
+    ATSChannelController.buffer_statistics).
+
+    Demodulated channels which integrate over samples can use integration
+    weights (see set_integration_weights), e.g. matched filter weights
+    calibrated from a demodulated records_vs_samples_trace of the ground
+    and excited state, instead of the mean over the integration window.
+
+    If buffers are not averaged 'raw_capture' can be set to 'memmap' to keep
+    the raw records of the acquisition in a memory mapped file instead of
+    memory (see ATSChannelController).
     """
 
 
@@ -43,6 +68,8 @@ class AlazarChannel(InstrumentChannel):
             raise RuntimeError("Alazar controller only supports up to 2 dimensional arrays")
 
         self._demod = demod
+        self.discriminator = None
+        self.integration_weights = None
         if demod:
             self.add_parameter('demod_freq',
                                label='demod freq',
@@ -52,8 +79,10 @@ class AlazarChannel(InstrumentChannel):
             self.add_parameter('demod_type',
                                label='demod type',
                                initial_value='magnitude',
-                               vals=vals.Enum('magnitude', 'phase', 'real', 'imag'),
-                               get_cmd=None, set_cmd=None)
+                               vals=vals.Enum('magnitude', 'phase', 'real',
+                                              'imag', 'populations', 'std',
+                                              'snr'),
+                               get_cmd=None, set_cmd=self._set_demod_type)
 
         self.add_parameter('alazar_channel',
                            label='Alazar Channel',
@@ -82,6 +111,14 @@ class AlazarChannel(InstrumentChannel):
                                label='records_per_buffer',
                                alternative='num_averages',
                                parameter_class=NonSettableDerivedParameter)
+        if not average_buffers:
+            self.add_parameter('raw_capture',
+                               label='raw capture',
+                               docstring="Where to keep the raw buffers, "
+                                         "'memmap' streams them to a file.",
+                               initial_value='memory',
+                               vals=vals.Enum('memory', 'memmap'),
+                               get_cmd=None, set_cmd=None)
         self.add_parameter('num_averages',
                            #label='num averages',
                            check_and_update_fn=self._update_num_avg,
@@ -121,6 +158,42 @@ class AlazarChannel(InstrumentChannel):
             self.data.set_setpoints_and_labels()
             self._stale_setpoints = False
 
+    def set_discriminator(self, discriminator: Optional[Discriminator]) -> None:
+        """
+        Sets the discriminator used to classify the integrated IQ points
+        when demod_type is 'populations'.
+        """
+        self.discriminator = discriminator
+        if self.dimensions > 0:
+            self._stale_setpoints = True
+
+    def set_integration_weights(self,
+                                weights: Optional[np.ndarray]) -> None:
+        """
+        Sets the complex weights of the samples of the demodulated trace
+        which are summed instead of taking the mean over the integration
+        window, see demodulator.matched_filter_weights. None restores the
+        mean. A discriminator should be trained again after the weights
+        are changed.
+        """
+        if weights is not None:
+            if not (self._demod and self._integrate_samples):
+                raise RuntimeError('Integration weights require a demodulated '
+                                   'channel which integrates over samples')
+            weights = np.array(weights, dtype=np.complex128)
+            weights.setflags(write=False)
+        self.integration_weights = weights
+
+    def _set_demod_type(self, value: str) -> None:
+        # populations change the shape of the data, the parameter does
+        # not exist yet when the initial value is set
+        if 'demod_type' in self.parameters:
+            old_value = self.demod_type.get_latest()
+        else:
+            old_value = None
+        if self.dimensions > 0 and 'populations' in (value, old_value):
+            self._stale_setpoints = True
+
     def _update_num_avg(self, value: int, **kwargs) -> None:
         # allow unused **kwargs as the function may be
         # called with additional unused args
@@ -137,9 +210,13 @@ class AlazarChannel(InstrumentChannel):
             max_samples = self._parent.board_info['max_samples']
             samples_per_rec = self._parent.samples_per_record()
             tot_samples = value * samples_per_rec
-            if tot_samples > max_samples:
+            if self._parent.buffer_geometry.get() == 'optimized':
+                geometry = self._parent.optimize_buffer_geometry(value)
+                records = geometry.records_per_buffer
+                buffers = geometry.buffers_per_acquisition
+            elif tot_samples > max_samples:
                 records = math.floor(max_samples/samples_per_rec)
-                buffers = math.ceil(max_samples/records)
+                buffers = math.ceil(value/records)
             else:
                 records = value
                 buffers = 1
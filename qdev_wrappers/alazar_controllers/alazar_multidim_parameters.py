@@ -1,5 +1,6 @@
 import logging
-from typing import Sequence, Optional
+from concurrent.futures import Future
+from typing import Sequence, Optional, Tuple
 
 import numpy as np
 
@@ -8,6 +9,7 @@ from qcodes.instrument.channel import MultiChannelInstrumentParameter
 
 logger = logging.getLogger(__name__)
 
+
 class Alazar0DParameter(Parameter):
     def __init__(self,
                  name: str,
@@ -27,48 +29,26 @@ class Alazar0DParameter(Parameter):
                          snapshot_get=False,
                          instrument=instrument)
 
+    # set by a pipelined sweep which then takes over the acquisition
+    pipeline = None
+
     def get_raw(self) -> float:
+        if self.pipeline is not None:
+            return self.pipeline.measure(self)
+        return self._acquire(deferred=False)
+
+    def get_async(self) -> Future:
+        """
+        Acquires the data and returns a future of the data which is
+        processed in a worker thread.
+        """
+        return self._acquire(deferred=True)
+
+    def _acquire(self, deferred: bool):
         channel = self._instrument
         cntrl = channel._parent
-        alazar_channels = 2
-        cntrl.active_channels_nested = [{'ndemods': 0,
-                                         'nsignals': 0,
-                                         'demod_freqs': [],
-                                         'demod_types': [],
-                                         'numbers': [],
-                                         'raw': False} for _ in range(alazar_channels)]
-        alazar_channel = channel.alazar_channel.raw_value
-        channel_info = cntrl.active_channels_nested[alazar_channel]
-        channel_info['nsignals'] = 1
-        if channel._demod:
-            channel_info['ndemods'] = 1
-            channel_info['demod_freqs'].append(channel.demod_freq.get())
-            channel_info['demod_types'].append(channel.demod_type.get())
-        else:
-            channel_info['raw'] = True
-        cntrl.shape_info['average_buffers'] = channel._average_buffers
-        cntrl.shape_info['average_records'] = channel._average_records
-        cntrl.shape_info['integrate_samples'] = channel._integrate_samples
-        cntrl.shape_info['output_order'] = [0]
-        params_to_kwargs = ['samples_per_record', 'records_per_buffer',
-                            'buffers_per_acquisition', 'allocated_buffers']
-        acq_kwargs = self._instrument.acquisition_kwargs.copy()
-        controller_acq_kwargs = {key: val.get() for key, val in cntrl.parameters.items() if
-             key in params_to_kwargs}
-        channel_acq_kwargs = {key: val.get() for key, val in channel.parameters.items() if
-             key in params_to_kwargs}
-        acq_kwargs.update(controller_acq_kwargs)
-        acq_kwargs.update(channel_acq_kwargs)
-        if acq_kwargs['buffers_per_acquisition'] > 1:
-            acq_kwargs['allocated_buffers'] = 4
-        else:
-            acq_kwargs['allocated_buffers'] = 1
-
-        output = self._instrument._parent._get_alazar().acquire(
-            acquisition_controller=self._instrument._parent,
-            **acq_kwargs)
-        logger.info("calling acquire with {}".format(acq_kwargs))
-        return output
+        plan = cntrl.acquisition_plan([channel])
+        return cntrl.acquire_plan(plan, deferred=deferred)
 
 
 class AlazarNDParameter(ArrayParameter):
@@ -96,52 +76,42 @@ class AlazarNDParameter(ArrayParameter):
                          setpoint_labels=setpoint_labels,
                          setpoint_units=setpoint_units)
 
+    # set by a pipelined sweep which then takes over the acquisition
+    pipeline = None
+
     def get_raw(self) -> np.ndarray:
+        if self.pipeline is not None:
+            return self.pipeline.measure(self)
+        return self._acquire(deferred=False)
+
+    def get_async(self) -> Future:
+        """
+        Acquires the data and returns a future of the data which is
+        processed in a worker thread.
+        """
+        return self._acquire(deferred=True)
+
+    def _acquire(self, deferred: bool):
         channel = self._instrument
         if channel._stale_setpoints:
             raise RuntimeError("Must run prepare channel before capturing data.")
         cntrl = channel._parent
-        cntrl.shape_info = {}
-        alazar_channels = 2
-        cntrl.active_channels_nested = [{'ndemods': 0,
-                                         'nsignals': 0,
-                                         'demod_freqs': [],
-                                         'demod_types': [],
-                                         'numbers': [],
-                                         'raw': False} for _ in range(alazar_channels)]
-        alazar_channel = channel.alazar_channel.raw_value
-        channel_info = cntrl.active_channels_nested[alazar_channel]
-        channel_info['nsignals'] = 1
-        if channel._demod:
-            channel_info['ndemods'] = 1
-            channel_info['demod_freqs'].append(channel.demod_freq.get())
-            channel_info['demod_types'].append(channel.demod_type.get())
-        else:
-            channel_info['raw'] = True
-        cntrl.shape_info['average_buffers'] = channel._average_buffers
-        cntrl.shape_info['average_records'] = channel._average_records
-        cntrl.shape_info['integrate_samples'] = channel._integrate_samples
-        cntrl.shape_info['output_order'] = [0]
-
-        params_to_kwargs = ['samples_per_record', 'records_per_buffer',
-                            'buffers_per_acquisition', 'allocated_buffers']
-        acq_kwargs = self._instrument.acquisition_kwargs.copy()
-        controller_acq_kwargs = {key: val.get() for key, val in cntrl.parameters.items() if
-             key in params_to_kwargs}
-        channel_acq_kwargs = {key: val.get() for key, val in channel.parameters.items() if
-             key in params_to_kwargs}
-        acq_kwargs.update(controller_acq_kwargs)
-        acq_kwargs.update(channel_acq_kwargs)
-        if acq_kwargs['buffers_per_acquisition'] > 1:
-            acq_kwargs['allocated_buffers'] = 4
-        else:
-            acq_kwargs['allocated_buffers'] = 1
+        plan = cntrl.acquisition_plan([channel])
+        return cntrl.acquire_plan(plan, deferred=deferred)
 
-        logger.info("calling acquire with {}".format(acq_kwargs))
-        output = self._instrument._parent._get_alazar().acquire(
-            acquisition_controller=self._instrument._parent,
-            **acq_kwargs)
-        return output
+    def _time_axis(self) -> Tuple[int, float]:
+        """
+        Number of points and duration of the time axis of a non integrated
+        trace. Demodulated traces are decimated by decimating filters.
+        """
+        cntrl = self._instrument._parent
+        samples = cntrl.samples_per_record.get()
+        sample_rate = cntrl._get_alazar().get_sample_rate()
+        decimation = 1
+        if self._instrument._demod:
+            decimation = cntrl.demod_decimation()
+        npoints = -(-samples // decimation)
+        return npoints, npoints * decimation / sample_rate
 
 
 class Alazar1DParameter(AlazarNDParameter):
@@ -187,24 +157,17 @@ class Alazar1DParameter(AlazarNDParameter):
         # int_delay = self._instrument.int_delay.get() or 0
         # total_time = int_time + int_delay
         if not self._integrate_samples:
-            samples = self._instrument._parent.samples_per_record.get()
-            sample_rate = self._instrument._parent._get_alazar().get_sample_rate()
-            start = 0
-            stop = samples/sample_rate
+            samples, stop = self._time_axis()
             self.shape = (samples,)
-            self.setpoints = (tuple(np.linspace(start, stop, samples, endpoint=False)),)
+            self.setpoints = (_setpoint_axis(stop, samples),)
         elif not self._average_records:
             records = self._instrument.records_per_buffer.get()
-            start = 0
-            stop = records
             self.shape = (records,)
-            self.setpoints = (tuple(np.linspace(start, stop, records, endpoint=False)),)
+            self.setpoints = (_setpoint_axis(records, records),)
         elif not self._average_buffers:
             buffers = self._instrument.buffers_per_acquisition.get()
-            start = 0
-            stop = buffers
             self.shape = (buffers,)
-            self.setpoints = (tuple(np.linspace(start, stop, buffers, endpoint=False)),)
+            self.setpoints = (_setpoint_axis(buffers, buffers),)
 
 
 class Alazar2DParameter(AlazarNDParameter):
@@ -236,6 +199,10 @@ class Alazar2DParameter(AlazarNDParameter):
             setpoint_names = ('records', 'time')
             setpoint_labels = ('Records', 'Time')
             setpoint_units = ('','S')
+        self._unit = unit
+        self._setpoint_names = setpoint_names
+        self._setpoint_labels = setpoint_labels
+        self._setpoint_units = setpoint_units
         super().__init__(name,
                          unit=unit,
                          label=label,
@@ -251,26 +218,79 @@ class Alazar2DParameter(AlazarNDParameter):
     def set_setpoints_and_labels(self):
         records = self._instrument.records_per_buffer()
         buffers = self._instrument.buffers_per_acquisition()
-        samples = self._instrument._parent.samples_per_record.get()
+        if self._populations():
+            discriminator = self._instrument.discriminator
+            states = discriminator.num_states if discriminator else 0
+            self.shape = (records, states)
+            self.unit = ''
+            self.setpoint_names = ('records', 'state')
+            self.setpoint_labels = ('Records', 'State')
+            self.setpoint_units = ('', '')
+            self.setpoints = _setpoint_grid(_setpoint_axis(records, records),
+                                            _setpoint_axis(states, states))
+            return
+        self.unit = self._unit
+        self.setpoint_names = self._setpoint_names
+        self.setpoint_labels = self._setpoint_labels
+        self.setpoint_units = self._setpoint_units
         if self._integrate_samples:
             self.shape = (buffers,records)
-            inner_setpoints = tuple(np.linspace(0, records, records, endpoint=False))
-            outer_setpoints = tuple(np.linspace(0, buffers, buffers, endpoint=False))
+            inner_setpoints = _setpoint_axis(records, records)
+            outer_setpoints = _setpoint_axis(buffers, buffers)
         elif self._average_records:
-            sample_rate = self._instrument._parent._get_alazar().get_sample_rate()
-            stop = samples/sample_rate
+            samples, stop = self._time_axis()
             self.shape = (buffers,samples)
-            inner_setpoints = tuple(np.linspace(0, stop, samples, endpoint=False))
-            outer_setpoints = tuple(np.linspace(0, buffers, buffers, endpoint=False))
+            inner_setpoints = _setpoint_axis(stop, samples)
+            outer_setpoints = _setpoint_axis(buffers, buffers)
         elif self._average_buffers:
-            sample_rate = self._instrument._parent._get_alazar().get_sample_rate()
-            stop = samples/sample_rate
+            samples, stop = self._time_axis()
             self.shape = (records,samples)
-            inner_setpoints = tuple(np.linspace(0, stop, samples, endpoint=False))
-            outer_setpoints = tuple(np.linspace(0, records, records, endpoint=False))
+            inner_setpoints = _setpoint_axis(stop, samples)
+            outer_setpoints = _setpoint_axis(records, records)
         else:
             raise RuntimeError("Non supported Array type")
-        self.setpoints = (outer_setpoints, tuple(inner_setpoints for _ in range(len(outer_setpoints))))
+        self.setpoints = _setpoint_grid(outer_setpoints, inner_setpoints)
+
+    def _populations(self) -> bool:
+        channel = self._instrument
+        return channel._demod and channel.demod_type.get() == 'populations'
+
+
+class SetpointArray(np.ndarray):
+    """
+    Read only setpoint array which hashes by identity. The loop hashes
+    the setpoints of a parameter to share setpoint arrays between its
+    outputs, which a plain (unhashable) ndarray does not allow.
+    """
+    __hash__ = object.__hash__
+
+
+def _setpoint_axis(stop: float, npoints: int) -> SetpointArray:
+    """
+    Read only setpoints of npoints equally spaced points from 0 up to but
+    excluding stop.
+    """
+    return _read_only(np.linspace(0, stop, npoints, endpoint=False))
+
+
+def _setpoint_grid(outer: np.ndarray,
+                   inner: np.ndarray) -> Tuple[SetpointArray, SetpointArray]:
+    """
+    Setpoints of a 2D array. The inner setpoints are the same for every
+    outer setpoint so they are a broadcast (read only) view of a single
+    row rather than a copy per row.
+    """
+    return (_read_only(outer),
+            _read_only(np.broadcast_to(inner, (len(outer), len(inner)))))
+
+
+def _read_only(array: np.ndarray) -> SetpointArray:
+    """
+    Read only, hashable view of array.
+    """
+    view = np.asarray(array).view(SetpointArray)
+    view.setflags(write=False)
+    return view
 
 
 class AlazarMultiChannelParameter(MultiChannelInstrumentParameter):
@@ -278,71 +298,29 @@ class AlazarMultiChannelParameter(MultiChannelInstrumentParameter):
 
 
     """
+    # set by a pipelined sweep which then takes over the acquisition
+    pipeline = None
+
     def get_raw(self) -> np.ndarray:
         if self._param_name == 'data':
-            channel = self._channels[0]
-            cntrl = channel._parent
-            instrument = cntrl._get_alazar()
-            cntrl.shape_info = {}
-            alazar_channels = 2
-            cntrl.active_channels_nested = [{'ndemods':0,
-                                             'nsignals':0,
-                                             'demod_freqs':[],
-                                             'demod_types': [],
-                                             'demod_order': [],
-                                             'raw_order': [],
-                                             'numbers': [],
-                                             'raw':False} for _ in range(alazar_channels)]
-
-            for i, channel in enumerate(self._channels):
-                # change this to use raw value once mapping is
-                # complete
-                alazar_channel = channel.alazar_channel.raw_value
-                channel_info = cntrl.active_channels_nested[alazar_channel]
-                channel_info['nsignals'] += 1
-
-                if channel._demod:
-                    channel_info['ndemods'] += 1
-                    channel_info['demod_order'].append(i)
-                    channel_info['demod_freqs'].append(channel.demod_freq.get())
-                    channel_info['demod_types'].append(channel.demod_type.get())
-                else:
-                    channel_info['raw'] = True
-                    channel_info['raw_order'].append(i)
-                cntrl.shape_info['average_buffers'] = channel._average_buffers
-                cntrl.shape_info['average_records'] = channel._average_records
-                cntrl.shape_info['integrate_samples'] = channel._integrate_samples
-                cntrl.shape_info['channel'] = channel.alazar_channel.get()
-
-            output_order = []
-            for achan in cntrl.active_channels_nested:
-                output_order += achan['raw_order']
-                output_order += achan['demod_order']
-            cntrl.shape_info['output_order'] = output_order
-            params_to_kwargs = ['samples_per_record', 'records_per_buffer',
-                                'buffers_per_acquisition', 'allocated_buffers']
-            acq_kwargs = channel.acquisition_kwargs.copy()
-            controller_acq_kwargs = {key: val.get() for key, val in cntrl.parameters.items() if
-                 key in params_to_kwargs}
-            channels_acq_kwargs = []
-            for i, channel in enumerate(self._channels):
-                channels_acq_kwargs.append({key: val.get() for key, val in channel.parameters.items() if
-                     key in params_to_kwargs})
-                if channels_acq_kwargs[i] != channels_acq_kwargs[0]:
-                    raise RuntimeError("Found non matching kwargs. Got {} and {}".format(channels_acq_kwargs[0],
-                                                                                         channels_acq_kwargs[i]))
-            acq_kwargs.update(controller_acq_kwargs)
-            acq_kwargs.update(channels_acq_kwargs[0])
-            if acq_kwargs['buffers_per_acquisition'] > 1:
-                acq_kwargs['allocated_buffers'] = 4
-            else:
-                acq_kwargs['allocated_buffers'] = 1
-
-            logger.info("calling acquire with {}".format(acq_kwargs))
-            output = instrument.acquire(
-                acquisition_controller=cntrl,
-                **acq_kwargs)
+            if self.pipeline is not None:
+                return self.pipeline.measure(self)
+            cntrl = self._channels[0]._parent
+            plan = cntrl.acquisition_plan(self._channels)
+            output = cntrl.acquire_plan(plan)
         else:
             output = tuple(chan.parameters[self._param_name].get()
                            for chan in self._channels)
         return output
+
+    def get_async(self) -> Future:
+        """
+        Acquires the data of all channels and returns a future of the
+        data which is processed in a worker thread.
+        """
+        if self._param_name != 'data':
+            raise NotImplementedError('Only the data can be acquired '
+                                      'asynchronously')
+        cntrl = self._channels[0]._parent
+        plan = cntrl.acquisition_plan(self._channels)
+        return cntrl.acquire_plan(plan, deferred=True)
@@ -0,0 +1,194 @@
+"""
+Throughput benchmarks of the ATSChannelController on the simulated
+ATS9360. They run without a card so they can be used to tune the buffer
+geometry and processing settings and to catch performance regressions.
+
+Run the default matrix with
+
+    python -m qdev_wrappers.alazar_controllers.benchmarks
+"""
+import itertools
+import logging
+import tracemalloc
+from typing import Dict, List, Optional, Sequence, Any
+
+from qcodes import ChannelList
+from .ATSChannelController import ATSChannelController
+from .alazar_channel import AlazarChannel
+from .alazar_multidim_parameters import AlazarMultiChannelParameter
+from .simulated_alazar import SimulatedATS9360
+
+logger = logging.getLogger(__name__)
+
+# (average_buffers, average_records, integrate_samples) of the channel
+# types supported by AlazarChannel
+channel_types = [shape for shape in itertools.product((True, False), repeat=3)
+                 if any(shape)]
+
+
+def benchmark_channel(controller: ATSChannelController,
+                      demod: bool=True,
+                      average_buffers: bool=True,
+                      average_records: bool=True,
+                      integrate_samples: bool=True,
+                      records: int=100,
+                      buffers: int=100,
+                      demod_freqs: Sequence[float]=(20e6,),
+                      repetitions: int=3) -> Dict[str, Any]:
+    """
+    Benchmarks the acquisition of one configuration of channels.
+
+    A channel is created for each demodulation frequency (or a single
+    non demodulated channel) and the channels are acquired together.
+
+    Args:
+        controller: controller of a SimulatedATS9360
+        demod: whether the channels are demodulated
+        average_buffers: whether the channels average over buffers
+        average_records: whether the channels average over records
+        integrate_samples: whether the channels integrate over samples
+        records: records per buffer
+        buffers: buffers per acquisition
+        demod_freqs: demodulation frequencies, one channel each
+        repetitions: number of timed acquisitions, the fastest is reported
+
+    Returns:
+        dict with the configuration, 'records_per_s' (records processed
+        per second of controller time), 'post_acquire_s' (latency of
+        post_acquire), 'total_s' (controller time of the acquisition) and
+        'peak_memory_mb' (peak memory traced during an acquisition)
+    """
+    alazar = controller._get_alazar()
+    channels = []
+    for i, freq in enumerate(demod_freqs if demod else [None]):
+        channel = AlazarChannel(controller, 'benchmark{}'.format(i),
+                                demod=demod,
+                                average_buffers=average_buffers,
+                                average_records=average_records,
+                                integrate_samples=integrate_samples)
+        if demod:
+            channel.demod_freq(freq)
+        if not average_records:
+            channel.records_per_buffer(records)
+        if not average_buffers:
+            channel.buffers_per_acquisition(buffers)
+        if average_buffers and average_records:
+            channel.num_averages(records * buffers)
+        elif average_buffers:
+            channel.num_averages(buffers)
+        elif average_records:
+            channel.num_averages(records)
+        channel.prepare_channel()
+        channels.append(channel)
+    if len(channels) == 1:
+        parameter = channels[0].data
+    else:
+        parameter = _multi_channel_data(controller, channels)
+    total_records = (channels[0].records_per_buffer.get() *
+                     channels[0].buffers_per_acquisition.get())
+
+    # warm up caches and plans
+    parameter.get()
+    timings = []
+    for _ in range(repetitions):
+        parameter.get()
+        timings.append(dict(alazar.last_timing))
+    tracemalloc.start()
+    try:
+        parameter.get()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    fastest = min(timings, key=lambda timing: timing['total'])
+    return {'demod': demod,
+            'average_buffers': average_buffers,
+            'average_records': average_records,
+            'integrate_samples': integrate_samples,
+            'channels': len(channels),
+            'records': total_records,
+            'samples_per_record': alazar.samples_per_record.get(),
+            'records_per_s': total_records / fastest['total'],
+            'post_acquire_s': fastest['post_acquire'],
+            'total_s': fastest['total'],
+            'peak_memory_mb': peak / 1024**2}
+
+
+def run_benchmarks(records: int=100,
+                   buffers: int=100,
+                   demod_freqs: Sequence[float]=(20e6,),
+                   int_time: float=2e-6,
+                   int_delay: float=2e-7,
+                   repetitions: int=3,
+                   controller_settings: Optional[Dict[str, Any]]=None
+                   ) -> List[Dict[str, Any]]:
+    """
+    Benchmarks all channel types with and without demodulation on a
+    simulated ATS9360, see benchmark_channel.
+
+    Args:
+        records: records per buffer
+        buffers: buffers per acquisition
+        demod_freqs: demodulation frequencies, one channel each
+        int_time: integration time of the controller
+        int_delay: integration delay of the controller
+        repetitions: number of timed acquisitions per configuration
+        controller_settings: values of parameters of the controller to
+            set, e.g. {'processing_threads': 4}
+
+    Returns:
+        list of results of benchmark_channel
+    """
+    alazar = SimulatedATS9360('benchmark_alazar', seed=0)
+    controller = ATSChannelController('benchmark_controller',
+                                      alazar.name)
+    try:
+        alazar.set_tones('A', [(frequency, 0.1 / len(demod_freqs), 0.3)
+                               for frequency in demod_freqs])
+        controller.int_delay(int_delay)
+        controller.int_time(int_time)
+        for name, value in (controller_settings or {}).items():
+            controller.parameters[name].set(value)
+        results = []
+        for demod, shape in itertools.product((False, True), channel_types):
+            average_buffers, average_records, integrate_samples = shape
+            result = benchmark_channel(controller, demod,
+                                       average_buffers, average_records,
+                                       integrate_samples,
+                                       records=records, buffers=buffers,
+                                       demod_freqs=demod_freqs,
+                                       repetitions=repetitions)
+            logger.info('benchmark {}'.format(result))
+            results.append(result)
+    finally:
+        controller.close()
+        alazar.close()
+    return results
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """
+    Table of the results of run_benchmarks.
+    """
+    lines = ['demod  ave_buf  ave_rec  integrate  records   records/s  '
+             'post_acquire [ms]  peak memory [MB]']
+    for result in results:
+        lines.append('{:<7}{:<9}{:<9}{:<11}{:>7}{:>12.4g}{:>19.3f}{:>18.1f}'.format(
+            str(result['demod']), str(result['average_buffers']),
+            str(result['average_records']), str(result['integrate_samples']),
+            result['records'], result['records_per_s'],
+            result['post_acquire_s'] * 1e3, result['peak_memory_mb']))
+    return '\n'.join(lines)
+
+
+def _multi_channel_data(controller: ATSChannelController,
+                        channels: Sequence[AlazarChannel]):
+    channel_list = ChannelList(controller, 'benchmark_channels', AlazarChannel,
+                               multichan_paramclass=AlazarMultiChannelParameter)
+    for channel in channels:
+        channel_list.append(channel)
+    return channel_list.data
+
+
+if __name__ == '__main__':
+    print(format_results(run_benchmarks()))
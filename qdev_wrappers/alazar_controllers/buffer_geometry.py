@@ -0,0 +1,240 @@
+import logging
+import math
+from typing import NamedTuple, Optional, Sequence, Dict, Any, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BufferTimingModel(NamedTuple):
+    """
+    Model of the time an Alazar acquisition takes as a function of its
+    buffer geometry, see expected_acquisition_time.
+
+    The defaults are rough numbers for an ATS9360 on PCIe gen 2. A model
+    fitted to the stage timings of real (or simulated) acquisitions is
+    returned by from_timings.
+
+    Attributes:
+        trigger_period: time between the triggers of two records, None if
+            records are acquired back to back
+        dma_bytes_per_s: rate at which buffers are filled and transferred
+        dma_buffer_overhead: fixed time of the transfer of a buffer, which
+            makes many small buffers slower than a few large ones
+        buffer_overhead: fixed time of handing over and handling a buffer
+        handle_s_per_byte: time of handle_buffer per byte of a buffer
+        post_s_per_byte: time of post_acquire per byte left to process
+        latency_margin: time for which the allocated buffers should keep
+            the card busy while a buffer is handled late
+    """
+
+    trigger_period: Optional[float] = None
+    dma_bytes_per_s: float = 3.5e9
+    dma_buffer_overhead: float = 1e-5
+    buffer_overhead: float = 1e-4
+    handle_s_per_byte: float = 2e-10
+    post_s_per_byte: float = 1e-9
+    latency_margin: float = 0.01
+
+    @classmethod
+    def from_timings(cls, timings: Sequence[Dict[str, Any]],
+                     **kwargs) -> 'BufferTimingModel':
+        """
+        Fits the model to the stage timings of one or more acquisitions,
+        i.e. values of the 'timings' parameter of the controller with
+        'profile_stages' set. With acquisitions of different buffer sizes
+        the buffer overhead is fitted as well, otherwise the default is
+        kept. If no trigger_period is given the fitted transfer rate
+        includes the waiting for triggers.
+
+        Args:
+            timings: stage timings of the acquisitions
+            **kwargs: values of model attributes which are not fitted
+        """
+        model = cls(**kwargs)
+        handled = [timing['stages']['handle_buffer'] for timing in timings
+                   if 'handle_buffer' in timing['stages']]
+        if not handled:
+            raise ValueError('No handle_buffer stage in the timings, '
+                             'acquire with profile_stages set')
+        sizes = np.array([stage['bytes'] / stage['calls'] for stage in handled])
+        times = np.array([stage['time'] / stage['calls'] for stage in handled])
+        overhead = model.buffer_overhead
+        if len(np.unique(sizes)) > 1:
+            slope, intercept = np.polyfit(sizes, times, 1)
+            handle_s_per_byte = max(float(slope), 0.0)
+            overhead = max(float(intercept), 0.0)
+        else:
+            handle_s_per_byte = max(float(np.mean(times)) - overhead,
+                                    0.0) / sizes[0]
+
+        total_bytes = sum(stage['bytes'] for stage in handled)
+        dma_wait = sum(timing['stages'].get('dma_wait', {}).get('time', 0.0)
+                       for timing in timings)
+        dma_bytes_per_s = model.dma_bytes_per_s
+        if dma_wait > 0:
+            dma_bytes_per_s = total_bytes / dma_wait
+
+        post_time = 0.0
+        post_bytes = 0
+        for timing in timings:
+            if 'post_acquire' in timing['stages']:
+                post_time += timing['stages']['post_acquire']['time']
+                post_bytes += timing['allocations'].get('buffer', 0)
+        post_s_per_byte = model.post_s_per_byte
+        if post_bytes > 0:
+            post_s_per_byte = post_time / post_bytes
+
+        return model._replace(dma_bytes_per_s=dma_bytes_per_s,
+                              buffer_overhead=overhead,
+                              handle_s_per_byte=handle_s_per_byte,
+                              post_s_per_byte=post_s_per_byte)
+
+
+class BufferGeometry(NamedTuple):
+    """
+    Buffer geometry of an acquisition and its expected duration.
+    """
+
+    records_per_buffer: int
+    buffers_per_acquisition: int
+    allocated_buffers: int
+    expected_time: float
+
+
+def expected_acquisition_time(model: BufferTimingModel,
+                              records_per_buffer: int,
+                              buffers_per_acquisition: int,
+                              allocated_buffers: int,
+                              samples_per_record: int,
+                              sample_rate: float,
+                              number_of_channels: int=1,
+                              average_buffers: bool=True) -> float:
+    """
+    Expected duration of an acquisition.
+
+    With more than one allocated buffer the card fills the next buffer
+    while a buffer is handled, so each buffer takes the longer of the two.
+    With a single allocated buffer they alternate. Buffer averaged data
+    leaves a single 64 bit sum buffer for post_acquire, otherwise all
+    buffers are processed.
+    """
+    bytes_per_buffer = (records_per_buffer * samples_per_record *
+                        number_of_channels * 2)
+    record_time = model.trigger_period or samples_per_record / sample_rate
+    fill = _fill_time(model, records_per_buffer, bytes_per_buffer,
+                      record_time)
+    handle = model.buffer_overhead + model.handle_s_per_byte * bytes_per_buffer
+    if allocated_buffers > 1:
+        time = fill + (buffers_per_acquisition - 1) * max(fill, handle) + handle
+    else:
+        time = buffers_per_acquisition * (fill + handle)
+    if average_buffers:
+        post_bytes = 4 * bytes_per_buffer
+    else:
+        post_bytes = buffers_per_acquisition * bytes_per_buffer
+    return time + model.post_s_per_byte * post_bytes
+
+
+def optimal_allocated_buffers(model: BufferTimingModel,
+                              records_per_buffer: int,
+                              buffers_per_acquisition: int,
+                              samples_per_record: int,
+                              sample_rate: float,
+                              number_of_channels: int=1,
+                              max_allocated_bytes: int=512 * 1024**2,
+                              max_allocated_buffers: int=64) -> int:
+    """
+    Number of buffers to allocate such that the filled buffers cover the
+    latency margin of the model, at most max_allocated_buffers or as many
+    as fit in max_allocated_bytes. If possible at least two are allocated
+    to overlap the transfer with the handling of the buffers.
+
+    Raises:
+        ValueError: if a single buffer doesn't fit in max_allocated_bytes
+    """
+    bytes_per_buffer = (records_per_buffer * samples_per_record *
+                        number_of_channels * 2)
+    fitting = max_allocated_bytes // bytes_per_buffer
+    if fitting < 1:
+        raise ValueError('A buffer of {} bytes does not fit in {} bytes, '
+                         'use fewer records per buffer'.format(
+                             bytes_per_buffer, max_allocated_bytes))
+    if buffers_per_acquisition <= 1:
+        return 1
+    record_time = model.trigger_period or samples_per_record / sample_rate
+    fill = _fill_time(model, records_per_buffer, bytes_per_buffer,
+                      record_time)
+    allocated = max(math.ceil(model.latency_margin / fill) + 1, 2)
+    return min(allocated, buffers_per_acquisition, max_allocated_buffers,
+               fitting)
+
+
+def optimize_buffer_geometry(model: BufferTimingModel,
+                             num_averages: int,
+                             samples_per_record: int,
+                             sample_rate: float,
+                             max_samples: int,
+                             number_of_channels: int=1,
+                             max_allocated_bytes: int=512 * 1024**2
+                             ) -> BufferGeometry:
+    """
+    The split of num_averages records averaged over records and buffers
+    into records_per_buffer and buffers_per_acquisition, and the number of
+    allocated buffers, with the shortest expected acquisition time.
+
+    Exact splits are considered as well as splits into a small number of
+    buffers which acquire slightly more than num_averages records. Splits
+    with buffers larger than max_allocated_bytes are skipped.
+
+    Args:
+        model: timing model of the acquisition
+        num_averages: number of records to average
+        samples_per_record: samples per record
+        sample_rate: sample rate of the Alazar
+        max_samples: maximum number of samples per buffer of the Alazar
+        number_of_channels: number of acquired Alazar channels
+        max_allocated_bytes: maximum memory of the allocated buffers
+    """
+    bytes_per_record = samples_per_record * number_of_channels * 2
+    if bytes_per_record > max_allocated_bytes:
+        raise ValueError('A record of {} bytes does not fit in {} '
+                         'bytes'.format(bytes_per_record, max_allocated_bytes))
+    max_records = max(1, min(num_averages, max_samples // samples_per_record))
+    max_records = min(max_records, max_allocated_bytes // bytes_per_record)
+    candidates = set(_divisors(num_averages))
+    candidates.update(math.ceil(num_averages / buffers)
+                      for buffers in range(1, 65))
+    best = None
+    for records in sorted(candidates):
+        if records > max_records:
+            continue
+        buffers = math.ceil(num_averages / records)
+        allocated = optimal_allocated_buffers(model, records, buffers,
+                                              samples_per_record, sample_rate,
+                                              number_of_channels,
+                                              max_allocated_bytes)
+        time = expected_acquisition_time(model, records, buffers, allocated,
+                                         samples_per_record, sample_rate,
+                                         number_of_channels)
+        if best is None or time < best.expected_time:
+            best = BufferGeometry(records, buffers, allocated, time)
+    logger.debug('optimal buffer geometry for {} averages: {}'.format(
+        num_averages, best))
+    return best
+
+
+def _fill_time(model: BufferTimingModel, records_per_buffer: int,
+               bytes_per_buffer: int, record_time: float) -> float:
+    return (max(records_per_buffer * record_time,
+                bytes_per_buffer / model.dma_bytes_per_s) +
+            model.dma_buffer_overhead)
+
+
+def _divisors(number: int) -> List[int]:
+    divisors = []
+    for i in range(1, int(math.sqrt(number)) + 1):
+        if number % i == 0:
+            divisors += [i, number // i]
+    return divisors
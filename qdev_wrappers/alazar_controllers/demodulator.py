@@ -1,8 +1,104 @@
 import numpy as np
 from scipy import signal
+from collections import OrderedDict
+from functools import lru_cache
+import threading
 import logging
 logger = logging.getLogger(__name__)
 
+# filter types as used in the 'filter' entry of the filter settings
+FILTER_WIN = 0
+FILTER_LS = 1
+FILTER_AVE = 2
+# 3 is not used, 'ham' is the same filter as 'win'
+FILTER_POLY = 4
+FILTER_CIC = 5
+
+# filters which output at a reduced rate
+decimating_filters = (FILTER_POLY, FILTER_CIC)
+
+
+def decimation_factor(filter_settings) -> int:
+    """
+    Factor by which the filter described by filter_settings reduces
+    the sample rate of the filtered signal.
+    """
+    if filter_settings['filter'] in decimating_filters:
+        return filter_settings['decimation']
+    return 1
+
+
+def _match_precision(fir_coef, rec):
+    """
+    Casts the filter coefficients to single precision if rec is single
+    precision such that filtering doesn't upcast the data.
+    """
+    if np.result_type(rec, np.float32) in (np.float32, np.complex64):
+        return fir_coef.astype(np.float32)
+    return fir_coef
+
+
+def _read_only(fir_coef):
+    # the coefficients are shared between callers via the cache
+    fir_coef.setflags(write=False)
+    return fir_coef
+
+
+@lru_cache(maxsize=128)
+def fir_win(cutoff, sample_rate, numtaps):
+    """
+    Coefficients of the FIR window low pass filter used by filter_win
+
+    Args:
+        cutoff: cutoff frequency
+        sample_rate: sampling rate
+        numtaps: number of frequency comppnents to use in the filer
+    """
+    nyq_rate = sample_rate / 2.
+    fir_coef = signal.firwin(numtaps, cutoff / nyq_rate)
+    return _read_only(fir_coef)
+
+
+@lru_cache(maxsize=128)
+def fir_ls(cutoff, sample_rate, numtaps):
+    """
+    Coefficients of the FIR least squares low pass filter used by
+    filter_ls. The pass band extends to cutoff and the stop band starts
+    at twice the cutoff.
+
+    Args:
+        cutoff: cutoff frequency
+        sample_rate: sampling rate
+        numtaps: number of frequency comppnents to use in the filer,
+            must be odd
+    """
+    if numtaps % 2 == 0:
+        raise ValueError('least squares filter needs an odd number of '
+                         'taps, got {}'.format(numtaps))
+    nyq_rate = sample_rate / 2.
+    bands = (0, cutoff / nyq_rate, min(2 * cutoff / nyq_rate, 1), 1)
+    fir_coef = signal.firls(numtaps, bands, (1, 1, 0, 0))
+    # normalise to unit gain at dc like the window filters
+    return _read_only(fir_coef / np.sum(fir_coef))
+
+
+@lru_cache(maxsize=128)
+def fir_cic(decimation, order):
+    """
+    Coefficients of the FIR filter equivalent to a CIC filter, i.e.
+    a boxcar of length decimation convolved order times with itself
+    and normalised to unit gain at dc.
+
+    Args:
+        decimation: decimation factor of the CIC filter
+        order: number of integrator and comb stages
+    """
+    fir_coef = np.ones(1)
+    for _ in range(order):
+        fir_coef = np.convolve(fir_coef, np.ones(decimation))
+    return _read_only(fir_coef / decimation**order)
+
+
 def filter_win(rec, cutoff, sample_rate, numtaps, axis=-1):
     """
     low pass filter, returns filtered signal using FIR window
@@ -15,9 +111,9 @@ def filter_win(rec, cutoff, sample_rate, numtaps, axis=-1):
         numtaps: number of frequency comppnents to use in the filer
         axis: axis of record to apply filter along
     """
-    nyq_rate = sample_rate / 2.
-    fir_coef = signal.firwin(numtaps, cutoff / nyq_rate)
-    filtered_rec = signal.lfilter(fir_coef, [1.0], rec, axis=axis)
+    fir_coef = _match_precision(fir_win(cutoff, sample_rate, numtaps), rec)
+    filtered_rec = signal.lfilter(fir_coef, np.ones(1, dtype=fir_coef.dtype),
+                                  rec, axis=axis)
     return filtered_rec
 
 
@@ -33,119 +129,300 @@ def filter_ls(rec, cutoff, sample_rate, numtaps, axis=-1):
         numtaps: number of frequency comppnents to use in the filer
         axis: axis of record to apply filter along
     """
-    raise NotImplementedError
+    fir_coef = _match_precision(fir_ls(cutoff, sample_rate, numtaps), rec)
+    filtered_rec = signal.lfilter(fir_coef, np.ones(1, dtype=fir_coef.dtype),
+                                  rec, axis=axis)
+    return filtered_rec
 
 
-def filter_ham(rec, cutoff, sample_rate, numtaps):
-    raise NotImplementedError
-    # sample_rate = self.sample_rate
-    # nyq_rate = sample_rate / 2.
-    # fir_coef = signal.firwin(numtaps,
-    #                          cutoff / nyq_rate,
-    #                          window="hamming")
-    # filtered_rec = 2 * signal.lfilter(fir_coef, 1.0, rec)
-    # return filtered_rec
+def filter_ham(rec, cutoff, sample_rate, numtaps, axis=-1):
+    """
+    low pass filter, returns filtered signal using FIR
+    hamming window filter. This is the same filter as filter_win as
+    signal.firwin uses a hamming window by default.
+
+    Args:
+        rec: record to filter
+        cufoff: cutoff frequency
+        sample_rate: sampling rate
+        numtaps: number of frequency comppnents to use in the filer
+        axis: axis of record to apply filter along
+    """
+    return filter_win(rec, cutoff, sample_rate, numtaps, axis=axis)
+
+
+def filter_poly(rec, cutoff, sample_rate, numtaps, decimation, axis=-1):
+    """
+    decimating low pass filter, returns the signal filtered with the
+    FIR window filter of filter_win and decimated by decimation using
+    a polyphase implementation, i.e. only the output samples which are
+    kept are computed.
+
+    Args:
+        rec: record to filter
+        cufoff: cutoff frequency
+        sample_rate: sampling rate
+        numtaps: number of frequency comppnents to use in the filer
+        decimation: decimation factor
+        axis: axis of record to apply filter along
+    """
+    fir_coef = _match_precision(fir_win(cutoff, sample_rate, numtaps), rec)
+    num_out = -(-rec.shape[axis] // decimation)
+    filtered_rec = signal.upfirdn(fir_coef, rec, up=1, down=decimation,
+                                  axis=axis)
+    return np.take(filtered_rec, np.arange(num_out), axis=axis)
+
+
+def filter_cic(rec, decimation, order, axis=-1):
+    """
+    decimating low pass filter, returns the signal filtered and decimated
+    by a cascaded integrator comb filter normalised to unit gain at dc.
+
+    Args:
+        rec: record to filter
+        decimation: decimation factor
+        order: number of integrator and comb stages
+        axis: axis of record to apply filter along
+    """
+    filtered_rec = np.moveaxis(rec, axis, -1)
+    # integrate in double precision to limit the accumulated rounding error
+    filtered_rec = filtered_rec.astype(np.result_type(filtered_rec, np.float64))
+    for _ in range(order):
+        filtered_rec = np.cumsum(filtered_rec, axis=-1)
+    filtered_rec = filtered_rec[..., ::decimation]
+    zeros = np.zeros(filtered_rec.shape[:-1] + (1,))
+    for _ in range(order):
+        filtered_rec = np.diff(np.concatenate((zeros, filtered_rec),
+                                              axis=-1), axis=-1)
+    filtered_rec = filtered_rec / decimation**order
+    return np.moveaxis(filtered_rec, -1, axis).astype(
+        np.result_type(rec, np.float32), copy=False)
 
 class Demodulator:
+    """
+    Software demodulator for one or more demodulation frequencies.
+
+    The reference oscillator is stored once as a complex array of shape
+    (num_demods, samples_per_record) and broadcast against the records so
+    the I/Q result is obtained in a single complex pass. When integrating
+    over samples the low pass filter followed by the mean over the
+    integration window is collapsed into one precomputed weight vector
+    per demodulation frequency so that the integration is a single
+    matrix-vector product.
+
+    With a decimating filter ('poly' or 'cic') non integrated traces are
+    returned at the sample rate divided by the decimation factor.
 
+    Instead of the mean over the integration window the integrated value
+    can be a weighted sum of the filtered samples in the window, e.g. with
+    matched filter weights (see matched_filter_weights). The sample
+    weights are folded into the same weight vector so applying them costs
+    nothing extra.
 
+    Args:
+        samples_per_record: number of samples in each record
+        sample_rate: rate with which the data is sampled
+        filter_settings: dict with the filter type, numtaps and for the
+            decimating filters decimation and cic_order
+        demod_freqs: demodulation frequencies
+        integrate_samples: whether to integrate over the samples
+        cutoff: cutoff frequency of the low pass filter, defaults to a
+            tenth of the largest demodulation frequency
+    """
 
     def __init__(self,
-                 buffers_per_acquisition: int,
-                 records_per_buffer: int,
                  samples_per_record: int,
                  sample_rate: float,
                  filter_settings,
                  demod_freqs,
-                 average_buffers: bool=True,
-                 average_records: bool=True,
-                 integrate_samples: bool=True):
+                 integrate_samples: bool=True,
+                 cutoff: float=None):
 
-        self.filter_settings = filter_settings
+        self.filter_settings = dict(filter_settings)
         self.sample_rate = sample_rate
-        if average_buffers:
-            len_buffers = 1
-        else:
-            len_buffers = buffers_per_acquisition
-
-        if average_records:
-            len_records = 1
-        else:
-            len_records = records_per_buffer
-
-        num_demods = len(demod_freqs)
+        self.samples_per_record = samples_per_record
         self.demod_freqs = np.array(demod_freqs)
-        mat_shape = (num_demods, len_buffers,
-                     len_records, samples_per_record)
-        self.mat_shape = mat_shape
-        integer_list = np.arange(samples_per_record)
-        integer_mat = (np.outer(np.ones(len_buffers),
-                                np.outer(np.ones(len_records), integer_list)))
-        angle_mat = 2 * np.pi * \
-                    np.outer(demod_freqs, integer_mat).reshape(mat_shape) / sample_rate
-        self.cos_mat = np.cos(angle_mat)
-        self.sin_mat = np.sin(angle_mat)
         self.integrate_samples = integrate_samples
+        if cutoff is None:
+            cutoff = max(self.demod_freqs) / 10
+        self.cutoff = cutoff
+        angles = (2 * np.pi * np.outer(self.demod_freqs,
+                                       np.arange(samples_per_record)) /
+                  sample_rate)
+        self.reference = np.exp(1j * angles)
+        self.decimation = decimation_factor(self.filter_settings)
+        self._integration_weights = {}
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by the reference and the cached integration weights
+        """
+        return (self.reference.nbytes +
+                sum(weights.nbytes for weights in
+                    self._integration_weights.values()))
 
-    def demodulate(self, volt_rec, int_delay, int_time):
+    def demodulate(self, volt_rec, int_delay, int_time, sample_weights=None):
         """
-        Applies low bandpass filter and demodulation fit,
-        and integration limits to samples array
+        Applies demodulation fit, low bandpass filter and (if integrating)
+        the integration limits to samples array
 
         Args:
-            record (numpy array): record from alazar to be multiplied
-                                  with the software signal, filtered and limited
-                                  to ifantegration limits shape = (samples_taken, )
+            volt_rec (numpy array): records to be multiplied with the
+                software signal, filtered and limited to integration
+                limits. The last axis is the samples axis.
+            int_delay: time from the start of the record at which to
+                start integrating
+            int_time: time over which to integrate
+            sample_weights: optional complex weights of the filtered
+                samples for each demodulation frequency (or None for the
+                mean), see integration_weights
 
         Returns:
-            re_limited (numpy array): shape = (demod_length, samples_after_limiting)
-            im_limited (numpy array): shape = (demod_length, samples_after_limiting)
+            demodulated (complex numpy array of the same precision as
+                volt_rec): shape =
+                (demod_length,) + volt_rec.shape[:-1] if integrating and
+                (demod_length,) + volt_rec.shape otherwise
         """
+        if self.integrate_samples:
+            weights = self.integration_weights(int_delay, int_time,
+                                               sample_weights)
+            # one real matrix product for both quadratures
+            integrated = np.dot(volt_rec,
+                                weights.astype(volt_rec.dtype, copy=False))
+            num_demods = len(self.demod_freqs)
+            demodulated = (integrated[..., :num_demods] +
+                           1j * integrated[..., num_demods:])
+            return np.moveaxis(demodulated, -1, 0)
 
-        # volt_rec to matrix and multiply with demodulation signal matrices
-        demod_length = len(self.demod_freqs)
-        volt_rec_mat = np.outer(np.ones(demod_length), volt_rec).reshape(self.mat_shape)
-        re_mat = np.multiply(volt_rec_mat, self.cos_mat)
-        im_mat = np.multiply(volt_rec_mat, self.sin_mat)
-
+        reference_shape = ((len(self.demod_freqs),) +
+                           (1,) * (volt_rec.ndim - 1) +
+                           (self.samples_per_record,))
+        reference = self.reference.astype(
+            np.result_type(volt_rec, np.complex64), copy=False)
+        demod_mat = volt_rec[np.newaxis] * reference.reshape(reference_shape)
         # filter out higher freq component
-        cutoff = max(self.demod_freqs)/10
-        if self.filter_settings['filter'] == 0:
-            re_filtered = filter_win(re_mat, cutoff,
-                                     self.sample_rate,
-                                     self.filter_settings['numtaps'],
-                                     axis=-1)
-            im_filtered = filter_win(im_mat, cutoff,
-                                     self.sample_rate,
-                                     self.filter_settings['numtaps'],
-                                     axis=-1)
-        elif self.filter_settings['filter'] == 1:
-            re_filtered = filter_ls(re_mat, cutoff,
-                                    self.sample_rate,
-                                    self.filter_settings['numtaps'],
-                                    axis=-1)
-            im_filtered = filter_ls(im_mat, cutoff,
-                                    self.sample_rate,
-                                    self.filter_settings['numtaps'],
-                                    axis=-1)
-        elif self.filter_settings['filter'] == 2:
-            re_filtered = re_mat
-            im_filtered = im_mat
+        return self._filter(demod_mat)
+
+    def integration_weights(self, int_delay, int_time,
+                            sample_weights=None) -> np.ndarray:
+        """
+        Weights which applied to a record as a dot product give the
+        demodulated, filtered and integrated value of the record.
+
+        For a FIR filter b the weighted sum over the window
+        [beginning, end) of the filtered signal y[n] = sum_k b[k] x[n-k]
+        is sum_m w[m] x[m] with w[m] = sum_{n in window} v[n] b[n-m]. For
+        the mean v[n] = 1 / (end - beginning). For decimating filters only
+        the samples n in the window which are kept after decimation
+        contribute.
+
+        Args:
+            int_delay: time from the start of the record at which to
+                start integrating
+            int_time: time over which to integrate
+            sample_weights: sequence with for each demodulation frequency
+                None (the mean) or the complex weights v of the samples of
+                the non integrated (decimated) trace. Only the weights
+                within the window are used and they are normalised such
+                that the sum of their magnitudes is one.
+
+        Returns:
+            weights: real array of shape (samples_per_record,
+                2 * demod_length) holding the weights for the real parts
+                followed by the weights for the imaginary parts
+        """
+        beginning = int(int_delay * self.sample_rate)
+        end = min(beginning + int(int_time * self.sample_rate),
+                  self.samples_per_record)
+        if sample_weights is not None and all(weights is None for weights
+                                              in sample_weights):
+            sample_weights = None
+        if sample_weights is None:
+            key = (beginning, end)
         else:
-            raise RuntimeError("Filter setting: {} not implemented".format(self.filter_settings['filter']))
+            key = (beginning, end) + tuple(
+                None if weights is None else weights.tobytes()
+                for weights in sample_weights)
+        if key not in self._integration_weights:
+            fir_coef = self._fir_coefficients()
+            # samples kept by the (decimating) filter within the window
+            kept = np.arange(-(-beginning // self.decimation) * self.decimation,
+                             end, self.decimation)
+            if len(kept) == 0:
+                raise ValueError('integration window of {} s from {} s '
+                                 'contains no samples of the record, check '
+                                 'int_delay and int_time'.format(int_time,
+                                                                 int_delay))
+            num_demods = len(self.demod_freqs)
+            window = np.zeros((num_demods, self.samples_per_record),
+                              dtype=np.complex128)
+            for i in range(num_demods):
+                if sample_weights is None or sample_weights[i] is None:
+                    window[i, kept] = 1 / len(kept)
+                else:
+                    window[i, kept] = self._window_weights(sample_weights[i],
+                                                           kept)
+            filtered_window = np.zeros_like(window)
+            for k, coef in enumerate(fir_coef[:self.samples_per_record]):
+                filtered_window[:, :self.samples_per_record - k] += (
+                    coef * window[:, k:])
+            complex_weights = filtered_window * self.reference
+            self._integration_weights[key] = np.concatenate(
+                (complex_weights.real, complex_weights.imag)).T.copy()
+        return self._integration_weights[key]
 
-        if self.integrate_samples:
-            # apply integration limits
-            beginning = int(int_delay * self.sample_rate)
-            end = beginning + int(int_time * self.sample_rate)
+    def _window_weights(self, sample_weights, kept) -> np.ndarray:
+        """
+        The sample weights of the kept samples in the integration window
+        normalised to a sum of magnitudes of one.
+        """
+        num_out = -(-self.samples_per_record // self.decimation)
+        sample_weights = np.asarray(sample_weights)
+        if sample_weights.shape != (num_out,):
+            raise ValueError('sample weights must have one weight per sample '
+                             'of the demodulated trace, expected shape {} '
+                             'got {}'.format((num_out,), sample_weights.shape))
+        window_weights = sample_weights[kept // self.decimation]
+        total = np.sum(np.abs(window_weights))
+        if total == 0:
+            raise ValueError('sample weights are zero within the integration '
+                             'window')
+        return window_weights / total
 
-            re_limited = re_filtered[..., beginning:end]
-            im_limited = im_filtered[..., beginning:end]
+    def _fir_coefficients(self) -> np.ndarray:
+        filter_type = self.filter_settings['filter']
+        numtaps = self.filter_settings['numtaps']
+        if filter_type in (FILTER_WIN, FILTER_POLY):
+            return fir_win(self.cutoff, self.sample_rate, numtaps)
+        elif filter_type == FILTER_LS:
+            return fir_ls(self.cutoff, self.sample_rate, numtaps)
+        elif filter_type == FILTER_AVE:
+            return np.ones(1)
+        elif filter_type == FILTER_CIC:
+            return fir_cic(self.decimation, self.filter_settings['cic_order'])
         else:
-            re_limited = re_filtered
-            im_limited = im_filtered
+            raise RuntimeError("Filter setting: {} not implemented".format(filter_type))
 
-        return re_limited, im_limited
+    def _filter(self, demod_mat):
+        filter_type = self.filter_settings['filter']
+        numtaps = self.filter_settings['numtaps']
+        if filter_type == FILTER_WIN:
+            return filter_win(demod_mat, self.cutoff, self.sample_rate,
+                              numtaps, axis=-1)
+        elif filter_type == FILTER_LS:
+            return filter_ls(demod_mat, self.cutoff, self.sample_rate,
+                             numtaps, axis=-1)
+        elif filter_type == FILTER_AVE:
+            return demod_mat
+        elif filter_type == FILTER_POLY:
+            return filter_poly(demod_mat, self.cutoff, self.sample_rate,
+                               numtaps, self.decimation, axis=-1)
+        elif filter_type == FILTER_CIC:
+            return filter_cic(demod_mat, self.decimation,
+                              self.filter_settings['cic_order'], axis=-1)
+        else:
+            raise RuntimeError("Filter setting: {} not implemented".format(filter_type))
 
     @staticmethod
     def verify_demod_freq(value, sample_rate, int_time):
@@ -186,4 +463,119 @@ class Demodulator:
                             'increase sampling rate or decrease '
                             'demodulation frequency'.format(oversampling))
 
-        return isValid
\ No newline at end of file
+        return isValid
+
+
+def matched_filter_weights(ground, excited) -> np.ndarray:
+    """
+    Matched filter sample weights (see Demodulator.integration_weights)
+    from the averaged demodulated traces of the ground and excited state,
+    e.g. two records of a demodulated records_vs_samples_trace.
+
+    The weights are the complex conjugate of the difference of the traces,
+    which maximises the separation of the integrated states over white
+    noise and rotates it onto the real axis. Samples where the traces
+    are identical, e.g. before the resonator rings up, get no weight.
+
+    Args:
+        ground: complex trace of the ground state
+        excited: complex trace of the excited state
+
+    Returns:
+        complex weights of the samples
+    """
+    ground = np.asarray(ground)
+    excited = np.asarray(excited)
+    if ground.shape != excited.shape or ground.ndim != 1:
+        raise ValueError('ground and excited must be traces of the same '
+                         'length, got shapes {} and {}'.format(ground.shape,
+                                                               excited.shape))
+    weights = np.conj(excited - ground)
+    scale = np.max(np.abs(weights))
+    if scale == 0:
+        raise ValueError('ground and excited traces are identical')
+    return weights / scale
+
+
+class DemodulatorCache:
+    """
+    Process wide least recently used cache of Demodulators, i.e. of the
+    demodulation references and integration weights, keyed by the
+    acquisition geometry. This avoids recomputing the references for
+    every point of a sweep where the demodulation settings don't change.
+
+    Args:
+        max_bytes: upper bound on the memory held by the cached
+            demodulators. The least recently used demodulators are
+            dropped once this is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._demodulators = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self,
+            samples_per_record: int,
+            sample_rate: float,
+            filter_settings,
+            demod_freqs,
+            integrate_samples: bool=True,
+            cutoff: float=None) -> Demodulator:
+        """
+        Returns a Demodulator for the given settings, creating it if it
+        is not in the cache. The arguments are the same as for
+        Demodulator.
+        """
+        key = (tuple(demod_freqs), sample_rate, samples_per_record,
+               tuple(sorted(filter_settings.items())), integrate_samples,
+               cutoff)
+        with self._lock:
+            demodulator = self._demodulators.get(key)
+            if demodulator is not None:
+                self.hits += 1
+                self._demodulators.move_to_end(key)
+            else:
+                self.misses += 1
+                demodulator = Demodulator(samples_per_record,
+                                          sample_rate,
+                                          filter_settings,
+                                          demod_freqs,
+                                          integrate_samples,
+                                          cutoff)
+                self._demodulators[key] = demodulator
+            self._evict()
+        return demodulator
+
+    @property
+    def nbytes(self) -> int:
+        return sum(demodulator.nbytes for demodulator
+                   in self._demodulators.values())
+
+    def info(self) -> dict:
+        """
+        Returns hits, misses, number of cached demodulators and memory
+        used.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._demodulators),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._demodulators.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self) -> None:
+        # always keep the most recently used demodulator
+        while len(self._demodulators) > 1 and self.nbytes > self.max_bytes:
+            key, _ = self._demodulators.popitem(last=False)
+            logger.debug("Dropping demodulator {} from cache".format(key))
+
+
+demodulator_cache = DemodulatorCache()
@@ -0,0 +1,174 @@
+import logging
+from typing import Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Discriminator:
+    """
+    Base class for single shot readout discriminators which assign a state
+    label to each integrated and demodulated IQ point.
+
+    Subclasses implement fit and classify.
+    """
+
+    num_states = 0
+
+    def fit(self, *iq_per_state: np.ndarray) -> 'Discriminator':
+        raise NotImplementedError
+
+    def classify(self, iq: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            iq: complex array of integrated IQ points (I + 1j*Q)
+
+        Returns:
+            integer array of the same shape as iq with the state labels
+        """
+        raise NotImplementedError
+
+    def counts(self, iq: np.ndarray, axis: int=0) -> np.ndarray:
+        """
+        Number of IQ points assigned to each state along axis
+
+        Args:
+            iq: complex array of integrated IQ points
+            axis: axis along which the points are counted
+
+        Returns:
+            integer array with the shape of iq without axis and with an
+            additional last axis of length num_states
+        """
+        labels = self.classify(iq)
+        return np.stack([np.count_nonzero(labels == state, axis=axis)
+                         for state in range(self.num_states)], axis=-1)
+
+    def populations(self, iq: np.ndarray, axis: int=0) -> np.ndarray:
+        """
+        Fraction of the IQ points assigned to each state along axis, see
+        counts.
+        """
+        return self.counts(iq, axis=axis) / iq.shape[axis]
+
+    @staticmethod
+    def _to_points(iq: np.ndarray) -> np.ndarray:
+        iq = np.asarray(iq)
+        return np.stack((iq.real, iq.imag), axis=-1)
+
+
+class LinearDiscriminator(Discriminator):
+    """
+    Two state discriminator which thresholds the projection of the IQ
+    points onto the linear discriminant (Fisher) axis. The threshold lies
+    halfway between the projected means of the two states.
+    """
+
+    num_states = 2
+
+    def __init__(self, axis: complex=None, threshold: float=None) -> None:
+        self.axis = axis
+        self.threshold = threshold
+
+    def fit(self, *iq_per_state: np.ndarray) -> 'LinearDiscriminator':
+        """
+        Args:
+            iq_per_state: complex arrays of IQ points measured after
+                preparing state 0 and state 1 respectively
+        """
+        if len(iq_per_state) != 2:
+            raise ValueError('LinearDiscriminator needs IQ points of exactly '
+                             'two states, got {}'.format(len(iq_per_state)))
+        points = [self._to_points(iq).reshape(-1, 2) for iq in iq_per_state]
+        means = [np.mean(p, axis=0) for p in points]
+        pooled_cov = sum(np.cov(p, rowvar=False) for p in points) / 2
+        direction = np.linalg.solve(pooled_cov, means[1] - means[0])
+        self.axis = complex(direction[0], direction[1])
+        projected = [np.dot(mean, direction) for mean in means]
+        self.threshold = float(np.mean(projected))
+        return self
+
+    def classify(self, iq: np.ndarray) -> np.ndarray:
+        if self.axis is None:
+            raise RuntimeError('Discriminator has not been fitted')
+        iq = np.asarray(iq)
+        projected = iq.real * self.axis.real + iq.imag * self.axis.imag
+        return (projected > self.threshold).astype(np.int8)
+
+
+class QuadraticDiscriminator(Discriminator):
+    """
+    Discriminator for any number of states which models the IQ points of
+    each state as a two dimensional Gaussian and assigns each point to
+    the state with the largest likelihood, i.e. quadratic discriminant
+    analysis. The Gaussians are fitted to points measured after preparing
+    each state, not to an unlabelled mixture.
+
+    Args:
+        means: complex mean of each state
+        covariances: 2x2 covariance matrix of each state
+        weights: prior probability of each state, uniform by default
+    """
+
+    def __init__(self,
+                 means: Sequence[complex]=None,
+                 covariances: Sequence[np.ndarray]=None,
+                 weights: Sequence[float]=None) -> None:
+        self.means = None
+        self.covariances = None
+        self.weights = None
+        if means is not None:
+            self._set_components(means, covariances, weights)
+
+    @property
+    def num_states(self) -> int:
+        return 0 if self.means is None else len(self.means)
+
+    def fit(self, *iq_per_state: np.ndarray) -> 'QuadraticDiscriminator':
+        """
+        Args:
+            iq_per_state: complex arrays of IQ points measured after
+                preparing each of the states in turn
+        """
+        means = []
+        covariances = []
+        for iq in iq_per_state:
+            points = self._to_points(iq).reshape(-1, 2)
+            mean = np.mean(points, axis=0)
+            means.append(complex(mean[0], mean[1]))
+            covariances.append(np.cov(points, rowvar=False))
+        self._set_components(means, covariances, None)
+        return self
+
+    def _set_components(self, means, covariances, weights) -> None:
+        num_states = len(means)
+        if weights is None:
+            weights = np.full(num_states, 1 / num_states)
+        self.means = np.asarray(means, dtype=complex)
+        self.covariances = np.asarray(covariances, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self._precisions = np.linalg.inv(self.covariances)
+        self._log_norms = (np.log(self.weights) -
+                           0.5 * np.log(np.linalg.det(self.covariances)))
+
+    def log_likelihoods(self, iq: np.ndarray) -> np.ndarray:
+        """
+        Log likelihood (up to a common constant) of each state for each IQ
+        point, the states are along the last axis.
+        """
+        if self.means is None:
+            raise RuntimeError('Discriminator has not been fitted')
+        points = self._to_points(iq)
+        log_likelihoods = np.empty(points.shape[:-1] + (self.num_states,))
+        for state in range(self.num_states):
+            mean = np.array((self.means[state].real, self.means[state].imag))
+            deviation = points - mean
+            mahalanobis = np.einsum('...i,ij,...j->...', deviation,
+                                    self._precisions[state], deviation)
+            log_likelihoods[..., state] = (self._log_norms[state] -
+                                           0.5 * mahalanobis)
+        return log_likelihoods
+
+    def classify(self, iq: np.ndarray) -> np.ndarray:
+        return np.argmax(self.log_likelihoods(iq), axis=-1).astype(np.int8)
@@ -0,0 +1,229 @@
+import logging
+from concurrent.futures import Future
+from functools import partial
+from typing import Sequence, Union, Tuple
+
+import numpy as np
+
+from qcodes import ArrayParameter, ChannelList
+from qcodes.instrument.channel import InstrumentChannel
+from qcodes.utils import validators as vals
+from .alazar_channel import AlazarChannel
+from .alazar_multidim_parameters import (AlazarMultiChannelParameter,
+                                         _read_only)
+
+logger = logging.getLogger(__name__)
+
+# parameters of the tones which change the shape or unit of their data
+_shape_parameters = ('demod_type', 'num_averages', 'records_per_buffer',
+                     'buffers_per_acquisition')
+
+
+class AlazarMultiplexedChannel(InstrumentChannel):
+    """
+    Frequency multiplexed readout of several resonators on one Alazar input.
+
+    Each tone is demodulated by one of the AlazarChannels in 'tones', which
+    share all settings but the demodulation frequency. The tones are
+    acquired together so the input is converted to volts once and all
+    tones are demodulated by a single Demodulator (one per processing
+    thread). When integrating over samples that is one matrix product of
+    the records with the integration weights of all tones, so each
+    additional tone only adds two columns to the product. The data of all
+    tones is returned as one array with the tones along the first axis.
+
+    The number of tones is fixed by the demodulation frequencies given
+    when the readout is created, the frequencies can be changed later
+    with 'demod_freqs' after which prepare_channel has to be run again
+    to update the setpoints. Discriminators and integration weights are set on
+    the individual tones.
+
+    Args:
+        parent: the ATSChannelController
+        name: name of the readout
+        demod_freqs: demodulation frequencies of the tones
+        alazar_channel: Alazar input of the feedline, 'A' or 'B'
+        average_buffers: whether to average over buffers
+        average_records: whether to average over records
+        integrate_samples: whether to integrate over samples
+    """
+
+    def __init__(self, parent, name: str,
+                 demod_freqs: Sequence[float],
+                 alazar_channel: str='A',
+                 average_buffers: bool=True,
+                 average_records: bool=True,
+                 integrate_samples: bool=True) -> None:
+        super().__init__(parent, name)
+        if len(demod_freqs) == 0:
+            raise ValueError('A multiplexed readout needs at least one tone')
+        self._average_buffers = average_buffers
+        self._average_records = average_records
+        self._integrate_samples = integrate_samples
+
+        tones = ChannelList(self, 'tones', AlazarChannel,
+                            multichan_paramclass=AlazarMultiChannelParameter)
+        for i in range(len(demod_freqs)):
+            # the tones are channels of the controller so that they can
+            # be acquired together like any other channels
+            tones.append(AlazarChannel(parent, '{}_tone{}'.format(name, i),
+                                       demod=True,
+                                       alazar_channel=alazar_channel,
+                                       average_buffers=average_buffers,
+                                       average_records=average_records,
+                                       integrate_samples=integrate_samples))
+        tones.lock()
+        self.add_submodule('tones', tones)
+
+        self.add_parameter('demod_freqs',
+                           label='demod freqs',
+                           unit='Hz',
+                           initial_value=list(demod_freqs),
+                           vals=vals.Lists(vals.Numbers(1e5, 500e6)),
+                           get_cmd=None, set_cmd=self._set_demod_freqs)
+        self.add_parameter('demod_type',
+                           label='demod type',
+                           initial_value='magnitude',
+                           vals=vals.Enum('magnitude', 'phase', 'real',
+                                          'imag', 'populations', 'std',
+                                          'snr'),
+                           get_cmd=None,
+                           set_cmd=partial(self._set_tones, 'demod_type'))
+        self.add_parameter('alazar_channel',
+                           label='Alazar Channel',
+                           initial_value=alazar_channel,
+                           vals=vals.Enum('A', 'B'),
+                           get_cmd=None,
+                           set_cmd=partial(self._set_tones, 'alazar_channel'))
+        self.add_parameter('num_averages',
+                           label='num averages',
+                           initial_value=1,
+                           vals=vals.Ints(min_value=1),
+                           get_cmd=None,
+                           set_cmd=partial(self._set_tones, 'num_averages'))
+        if not average_records:
+            self.add_parameter('records_per_buffer',
+                               label='records per buffer',
+                               initial_value=1,
+                               vals=vals.Ints(min_value=1),
+                               get_cmd=None,
+                               set_cmd=partial(self._set_tones,
+                                               'records_per_buffer'))
+        if not average_buffers:
+            self.add_parameter('buffers_per_acquisition',
+                               label='buffers per acquisition',
+                               initial_value=1,
+                               vals=vals.Ints(min_value=1),
+                               get_cmd=None,
+                               set_cmd=partial(self._set_tones,
+                                               'buffers_per_acquisition'))
+        self.add_parameter('data',
+                           label='mydata',
+                           unit='V',
+                           parameter_class=AlazarMultiplexedParameter)
+
+    def prepare_channel(self) -> None:
+        for tone in self.tones:
+            tone.prepare_channel()
+        self.data.set_setpoints_and_labels()
+
+    def _set_demod_freqs(self, value: Sequence[float]) -> None:
+        if len(value) != len(self.tones):
+            raise ValueError('The readout has {} tones, got {} demod freqs. '
+                             'Create a new readout to change the number of '
+                             'tones.'.format(len(self.tones), len(value)))
+        for tone, freq in zip(self.tones, value):
+            tone.demod_freq(freq)
+        # the frequencies are the setpoints of the data, which does not
+        # exist yet when the initial value is set
+        if 'data' in self.parameters:
+            self.data._stale_setpoints = True
+
+    def _set_tones(self, name: str, value) -> None:
+        for tone in self.tones:
+            tone.parameters[name].set(value)
+        if name in _shape_parameters and 'data' in self.parameters:
+            self.data._stale_setpoints = True
+
+
+class AlazarMultiplexedParameter(ArrayParameter):
+    """
+    Data of all tones of an AlazarMultiplexedChannel with the tones along
+    the first axis. The setpoints of the first axis are the demodulation
+    frequencies, the other axes are those of the data of a single tone.
+    """
+
+    # set by a pipelined sweep which then takes over the acquisition
+    pipeline = None
+
+    def __init__(self, name: str, instrument, label: str,
+                 unit: str) -> None:
+        super().__init__(name,
+                         shape=(1,),
+                         instrument=instrument,
+                         label=label,
+                         unit=unit,
+                         setpoint_names=('tone_freq',),
+                         setpoint_labels=('Tone frequency',),
+                         setpoint_units=('Hz',))
+        self._stale_setpoints = True
+
+    def set_setpoints_and_labels(self) -> None:
+        readout = self._instrument
+        freqs = _read_only(np.array(readout.demod_freqs.get(), dtype=float))
+        tone_data = readout.tones[0].data
+        tone_shape = tuple(getattr(tone_data, 'shape', ()))
+        tone_setpoints = tuple(getattr(tone_data, 'setpoints', None) or ())
+        self.shape = (len(freqs),) + tone_shape
+        self.unit = tone_data.unit
+        self.setpoints = (freqs,) + tuple(
+            _read_only(np.broadcast_to(setpoints,
+                                       (len(freqs),) + np.shape(setpoints)))
+            for setpoints in tone_setpoints)
+        # the data of a tone without setpoints is a plain Parameter
+        self.setpoint_names = (('tone_freq',) + tuple(
+            getattr(tone_data, 'setpoint_names', None) or ()))
+        self.setpoint_labels = (('Tone frequency',) + tuple(
+            getattr(tone_data, 'setpoint_labels', None) or ()))
+        self.setpoint_units = (('Hz',) + tuple(
+            getattr(tone_data, 'setpoint_units', None) or ()))
+        self._stale_setpoints = False
+
+    def get_raw(self) -> np.ndarray:
+        if self.pipeline is not None:
+            return self.pipeline.measure(self)
+        return _stack_tones(self._acquire(deferred=False))
+
+    def get_async(self) -> Future:
+        """
+        Acquires the data and returns a future of the data which is
+        processed in a worker thread.
+        """
+        acquired = self._acquire(deferred=True)
+        stacked = Future()
+
+        def stack(future: Future) -> None:
+            try:
+                stacked.set_result(_stack_tones(future.result()))
+            except Exception as e:
+                stacked.set_exception(e)
+        acquired.add_done_callback(stack)
+        return stacked
+
+    def _acquire(self, deferred: bool):
+        readout = self._instrument
+        tones = list(readout.tones)
+        if self._stale_setpoints or any(tone._stale_setpoints
+                                        for tone in tones):
+            raise RuntimeError("Must run prepare channel before capturing data.")
+        cntrl = readout._parent
+        plan = cntrl.acquisition_plan(tones)
+        return cntrl.acquire_plan(plan, deferred=deferred)
+
+
+def _stack_tones(output: Union[np.ndarray, Tuple[np.ndarray, ...]]
+                 ) -> np.ndarray:
+    if isinstance(output, tuple):
+        return np.stack(output)
+    # a single tone is returned as a single array
+    return np.asarray(output)[np.newaxis]
@@ -0,0 +1,115 @@
+import logging
+from typing import Tuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RunningStatistics:
+    """
+    Incremental mean and variance (Welford/Chan) of a stream of equally
+    shaped arrays with optional fixed bin histograms of each element.
+
+    Complex data is supported, the variance is then the mean squared
+    distance from the mean in the complex (IQ) plane and the histogram of
+    each element is two dimensional over the real and imaginary part.
+
+    Args:
+        shape: shape of a single sample
+        complex_data: whether the samples are complex
+        histogram_bins: number of histogram bins, no histogram if None
+        histogram_range: (low, high) range of the histogram bins, used
+            for both the real and imaginary axis of complex data
+    """
+
+    def __init__(self, shape: Tuple[int, ...],
+                 complex_data: bool=False,
+                 histogram_bins: Optional[int]=None,
+                 histogram_range: Tuple[float, float]=(-1, 1)) -> None:
+        self.shape = tuple(shape)
+        self.complex_data = complex_data
+        self.histogram_bins = histogram_bins
+        self.histogram_range = tuple(histogram_range)
+        self.reset()
+
+    def reset(self) -> None:
+        dtype = np.complex128 if self.complex_data else np.float64
+        self.count = 0
+        self.mean = np.zeros(self.shape, dtype=dtype)
+        self._m2 = np.zeros(self.shape, dtype=np.float64)
+        if self.histogram_bins is None:
+            self.histogram = None
+        else:
+            bins = (self.histogram_bins,) * (2 if self.complex_data else 1)
+            self.histogram = np.zeros(self.shape + bins, dtype=np.int64)
+
+    @property
+    def bin_edges(self) -> Optional[np.ndarray]:
+        if self.histogram_bins is None:
+            return None
+        return np.linspace(*self.histogram_range, self.histogram_bins + 1)
+
+    def update(self, samples: np.ndarray) -> None:
+        """
+        Adds a batch of samples, the first axis of samples is the sample
+        axis and the remaining axes must match shape.
+        """
+        samples = np.asarray(samples)
+        batch_count = samples.shape[0]
+        if batch_count == 0:
+            return
+        batch_mean = np.mean(samples, axis=0)
+        batch_m2 = np.sum(np.abs(samples - batch_mean)**2, axis=0)
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * (batch_count / total)
+        self._m2 += batch_m2 + np.abs(delta)**2 * (self.count * batch_count / total)
+        self.count = total
+        if self.histogram is not None:
+            self._update_histogram(samples)
+
+    def _update_histogram(self, samples: np.ndarray) -> None:
+        low, high = self.histogram_range
+        bins = self.histogram_bins
+        if self.complex_data:
+            parts = (samples.real, samples.imag)
+        else:
+            parts = (samples,)
+        in_range = np.ones(samples.shape, dtype=bool)
+        index = np.zeros(samples.shape, dtype=np.int64)
+        for part in parts:
+            part_index = np.floor((part - low) * (bins / (high - low)))
+            # values equal to the upper edge go in the last bin
+            part_index[part == high] = bins - 1
+            in_range &= (part_index >= 0) & (part_index < bins)
+            index = index * bins + np.where(in_range, part_index, 0).astype(np.int64)
+        elements = np.broadcast_to(np.arange(int(np.prod(self.shape))).reshape(self.shape),
+                                   samples.shape)
+        flat_index = elements[in_range] * bins**len(parts) + index[in_range]
+        self.histogram += np.bincount(flat_index,
+                                      minlength=self.histogram.size
+                                      ).reshape(self.histogram.shape)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Unbiased variance of the samples"""
+        if self.count < 2:
+            return np.full(self.shape, np.nan)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        """Standard deviation of the samples"""
+        return np.sqrt(self.variance)
+
+    @property
+    def standard_error(self) -> np.ndarray:
+        """Standard deviation of the mean of the samples"""
+        return self.std / np.sqrt(self.count)
+
+    @property
+    def snr(self) -> np.ndarray:
+        """Magnitude of the mean over the standard deviation of the samples"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.abs(self.mean) / self.std
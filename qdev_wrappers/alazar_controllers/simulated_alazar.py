@@ -0,0 +1,213 @@
+import logging
+import time
+from typing import Sequence, Tuple, Dict, Optional
+
+import numpy as np
+
+from qcodes import Instrument
+from qcodes.instrument_drivers.AlazarTech.ATS import AlazarTech_ATS
+from qcodes.utils import validators as vals
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedATS9360(AlazarTech_ATS):
+    """
+    Software stand-in for an AlazarTech ATS9360 which can be used with the
+    acquisition controllers without a card in the machine.
+
+    acquire drives the callbacks of the acquisition controller exactly like
+    the real driver: the acquisition parameters are set from the kwargs,
+    pre_start_capture and pre_acquire are called, handle_buffer is called
+    with every buffer and the return value of post_acquire is returned.
+
+    The buffers contain a sum of tones plus Gaussian noise on each channel,
+    sampled as 12 bit codes left aligned in 16 bit words and interleaved
+    between the acquired channels just like the card does. A number of
+    noisy buffers (noise_buffers) is generated when the acquisition starts
+    and reused cyclically, so the generation of the data is not part of
+    the timing of the controller callbacks in last_timing.
+
+    It is an AlazarTech_ATS so that the acquisition controllers accept it,
+    but the initialisation of the driver, which loads the DLL and opens
+    the board, is skipped. Only the parameters and methods used by the
+    controllers are simulated.
+
+    Args:
+        name: name of the instrument
+        max_samples: maximum number of samples per buffer reported by
+            get_idn
+        seed: seed of the random number generator of the noise
+        **kwargs: kwargs are forwarded to the Instrument base class
+    """
+
+    samples_divisor = 128
+    input_range_volts = 0.4
+    bits_per_sample = 12
+
+    def __init__(self, name: str, max_samples: int=4294967294,
+                 seed: Optional[int]=None, **kwargs) -> None:
+        # skip AlazarTech_ATS.__init__ which needs the DLL and a card
+        Instrument.__init__(self, name, **kwargs)
+        self._ATS_dll = None
+        self._handle = None
+        self.buffer_list = []
+        self._max_samples = max_samples
+        self._rng = np.random.RandomState(seed)
+        self._tones = {'A': [], 'B': []}
+        self.last_timing = {}
+
+        self.add_parameter(name='clock_source',
+                           initial_value='INTERNAL_CLOCK',
+                           vals=vals.Enum('INTERNAL_CLOCK',
+                                          'EXTERNAL_CLOCK_10MHz_REF'),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='sample_rate',
+                           unit='S/s',
+                           initial_value=500000000,
+                           vals=vals.Ints(1000, 1800000000),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='external_sample_rate',
+                           unit='S/s',
+                           initial_value=500000000,
+                           vals=vals.Ints(300000000, 1800000000),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='decimation',
+                           initial_value=1,
+                           vals=vals.Ints(0, 100000),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='channel_selection',
+                           initial_value='AB',
+                           vals=vals.Enum('A', 'B', 'AB'),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='samples_per_record',
+                           initial_value=1024,
+                           vals=vals.Multiples(divisor=self.samples_divisor,
+                                               min_value=256),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='records_per_buffer',
+                           initial_value=1,
+                           vals=vals.Ints(min_value=1),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='buffers_per_acquisition',
+                           initial_value=1,
+                           vals=vals.Ints(min_value=1),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='allocated_buffers',
+                           initial_value=4,
+                           vals=vals.Ints(min_value=1),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='noise',
+                           label='noise',
+                           unit='V',
+                           docstring='Standard deviation of the Gaussian '
+                                     'noise added to each sample.',
+                           initial_value=0.01,
+                           vals=vals.Numbers(min_value=0),
+                           get_cmd=None, set_cmd=None)
+        self.add_parameter(name='noise_buffers',
+                           label='noise buffers',
+                           docstring='Number of buffers with independent '
+                                     'noise generated per acquisition.',
+                           initial_value=4,
+                           vals=vals.Ints(min_value=1),
+                           get_cmd=None, set_cmd=None)
+
+    def get_idn(self) -> Dict[str, object]:
+        return {'vendor': 'AlazarTech',
+                'model': 'ATS9360',
+                'serial': 'simulated',
+                'firmware': None,
+                'max_samples': self._max_samples,
+                'bits_per_sample': self.bits_per_sample}
+
+    def get_sample_rate(self) -> float:
+        """
+        The number of samples per second of each channel, following the
+        clock source and decimation settings.
+        """
+        if self.clock_source.get() == 'EXTERNAL_CLOCK_10MHz_REF':
+            rate = self.external_sample_rate.get()
+        else:
+            rate = self.sample_rate.get()
+        decimation = self.decimation.get()
+        if decimation > 0:
+            rate = rate / decimation
+        return rate
+
+    def set_tones(self, channel: str,
+                  tones: Sequence[Tuple[float, float, float]]) -> None:
+        """
+        Sets the tones of the signal of a channel.
+
+        Args:
+            channel: 'A' or 'B'
+            tones: (frequency in Hz, amplitude in V, phase in rad) of each
+                tone
+        """
+        if channel not in self._tones:
+            raise ValueError('Unknown channel {}'.format(channel))
+        self._tones[channel] = [tuple(tone) for tone in tones]
+
+    def acquire(self, acquisition_controller, **kwargs):
+        """
+        Acquires simulated data, see the class docstring.
+
+        Args:
+            acquisition_controller: controller whose callbacks process the
+                buffers
+            **kwargs: values of the acquisition parameters of this
+                instrument to set before the acquisition
+        """
+        for key, value in kwargs.items():
+            if key not in self.parameters:
+                logger.debug('Ignoring acquire kwarg {} of the simulated '
+                             'ATS9360'.format(key))
+                continue
+            self.parameters[key].set(value)
+
+        buffers_per_acquisition = self.buffers_per_acquisition.get()
+        buffers = self._generate_buffers()
+
+        start = time.perf_counter()
+        acquisition_controller.pre_start_capture()
+        acquisition_controller.pre_acquire()
+        capture_started = time.perf_counter()
+        for buffer_number in range(buffers_per_acquisition):
+            acquisition_controller.handle_buffer(
+                buffers[buffer_number % len(buffers)], buffer_number)
+        buffers_handled = time.perf_counter()
+        output = acquisition_controller.post_acquire()
+        stop = time.perf_counter()
+
+        self.last_timing = {'pre_start_capture': capture_started - start,
+                            'handle_buffer': buffers_handled - capture_started,
+                            'post_acquire': stop - buffers_handled,
+                            'total': stop - start}
+        return output
+
+    def _generate_buffers(self) -> np.ndarray:
+        """
+        Buffers of left aligned 12 bit codes with the samples of the
+        acquired channels interleaved.
+        """
+        samples = self.samples_per_record.get()
+        records = self.records_per_buffer.get()
+        channels = self.channel_selection.get()
+        nbuffers = min(self.noise_buffers.get(),
+                       self.buffers_per_acquisition.get())
+        t = np.arange(samples) / self.get_sample_rate()
+        code_range = 2**(self.bits_per_sample - 1) - 0.5
+        data = np.empty((nbuffers, records, samples, len(channels)),
+                        dtype=np.uint16)
+        for i, channel in enumerate(channels):
+            signal = np.zeros(samples)
+            for frequency, amplitude, phase in self._tones[channel]:
+                signal += amplitude * np.cos(2 * np.pi * frequency * t + phase)
+            volts = signal + self._rng.normal(0, self.noise.get(),
+                                              (nbuffers, records, samples))
+            codes = np.round(volts / self.input_range_volts * code_range +
+                             code_range)
+            np.clip(codes, 0, 2**self.bits_per_sample - 1, out=codes)
+            data[..., i] = codes.astype(np.uint16) << (16 - self.bits_per_sample)
+        return data.reshape(nbuffers, -1)
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from typing import Dict, Any
+
+from qcodes.loops import active_data_set
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """
+    Wall time, number of calls and number of bytes processed of each stage
+    of the processing of one acquisition, and the sizes of the arrays
+    allocated for it.
+
+    Stages which run concurrently in several threads add up their time.
+    Use disabled_timings when profiling is off, its methods do nothing.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.stages = {}
+        self.allocations = {}
+        self._lock = threading.Lock()
+        self._mark = None
+
+    def stage(self, name: str, nbytes: int=0) -> '_Stage':
+        """
+        Context manager timing a stage which processes nbytes bytes.
+        """
+        return _Stage(self, name, nbytes)
+
+    def add(self, name: str, seconds: float, nbytes: int=0) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, {'time': 0.0, 'calls': 0,
+                                                  'bytes': 0})
+            stage['time'] += seconds
+            stage['calls'] += 1
+            stage['bytes'] += int(nbytes)
+
+    def allocated(self, name: str, nbytes: int) -> None:
+        with self._lock:
+            self.allocations[name] = (self.allocations.get(name, 0) +
+                                      int(nbytes))
+
+    def mark(self) -> None:
+        """
+        Marks the end of a callback, see lap.
+        """
+        self._mark = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        """
+        Adds the time since the last mark to a stage, e.g. the time spent
+        waiting for the card between two callbacks.
+        """
+        if self._mark is not None:
+            self.add(name, time.perf_counter() - self._mark)
+            self._mark = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'stages': {name: dict(stage)
+                               for name, stage in self.stages.items()},
+                    'allocations': dict(self.allocations)}
+
+
+class _Stage:
+    def __init__(self, timings: StageTimings, name: str, nbytes: int) -> None:
+        self._timings = timings
+        self._name = name
+        self._nbytes = nbytes
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._timings.add(self._name, time.perf_counter() - self._start,
+                          self._nbytes)
+
+
+class _DisabledTimings:
+    enabled = False
+
+    def stage(self, name: str, nbytes: int=0) -> '_NullStage':
+        return _null_stage
+
+    def add(self, name: str, seconds: float, nbytes: int=0) -> None:
+        pass
+
+    def allocated(self, name: str, nbytes: int) -> None:
+        pass
+
+    def mark(self) -> None:
+        pass
+
+    def lap(self, name: str) -> None:
+        pass
+
+
+class _NullStage:
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_null_stage = _NullStage()
+disabled_timings = _DisabledTimings()
+
+
+def store_timings(controller, timings: StageTimings) -> None:
+    """
+    Saves the timings of an acquisition in the 'timings' parameter of the
+    controller and, if the controller's 'timings_to_metadata' is set,
+    adds them up in the metadata of the active dataset.
+    """
+    if not timings.enabled:
+        return
+    result = timings.as_dict()
+    controller.timings._save_val(result)
+    if not controller.timings_to_metadata.get():
+        return
+    data_set = active_data_set()
+    if data_set is None:
+        return
+    totals = data_set.metadata.get('alazar_timings', {}).get(
+        controller.name, {'acquisitions': 0, 'stages': {}, 'allocations': {}})
+    totals['acquisitions'] += 1
+    for name, stage in result['stages'].items():
+        total = totals['stages'].setdefault(name, {'time': 0.0, 'calls': 0,
+                                                   'bytes': 0})
+        for key, value in stage.items():
+            total[key] += value
+    for name, nbytes in result['allocations'].items():
+        totals['allocations'][name] = (totals['allocations'].get(name, 0) +
+                                       nbytes)
+    data_set.add_metadata({'alazar_timings': {controller.name: totals}})
@@ -0,0 +1,131 @@
+"""
+Renders the pdf and png plots and the device image saved after each
+measurement in a pool of background processes, so the next measurement
+can start while they are rendered. The plots are rendered from the
+dataset saved on disk.
+
+    start_background_rendering()   # or my_init(..., background_rendering=True)
+    do1d(...)                      # returns before the plots are saved
+    pending_renders()              # e.g. ['#012 plots', '#012 device image']
+    wait_for_renders()
+
+The QtPlot png is still saved right away as it is a picture of the live
+plot window. Plots rendered in the background are not displayed, whatever
+display_pdf and display_individual_pdf are set to.
+
+The workers are spawned rather than forked, so they don't inherit the Qt
+application, the plot processes and the instrument connections of the
+measurement process (this needs Python 3.7 or later).
+"""
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import wait as wait_for
+from functools import partial
+from typing import Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+_pool = None
+# (description, future) of the pending renders and of the failed renders
+# which have not been returned by wait_for_renders yet
+_renders = []
+
+
+def start_background_rendering(max_workers: int=2) -> None:
+    """
+    Starts rendering plots and device images in max_workers background
+    processes.
+    """
+    global _pool
+    if sys.version_info < (3, 7):
+        raise RuntimeError('Background rendering needs Python 3.7 or later')
+    stop_background_rendering()
+    _pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'))
+    log.info('Background rendering started')
+
+
+def stop_background_rendering(wait: bool=True) -> None:
+    """
+    Stops rendering in the background, plots are rendered right after the
+    measurement again. If wait the pending renders are finished first,
+    otherwise those which have not started yet are dropped.
+    """
+    global _pool
+    if _pool is None:
+        return
+    if wait:
+        wait_for_renders()
+    else:
+        for _, future in _renders:
+            future.cancel()
+    _pool.shutdown(wait=wait)
+    _pool = None
+
+
+def background_rendering_enabled() -> bool:
+    return _pool is not None
+
+
+def submit_render(description: str, function: Callable, *args) -> Future:
+    """
+    Runs function(*args) in a background process. function and args must
+    be picklable, i.e. function has to be defined at module level and must
+    not get instruments or parameters.
+    """
+    if _pool is None:
+        raise RuntimeError('Background rendering is not started')
+    _prune_renders()
+    future = _pool.submit(function, *args)
+    future.add_done_callback(partial(_log_failure, description))
+    _renders.append((description, future))
+    return future
+
+
+def pending_renders() -> List[str]:
+    """
+    Descriptions of the renders which are queued or running.
+    """
+    _prune_renders()
+    return [description for description, future in _renders
+            if not future.done()]
+
+
+def wait_for_renders(timeout: Optional[float]=None) -> List[str]:
+    """
+    Waits until the pending renders are done, at most timeout seconds.
+
+    Returns:
+        descriptions of the renders which failed since the last call, the
+        exceptions are logged
+    """
+    wait_for([future for _, future in _renders], timeout=timeout)
+    failed = [description for description, future in _renders
+              if future.done() and _failed(future)]
+    _renders[:] = [(description, future) for description, future in _renders
+                   if not future.done()]
+    return failed
+
+
+def _prune_renders() -> None:
+    # drop the renders which succeeded, failures are kept until they are
+    # returned by wait_for_renders
+    _renders[:] = [(description, future) for description, future in _renders
+                   if not future.done() or _failed(future)]
+
+
+def _failed(future: Future) -> bool:
+    return not future.cancelled() and future.exception() is not None
+
+
+def _log_failure(description: str, future: Future) -> None:
+    if future.cancelled():
+        return
+    exception = future.exception()
+    if exception is not None:
+        log.error('Rendering {} failed'.format(description),
+                  exc_info=(type(exception), exception,
+                            exception.__traceback__))
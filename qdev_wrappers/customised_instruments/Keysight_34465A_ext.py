@@ -1,4 +1,15 @@
 from qcodes.instrument_drivers.Keysight.Keysight_34465A import Keysight_34465A
+from qdev_wrappers.customised_instruments.buffered_readout import \
+    Keysight34465ABuffer
+
+
+class CurrentBuffer(Keysight34465ABuffer):
+    """
+    Buffered readout of the IV_TAMP current, see Keysight34465ABuffer
+    """
+
+    def get(self):
+        return super().get() / self._instrument.iv_conv * 1E12
 
 
 # Subclass the DMM
@@ -18,6 +29,11 @@ class Keysight_34465A_ext(Keysight_34465A):
                            get_cmd=self._get_current,
                            set_cmd=None)
 
+        self.add_parameter('ivconv_buffer',
+                           label='Current',
+                           unit='pA',
+                           parameter_class=CurrentBuffer)
+
     def _get_current(self):
         """
         get_cmd for dmm readout of IV_TAMP parameter
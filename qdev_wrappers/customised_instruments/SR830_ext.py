@@ -1,23 +1,28 @@
 from qcodes.instrument_drivers.stanford_research.SR830 import SR830
 from qcodes.instrument_drivers.devices import VoltageDivider
-from qcodes.instrument_drivers.stanford_research.SR830 import ChannelBuffer
+from qdev_wrappers.customised_instruments.buffered_readout import SR830Buffer
 
 # A conductance buffer, needed for the faster 2D conductance measurements
 # (Dave Wecker style)
 
 
-class ConductanceBuffer(ChannelBuffer):
+class ConductanceBuffer(SR830Buffer):
     """
     A full-buffered version of the conductance based on an
     array of X measurements
 
-    We basically just slightly tweak the get method
+    We basically just slightly tweak the get method. As an SR830Buffer it
+    can be used as a buffered readout of the inner sweep of do2d.
     """
 
     def __init__(self, name: str, instrument: 'SR830_T10', **kwargs):
         super().__init__(name, instrument, channel=1)
         self.unit = ('e^2/h')
 
+    def prepare_buffer_readout(self):
+        super().prepare_buffer_readout()
+        self.unit = ('e^2/h')
+
     def get(self):
         # If X is not being measured, complain
         if self._instrument.ch1_display() != 'X':
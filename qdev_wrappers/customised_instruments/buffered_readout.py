@@ -0,0 +1,129 @@
+import numpy as np
+from qcodes import ArrayParameter
+from qcodes.instrument_drivers.stanford_research.SR830 import ChannelBuffer
+
+# Readouts which store the points of a sweep in the memory of the
+# instrument and return them all at once. do2d uses them for the inner
+# sweep: the buffer is armed before each row, triggered at each point and
+# the row is read at its end, saving a round trip to the instrument per
+# point.
+
+
+class BufferedReadout:
+    """
+    Mixin for an ArrayParameter which reads one row of a sweep from the
+    buffer of its instrument. A sweep using the readout calls
+
+        prepare_buffer(sweep_values)  once before the sweep
+        arm_buffer()                  before each row
+        trigger_buffer()              at each point of the row
+        get()                         at the end of each row
+        finish_buffer()               after the sweep
+
+    Subclasses implement _prepare_buffer, arm_buffer, trigger_buffer and
+    get and may restore the settings of the instrument in finish_buffer.
+    """
+
+    def prepare_buffer(self, sweep_values) -> None:
+        """
+        Prepares the instrument for rows of len(sweep_values) points and
+        sets the shape and setpoints of the readout to those of the sweep.
+        """
+        parameter = sweep_values.parameter
+        self._prepare_buffer(len(sweep_values))
+        self.shape = (len(sweep_values),)
+        self.setpoints = (tuple(sweep_values),)
+        self.setpoint_names = (parameter.name,)
+        self.setpoint_labels = (parameter.label,)
+        self.setpoint_units = (parameter.unit,)
+
+    def _prepare_buffer(self, num_points: int) -> None:
+        raise NotImplementedError
+
+    def arm_buffer(self) -> None:
+        raise NotImplementedError
+
+    def trigger_buffer(self) -> None:
+        raise NotImplementedError
+
+    def finish_buffer(self) -> None:
+        pass
+
+
+class SR830Buffer(BufferedReadout, ChannelBuffer):
+    """
+    The data buffer of a channel of an SR830, storing a point at each
+    software trigger.
+    """
+
+    # number of points the SR830 can store
+    max_points = 16383
+
+    def _prepare_buffer(self, num_points: int) -> None:
+        if num_points > self.max_points:
+            raise ValueError('The SR830 buffer holds at most {} points, '
+                             'got {}'.format(self.max_points, num_points))
+        self._instrument.buffer_SR('Trigger')
+        self._instrument.buffer_reset()
+        self.prepare_buffer_readout()
+
+    def arm_buffer(self) -> None:
+        self._instrument.buffer_reset()
+        self._instrument.buffer_start()
+
+    def trigger_buffer(self) -> None:
+        self._instrument.send_trigger()
+
+
+class Keysight34465ABuffer(BufferedReadout, ArrayParameter):
+    """
+    The reading memory of a Keysight 34465A, storing a reading at each bus
+    trigger. The trigger settings are restored after the sweep.
+    """
+
+    def __init__(self, name: str, instrument, label: str='Voltage',
+                 unit: str='V') -> None:
+        super().__init__(name,
+                         shape=(1,),
+                         instrument=instrument,
+                         label=label,
+                         unit=unit,
+                         setpoint_names=('trig_events',),
+                         setpoint_labels=('Trigger event number',),
+                         setpoint_units=('',),
+                         docstring='Readings of one row of a sweep, '
+                                   'taken at bus triggers.')
+        self._saved_settings = None
+
+    def _prepare_buffer(self, num_points: int) -> None:
+        dmm = self._instrument
+        if self._saved_settings is None:
+            self._saved_settings = {name: dmm.parameters[name].get()
+                                    for name in ('trigger_source',
+                                                 'trigger_count',
+                                                 'sample_count')}
+        dmm.trigger_source('BUS')
+        dmm.trigger_count(num_points)
+        dmm.sample_count(1)
+
+    def arm_buffer(self) -> None:
+        self._instrument.init_measurement()
+
+    def trigger_buffer(self) -> None:
+        self._instrument.write('*TRG')
+
+    def get(self):
+        raw = self._instrument.ask('FETCH?')
+        readings = np.array(raw.split(','), dtype=float)
+        if len(readings) != self.shape[0]:
+            raise RuntimeError('Keysight 34465A got {} readings, expected '
+                               '{}'.format(len(readings), self.shape[0]))
+        return readings
+
+    def finish_buffer(self) -> None:
+        if self._saved_settings is None:
+            return
+        dmm = self._instrument
+        for name, value in self._saved_settings.items():
+            dmm.parameters[name].set(value)
+        self._saved_settings = None
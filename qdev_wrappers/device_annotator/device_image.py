@@ -1,4 +1,9 @@
+from copy import deepcopy
 from qdev_wrappers.file_setup import CURRENT_EXPERIMENT
+from qdev_wrappers.background_rendering import background_rendering_enabled, \
+    submit_render
+from qdev_wrappers.device_annotator.qcodes_device_annotator import \
+    render_device_image
 import os
 import logging
 
@@ -20,9 +25,14 @@ def save_device_image(sweeptparameters):
         return
     di.updateValues(CURRENT_EXPERIMENT['station'], sweeptparameters)
 
-    log.debug(os.path.join(CURRENT_EXPERIMENT["exp_folder"],
-                           '{:03d}'.format(counter)))
+    path = os.path.join(CURRENT_EXPERIMENT["exp_folder"],
+                        '{:03d}'.format(counter))
+    log.debug(path)
 
-    di.makePNG(CURRENT_EXPERIMENT["provider"].counter,
-               os.path.join(CURRENT_EXPERIMENT["exp_folder"],
-                            '{:03d}'.format(counter)), title)
+    if background_rendering_enabled():
+        # the values are copied as the next measurement updates them
+        submit_render('{} device image'.format(title), render_device_image,
+                      deepcopy(di._data), os.path.abspath(di.filename),
+                      counter, os.path.abspath(path), title)
+    else:
+        di.makePNG(counter, path, title)
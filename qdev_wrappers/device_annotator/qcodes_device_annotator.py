@@ -465,20 +465,36 @@ class DeviceImage:
         """
         if self.filename is None:
             raise ValueError('No image selected!')
-        if not qt.QApplication.instance():
-            app = qt.QApplication(sys.argv)
-        else:
-            app = qt.QApplication.instance()
-        win = qt.QWidget()
-        grid = qt.QGridLayout()
-        win.setLayout(grid)
-        win.imageCanvas = qt.QLabel()
-        grid.addWidget(win.imageCanvas)
-        win.imageCanvas, pixmap = MakeDeviceImage._renderImage(self._data,
-                                                               win.imageCanvas,
-                                                               self.filename,
-                                                               title)
-        filename = '{:03d}_deviceimage.png'.format(counter)
-        if path:
-            filename = os.path.join(path, filename)
-        pixmap.save(filename, 'png')
+        render_device_image(self._data, self.filename, counter, path, title)
+
+
+def render_device_image(data, image_filename, counter, path=None, title=None):
+    """
+    Render the annotated image and save it to disk. Does not need the
+    station, so it can run in a background process (see
+    background_rendering).
+
+    Args:
+        data (dict): The annotations with the values of the parameters
+        image_filename (str): The raw device image
+        counter (int): A counter for the experimental run number
+        path (str): Folder to save the image to
+        title (str): Title drawn on the image
+    """
+    if not qt.QApplication.instance():
+        app = qt.QApplication(sys.argv)
+    else:
+        app = qt.QApplication.instance()
+    win = qt.QWidget()
+    grid = qt.QGridLayout()
+    win.setLayout(grid)
+    win.imageCanvas = qt.QLabel()
+    grid.addWidget(win.imageCanvas)
+    win.imageCanvas, pixmap = MakeDeviceImage._renderImage(data,
+                                                           win.imageCanvas,
+                                                           image_filename,
+                                                           title)
+    filename = '{:03d}_deviceimage.png'.format(counter)
+    if path:
+        filename = os.path.join(path, filename)
+    pixmap.save(filename, 'png')
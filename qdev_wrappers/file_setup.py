@@ -9,6 +9,7 @@ import warnings
 
 from qdev_wrappers.device_annotator.qcodes_device_annotator import DeviceImage
 from qdev_wrappers.configreader import Config
+from qdev_wrappers.background_rendering import start_background_rendering
 from qdev_wrappers.logger import (
     start_python_logger,
     start_command_history_logger)
@@ -215,7 +216,8 @@ def my_init(sample_name: str, station, qubit_count=None,
             annotate_image=False,
             display_pdf=True,
             display_individual_pdf=False,
-            plot_x_position=0.66):
+            plot_x_position=0.66,
+            background_rendering=False):
     basic_init(sample_name, station, mainfolder)
     CURRENT_EXPERIMENT['plot_x_position'] = plot_x_position
     _set_up_script_folder()
@@ -243,3 +245,5 @@ def my_init(sample_name: str, station, qubit_count=None,
         _init_device_image(station)
     if qubit_count is not None:
         CURRENT_EXPERIMENT['qubit_count'] = qubit_count
+    if background_rendering:
+        start_background_rendering()
@@ -2,14 +2,12 @@
 # SR830. Implementing the good ideas of Dave Wecker
 
 from typing import Union, Optional
-from time import sleep
-import numpy as np
 import qcodes as qc
 from qcodes.instrument.parameter import Parameter
-from qdev_wrappers.sweep_functions import _do_measurement
+from qdev_wrappers.sweep_functions import do2d
 from qcodes.instrument_drivers.QDev.QDac_channels import QDac as QDacch
 
-from qdev_wrappers.T3.customised_instruments import SR830_T3
+from qdev_wrappers.customised_instruments.SR830_ext import SR830_ext
 
 def do2Dconductance(outer_param: Parameter,
                     outer_start: Union[float, int],
@@ -19,11 +17,14 @@ def do2Dconductance(outer_param: Parameter,
                     inner_start: Union[float, int],
                     inner_stop: Union[float, int],
                     inner_npts: int,
-                    lockin: SR830_T3,
+                    lockin: SR830_ext,
                     delay: Optional[float]=None):
     """
     Function to perform a sped-up 2D conductance measurement
 
+    The conductance buffer of the lock-in is read once per inner sweep,
+    see the buffered readouts of do2d.
+
     Args:
         outer_param: The outer loop voltage parameter
         outer_start: The outer loop start voltage
@@ -58,59 +59,6 @@ def do2Dconductance(outer_param: Parameter,
     min_delay = 0.002  # what's the physics behind this number?
     if delay is None:
         delay = tau + min_delay
-    # Prepare for the first iteration
-    # Some of these things have to be repeated during the loop
-    sr.buffer_reset()
-    sr.buffer_start()
-    #sr.buffer_trig_mode('ON')
-    sr.buffer_SR('Trigger')
-    sr.conductance.shape = (inner_npts,)
-    sr.conductance.setpoint_names = (inner_param.name,)
-    sr.conductance.setpoint_labels = (inner_param.label,)
-    sr.conductance.setpoint_units = ('V',)
-    sr.conductance.setpoints = (tuple(np.linspace(inner_start,
-                                                  inner_stop,
-                                                  inner_npts)),)
-
-    def trigger():
-        sleep(delay)
-        sr.send_trigger()
-
-    def prepare_buffer():
-        # here it should be okay to call ch1_databuffer... I think...
-        sr.ch1_databuffer.prepare_buffer_readout()
-        # For the dataset/plotting, put in the correct setpoints
-        sr.conductance.setpoint_names = (inner_param.name,)
-        sr.conductance.setpoint_labels = (inner_param.label,)
-        sr.conductance.setpoint_units = ('V',)
-        sr.conductance.setpoints = (tuple(np.linspace(inner_start,
-                                                      inner_stop,
-                                                      inner_npts)),)
-
-    def start_buffer():
-        sr.buffer_start()
-        sr.conductance.shape = (inner_npts,)  # This is something
-
-    def reset_buffer():
-        sr.buffer_reset()
-
-    trig_task = qc.Task(trigger)
-    reset_task = qc.Task(reset_buffer)
-    start_task = qc.Task(start_buffer)
-    inner_loop = qc.Loop(inner_param.sweep(inner_start,
-                                           inner_stop,
-                                           num=inner_npts)).each(trig_task)
-    outer_loop = qc.Loop(outer_param.sweep(outer_start,
-                                           outer_stop,
-                                           num=outer_npts)).each(start_task,
-                                                                 inner_loop,
-                                                                 sr.conductance,
-                                                                 reset_task)
-
-    set_params = ((inner_param, inner_start, inner_stop),
-                  (outer_param, outer_start, outer_stop))
-    meas_params = (sr.conductance,)
-    prepare_buffer()
     qdac = None
     # ensure that any waveform generator is unbound from the qdac channels that we step if
     # we are stepping the qdac
@@ -124,5 +72,7 @@ def do2Dconductance(outer_param: Parameter,
         qdac.fast_voltage_set(True)  # now that we have unbound the function generators
                                      # we don't need to do it in the loop
         qdac.voltage_set_dont_wait(False)  # this is un safe and highly experimental
-    plot, data = _do_measurement(outer_loop, set_params, meas_params, do_plots=True)
+    plot, data = do2d(outer_param, outer_start, outer_stop, outer_npts, 0,
+                      inner_param, inner_start, inner_stop, inner_npts, delay,
+                      sr.conductance)
     return plot, data
@@ -147,7 +147,8 @@ def do1d_M(inst_set, start, stop, n_points, delay, *inst_meas, ramp_slope=None):
 
 
 def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
-           n_points2, delay2, *inst_meas, ramp_slope1=None, ramp_slope2=None):
+           n_points2, delay2, *inst_meas, ramp_slope1=None, ramp_slope2=None,
+           snake=False):
     """
     Args:
         inst_set:  Instrument to sweep over
@@ -162,6 +163,8 @@ def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
         delay_2:  Delay at every step for second intrument
         *inst_meas:
         ramp_slope:
+        snake: sweep the second instrument back and forth instead of
+            ramping it back to start_2 for every step, see do2d
 
     Returns:
         plot, data : returns the plot and the dataset
@@ -176,7 +179,8 @@ def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
         if getattr(inst, "setpoints", False):
             raise ValueError("3d plotting is not supported")
 
-    plot, data = do2d(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2, n_points2, delay2, *inst_meas)
+    plot, data = do2d(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2, n_points2, delay2, *inst_meas,
+                      snake=snake)
 
     return plot, data
 
@@ -1,62 +1,86 @@
+import os
 from os.path import sep
 from copy import deepcopy
 import functools
+import time
+from typing import Optional, Tuple
+import numpy as np
 from matplotlib import ticker
 import matplotlib.pyplot as plt
+from pyqtgraph.multiprocess.remoteproxy import ObjectProxy
 
 from qcodes.plots.pyqtgraph import QtPlot
 from qcodes.plots.qcmatplotlib import MatPlot
+from qcodes.data.data_set import load_data
+from qcodes.data.io import DiskIO
 from qdev_wrappers.file_setup import CURRENT_EXPERIMENT
 from qcodes.instrument.channel import MultiChannelInstrumentParameter
 
 def _plot_setup(data, inst_meas, useQT=True, startranges=None):
-    title = "{} #{:03d}".format(CURRENT_EXPERIMENT["sample_name"],
-                                data.location_provider.counter)
-    rasterized_note = " rasterized plot"
-    num_subplots = 0
-    counter_two = 0
-    for j, i in enumerate(inst_meas):
-        if getattr(i, "names", False):
-            num_subplots += len(i.names)
-        else:
-            num_subplots += 1
+    array_names = _array_names(data, inst_meas)
     if useQT:
         plot = QtPlot(fig_x_position=CURRENT_EXPERIMENT['plot_x_position'])
     else:
-        plot = MatPlot(subplots=(1, num_subplots))
-
-    def _create_plot(plot, i, name, data, counter_two, j, k):
-        """
-        Args:
-            plot: The plot object, either QtPlot() or MatPlot()
-            i: The parameter to measure
-            name: -
-            data: The DataSet of the current measurement
-            counter_two: The sub-measurement counter. Each measurement has a
-                number and each sub-measurement has a counter.
-            j: The current sub-measurement
-            k: -
-        """
-        color = 'C' + str(counter_two)
-        if issubclass(i.__class__, MultiChannelInstrumentParameter) or i._instrument is None:
-            inst_meas_name = name
-        else:            
-            parent_instr_name = (i._instrument.name + '_') if i._instrument else ''
+        plot = MatPlot(subplots=(1, len(array_names)))
+    _add_arrays(plot, data, array_names, _plot_title(data), useQT,
+                startranges)
+    return plot, len(array_names)
+
+
+def _plot_title(data):
+    return "{} #{:03d}".format(CURRENT_EXPERIMENT["sample_name"],
+                               data.location_provider.counter)
+
+
+def _array_names(data, inst_meas):
+    """
+    Names of the arrays of data holding the data of the parameters
+    inst_meas, one per subplot.
+    """
+    array_names = []
+    for i in inst_meas:
+        if getattr(i, "names", False):
+            # deal with multidimensional parameter
+            names = i.names
+        else:
+            names = (i.name,)
+        for name in names:
+            if issubclass(i.__class__, MultiChannelInstrumentParameter) or i._instrument is None:
+                parent_instr_name = ''
+            else:
+                parent_instr_name = i._instrument.name + '_'
             inst_meas_name = "{}{}".format(parent_instr_name, name)
-        try:
-            inst_meas_data = getattr(data, inst_meas_name)
-        except AttributeError:
-            inst_meas_name = "{}{}_0_0".format(parent_instr_name, name)
-            inst_meas_data = getattr(data, inst_meas_name)
+            try:
+                getattr(data, inst_meas_name)
+            except AttributeError:
+                inst_meas_name = "{}{}_0_0".format(parent_instr_name, name)
+            array_names.append(inst_meas_name)
+    return array_names
+
+
+def _add_arrays(plot, data, array_names, title, useQT=True, startranges=None):
+    """
+    Args:
+        plot: The plot object, either QtPlot() or MatPlot()
+        data: The DataSet of the current measurement
+        array_names: The arrays of data to plot, one per subplot
+        title: Title of the first subplot
+        useQT: Whether plot is a QtPlot
+        startranges: Ranges of the setpoints for QtPlot.fixUnitScaling
+    """
+    rasterized_note = " rasterized plot"
+    for j, inst_meas_name in enumerate(array_names):
+        color = 'C' + str(j)
+        inst_meas_data = getattr(data, inst_meas_name)
 
         inst_meta_data = __get_plot_type(inst_meas_data, plot)
         if useQT:
-            plot.add(inst_meas_data, subplot=j + k + 1)
-            plot.subplots[j + k].showGrid(True, True)
+            plot.add(inst_meas_data, subplot=j + 1)
+            plot.subplots[j].showGrid(True, True)
             if j == 0:
                 plot.subplots[0].setTitle(title)
             else:
-                plot.subplots[j + k].setTitle("")
+                plot.subplots[j].setTitle("")
 
             plot.fixUnitScaling(startranges)
             QtPlot.qc_helpers.foreground_qt_window(plot.win)
@@ -65,12 +89,12 @@ def _plot_setup(data, inst_meas, useQT=True, startranges=None):
             if 'z' in inst_meta_data:
                 xlen, ylen = inst_meta_data['z'].shape
                 rasterized = xlen * ylen > 5000
-                plot.add(inst_meas_data, subplot=j + k + 1,
+                plot.add(inst_meas_data, subplot=j + 1,
                          rasterized=rasterized)
             else:
                 rasterized = False
-                plot.add(inst_meas_data, subplot=j + k + 1, color=color)
-                plot.subplots[j + k].grid()
+                plot.add(inst_meas_data, subplot=j + 1, color=color)
+                plot.subplots[j].grid()
             if j == 0:
                 if rasterized:
                     fulltitle = title + rasterized_note
@@ -82,23 +106,7 @@ def _plot_setup(data, inst_meas, useQT=True, startranges=None):
                     fulltitle = rasterized_note
                 else:
                     fulltitle = ""
-                plot.subplots[j + k].set_title(fulltitle)
-
-
-    subplot_index = 0
-    for measurement in inst_meas:
-        if getattr(measurement, "names", False):
-            # deal with multidimensional parameter
-            for name in measurement.names:
-                _create_plot(plot, measurement, name, data, counter_two, subplot_index, 0)
-                subplot_index += 1
-                counter_two += 1
-        else:
-            # simple_parameters
-            _create_plot(plot, measurement, measurement.name, data, counter_two, subplot_index, 0)
-            subplot_index += 1
-            counter_two += 1
-    return plot, num_subplots
+                plot.subplots[j].set_title(fulltitle)
 
 
 def __get_plot_type(data, plot):
@@ -112,27 +120,24 @@ def __get_plot_type(data, plot):
 
 
 def _save_individual_plots(data, inst_meas, display_plot=True):
+    _save_individual_array_plots(data, _array_names(data, inst_meas),
+                                 _plot_title(data),
+                                 CURRENT_EXPERIMENT['pdf_subfolder'],
+                                 display_plot)
+
+
+def _save_individual_array_plots(data, array_names, title, pdf_subfolder,
+                                 display_plot=True):
 
-    def _create_plot(i, name, data, counter_two, display_plot=True):
+    def _create_plot(inst_meas_name, data, counter_two, display_plot=True):
         # Step the color on all subplots no just on plots
         # within the same axis/subplot
         # this is to match the qcodes-pyqtplot behaviour.
-        title = "{} #{:03d}".format(CURRENT_EXPERIMENT["sample_name"],
-                                    data.location_provider.counter)
         rasterized_note = " rasterized plot full data available in datafile"
         color = 'C' + str(counter_two)
         counter_two += 1
         plot = MatPlot()
-        if issubclass(i.__class__, MultiChannelInstrumentParameter) or i._instrument is None:
-            inst_meas_name = name
-        else:
-            inst_meas_name = "{}_{}".format(i._instrument.name, name)
         inst_meas_data = getattr(data, inst_meas_name)
-        try:
-            inst_meas_data = getattr(data, inst_meas_name)
-        except AttributeError:
-            inst_meas_name = "{}{}_0_0".format(i._instrument.name, name)
-            inst_meas_data = getattr(data, inst_meas_name)
         inst_meta_data = __get_plot_type(inst_meas_data, plot)
         if 'z' in inst_meta_data:
             xlen, ylen = inst_meta_data['z'].shape
@@ -147,11 +152,11 @@ def _save_individual_plots(data, inst_meas, display_plot=True):
         else:
             plot.subplots[0].set_title(title)
         title_list = plot.get_default_title().split(sep)
-        title_list.insert(-1, CURRENT_EXPERIMENT['pdf_subfolder'])
-        title = sep.join(title_list)
+        title_list.insert(-1, pdf_subfolder)
+        path = sep.join(title_list)
         plot.rescale_axis()
         plot.tight_layout()
-        plot.save("{}_{:03d}.pdf".format(title,
+        plot.save("{}_{:03d}.pdf".format(path,
                                          counter_two))
         if display_plot:
             plot.fig.canvas.draw()
@@ -159,13 +164,184 @@ def _save_individual_plots(data, inst_meas, display_plot=True):
         else:
             plt.close(plot.fig)
 
-    counter_two = 0
-    for j, i in enumerate(inst_meas):
-        if getattr(i, "names", False):
-            # deal with multidimensional parameter
-            for k, name in enumerate(i.names):
-                _create_plot(i, name, data, counter_two, display_plot)
-                counter_two += 1
+    for counter_two, inst_meas_name in enumerate(array_names):
+        _create_plot(inst_meas_name, data, counter_two, display_plot)
+
+
+def _save_MatPlot(data, array_names, title, pdf_subfolder=None,
+                  png_subfolder=None, display_combined=False,
+                  display_individual=False):
+    """
+    Saves the plots of the arrays array_names of data as pdf (also one per
+    array if there are several) and png in the subfolders of the folder of
+    data.
+    """
+    plot = MatPlot(subplots=(1, len(array_names)))
+    _add_arrays(plot, data, array_names, title, useQT=False)
+    # pad a bit more to prevent overlap between
+    # suptitle and title
+    plot.rescale_axis()
+    plot.fig.tight_layout(pad=3)
+
+    if pdf_subfolder is not None:
+        title_list = plot.get_default_title().split(sep)
+        title_list.insert(-1, pdf_subfolder)
+        path = sep.join(title_list)
+        plot.save("{}.pdf".format(path))
+
+    if png_subfolder is not None:
+        title_list = plot.get_default_title().split(sep)
+        title_list.insert(-1, png_subfolder)
+        path = sep.join(title_list)
+        plot.fig.savefig("{}.png".format(path), dpi=500)
+
+    if (display_combined or
+            (len(array_names) == 1 and display_individual)):
+        plot.fig.canvas.draw()
+        plt.show()
+    else:
+        plt.close(plot.fig)
+    if len(array_names) > 1 and pdf_subfolder is not None:
+        _save_individual_array_plots(data, array_names, title,
+                                     pdf_subfolder, display_individual)
+
+
+def _save_MatPlot_from_disk(working_directory, location, base_location,
+                            array_names, title, pdf_subfolder=None,
+                            png_subfolder=None):
+    """
+    _save_MatPlot for the dataset saved at location, run in a background
+    process (see background_rendering). The plots are saved relative to
+    working_directory like in the measurement process.
+    """
+    plt.switch_backend('Agg')
+    os.chdir(working_directory)
+    data = load_data(location, io=DiskIO(base_location))
+    _save_MatPlot(data, array_names, title, pdf_subfolder, png_subfolder)
+
+
+class LivePlot:
+    """
+    Updates a QtPlot while its measurement is running, used as the
+    background task of the loop instead of QtPlot.update.
+
+    The plot is updated at most max_refresh_rate times per second. Images
+    are decimated to at most max_image_size points along each axis (by
+    showing every n-th point) and kept in the plot process, so an update
+    only sends the rows of the decimated image which changed since the
+    last update. The cost of an update is thus independent of the size of
+    the map. Call QtPlot.update after the measurement to show the full
+    data.
+
+    Args:
+        plot: the QtPlot set up by _plot_setup
+    """
+
+    max_refresh_rate = 4
+    max_image_size = 500
+
+    def __init__(self, plot: QtPlot) -> None:
+        self.plot = plot
+        self._last_update = 0.0
+        self._images = {}
+        if isinstance(plot.rpg, ObjectProxy):
+            self._numpy = plot.proc._import('numpy')
         else:
-            _create_plot(i, i.name, data, counter_two, display_plot)
-            counter_two += 1
+            self._numpy = np
+
+    def __call__(self) -> None:
+        if time.time() - self._last_update >= 1 / self.max_refresh_rate:
+            self.update()
+
+    def update(self) -> None:
+        for index, trace in enumerate(self.plot.traces):
+            config = trace['config']
+            if 'z' in config:
+                self._update_image(index, trace['plot_object'], config)
+            else:
+                trace['plot_object'].setData(
+                    *self.plot._line_data(config['x'], config['y']))
+        self._last_update = time.time()
+
+    def _update_image(self, index: int, plot_object: dict,
+                      config: dict) -> None:
+        z = config['z']
+        state = self._images.get(index)
+        if state is None:
+            steps = tuple(-(-n // self.max_image_size) for n in z.shape)
+            state = self._images[index] = {
+                'steps': steps, 'range': None, 'image': None,
+                'transform': None,
+                'shown': np.full(z.ndarray[::steps[0], ::steps[1]].shape,
+                                 np.nan)}
+        row_step, col_step = state['steps']
+        decimated = np.array(z.ndarray[::row_step, ::col_step], dtype=float)
+        shown = state['shown']
+        unchanged = (decimated == shown) | (np.isnan(decimated) &
+                                            np.isnan(shown))
+        changed = np.flatnonzero(~np.all(unchanged, axis=1))
+        if len(changed) == 0:
+            return
+        first, last = changed[0], changed[-1] + 1
+        rows = decimated[first:last]
+        shown[first:last] = rows
+        finite = rows[np.isfinite(rows)]
+        if finite.size:
+            low, high = finite.min(), finite.max()
+            if state['range'] is not None:
+                low = min(low, state['range'][0])
+                high = max(high, state['range'][1])
+            state['range'] = (float(low), float(high))
+        if state['range'] is None:
+            return
+        # like QtPlot, missing points are shown at the bottom of the scale
+        rows = np.where(np.isnan(rows), state['range'][0], rows)
+        if state['image'] is None:
+            state['image'] = self._numpy.full(shown.shape[::-1],
+                                              state['range'][0])
+        state['image'][:, first:last] = rows.T
+
+        hist = plot_object['hist']
+        levels = hist.getLevels()
+        if levels == plot_object['histlevels']:
+            # the levels have not been changed by hand
+            levels = state['range']
+            plot_object['histlevels'] = levels
+            hist.setLevels(*levels)
+        image = plot_object['image']
+        image.setImage(state['image'], levels=levels)
+
+        transform = (_pixel_transform(config.get('x'), col_step),
+                     _pixel_transform(config.get('y'), row_step))
+        if None not in transform and transform != state['transform']:
+            state['transform'] = transform
+            (x_translate, x_scale), (y_translate, y_scale) = transform
+            image.resetTransform()
+            image.translate(x_translate, y_translate)
+            image.scale(x_scale, y_scale)
+
+
+def _pixel_transform(setpoints, step: int) -> Optional[Tuple[float, float]]:
+    """
+    Translation and scale of the pixels of an image showing every step-th
+    point of setpoints, None while there are too few setpoints. Like
+    QtPlot, nonlinear setpoints are shown as the index of the point.
+    """
+    if setpoints is None:
+        return None
+    values = np.asarray(getattr(setpoints, 'ndarray', setpoints),
+                        dtype=float)
+    if values.ndim > 1:
+        # the setpoints of the inner loop are the same in every row
+        values = values[0]
+    indices = np.flatnonzero(np.isfinite(values))
+    if len(indices) < 2:
+        return None
+    first, last = indices[0], indices[-1]
+    scale = (values[last] - values[first]) / (last - first)
+    linear = values[first] + (indices - first) * scale
+    if scale == 0 or np.any(np.abs(values[indices] - linear) >
+                            0.1 * abs(scale)):
+        return 0.0, float(step)
+    return (float(values[first] - (first + 0.5 * step) * scale),
+            float(scale * step))
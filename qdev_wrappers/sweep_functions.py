@@ -1,7 +1,8 @@
+import os
+import time
 import matplotlib.pyplot as plt
-from os.path import sep
-from typing import Optional, Tuple, Sequence
-from collections import Iterable
+from typing import Callable, Optional, Tuple, Sequence
+from collections import Iterable, deque
 from contextlib import suppress
 from pyqtgraph.multiprocess.remoteproxy import ClosedError
 
@@ -10,13 +11,22 @@ from qcodes.instrument.visa import VisaInstrument
 from qcodes.plots.pyqtgraph import QtPlot
 from qcodes.actions import Task
 from qcodes.data.data_set import DataSet
-from qcodes.loops import Loop
+from qcodes.data.data_array import DataArray
+from qcodes.loops import Loop, ActiveLoop, active_data_set
 from qcodes.measure import Measure
 from qdev_wrappers.file_setup import CURRENT_EXPERIMENT
 from qdev_wrappers.file_setup import pdfdisplay
-from qdev_wrappers.plot_functions import _plot_setup, \
-    _save_individual_plots
+from qdev_wrappers.plot_functions import _plot_setup, _plot_title, \
+    _array_names, _save_MatPlot, _save_MatPlot_from_disk, LivePlot
+from qdev_wrappers.background_rendering import background_rendering_enabled, \
+    submit_render
 from qdev_wrappers.device_annotator.device_image import save_device_image
+from qdev_wrappers.adaptive_sampling import IntervalLearner, \
+    TriangulationLearner
+from qdev_wrappers.customised_instruments.buffered_readout import \
+    BufferedReadout
+
+import numpy as np
 
 import logging
 log = logging.getLogger(__name__)
@@ -56,6 +66,307 @@ def _select_plottables(tasks):
 
     return tuple(plottables)
 
+class _SnakeLoop(ActiveLoop):
+    """
+    Inner loop of a 2D sweep which alternates its sweep direction, i.e.
+    it sweeps from the last to the first value whenever the index of the
+    outer loop is odd. The data of the reversed passes is stored at the
+    indices of the values swept so the dataset is the same as that of a
+    normal sweep.
+
+    A reversed pass stores its points at decreasing indices, so every
+    periodic save of the dataset during such a pass makes the
+    GNUPlotFormat rewrite the whole data file instead of appending to it.
+    """
+
+    def __init__(self, sweep_values, delay=0, *actions, **kwargs):
+        super().__init__(sweep_values, delay, *actions, **kwargs)
+        self._reversed_values = self.sweep_values.copy()
+        self._reversed_values.reverse()
+
+    def _run_loop(self, first_delay=0, action_indices=(),
+                  loop_indices=(), current_values=(), **ignore_kwargs):
+        if not loop_indices or loop_indices[-1] % 2 == 0:
+            return super()._run_loop(first_delay, action_indices,
+                                     loop_indices, current_values,
+                                     **ignore_kwargs)
+        sweep_values, data_set = self.sweep_values, self.data_set
+        self.sweep_values = self._reversed_values
+        self.data_set = _MirroredDataSet(data_set, len(loop_indices),
+                                         len(sweep_values))
+        try:
+            return super()._run_loop(first_delay, action_indices,
+                                     loop_indices, current_values,
+                                     **ignore_kwargs)
+        finally:
+            self.sweep_values, self.data_set = sweep_values, data_set
+
+
+class _MirroredDataSet:
+    """
+    Stores into data_set with the index along axis mirrored, used by
+    _SnakeLoop for the passes in reverse direction.
+    """
+
+    def __init__(self, data_set: DataSet, axis: int, length: int) -> None:
+        self._data_set = data_set
+        self._axis = axis
+        self._length = length
+
+    def store(self, loop_indices, ids_values):
+        indices = list(loop_indices)
+        indices[self._axis] = self._length - 1 - indices[self._axis]
+        self._data_set.store(tuple(indices), ids_values)
+
+    def __getattr__(self, name):
+        return getattr(self._data_set, name)
+
+
+def _inner_loop(sweep_values, delay, actions, snake: bool=False):
+    """
+    The inner loop of a 2D sweep, alternating its sweep direction if snake.
+    """
+    if snake:
+        return _SnakeLoop(sweep_values, delay, *actions)
+    return qc.Loop(sweep_values, delay).each(*actions)
+
+
+class _AcquisitionPipeline:
+    """
+    Pipelines the measurement of the parameters which support get_async
+    (e.g. the data of Alazar channels) in a loop.
+
+    While the pipeline is active (used as a context manager) getting such
+    a parameter acquires the data, hands the processing to a worker and
+    returns a NaN placeholder right away so the loop can go on to set the
+    next setpoint. The processed data of each point is written into the
+    dataset of the loop in order, as soon as the next point is measured
+    or when flush is called at the end of the loop.
+
+    If snake the points of every other pass of the inner loop are in
+    reverse order, see _SnakeLoop.
+
+    The processed data of a point is usually stored after the periodic
+    save of the dataset has written the placeholder of the point. The
+    GNUPlotFormat then rewrites the whole data file at the next save, so
+    the dataset of a pipelined loop is only saved every write_period
+    seconds (instead of the default 5 s) to keep the cost of saving large
+    maps down.
+    """
+
+    # seconds between the periodic saves of the dataset
+    write_period = 60
+
+    def __init__(self, params: Sequence, snake: bool=False) -> None:
+        self.params = [param for param in params
+                       if hasattr(param, 'get_async')]
+        self.snake = snake
+        self._pending = deque()
+        self._counts = {}
+
+    def __enter__(self) -> '_AcquisitionPipeline':
+        for param in self.params:
+            param.pipeline = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        for param in self.params:
+            param.pipeline = None
+        try:
+            self.flush()
+        except Exception:
+            if exc_type is None:
+                raise
+            log.exception('Exception while storing pipelined data')
+
+    def measure(self, param):
+        """
+        Starts the acquisition of param at the current point of the loop
+        and returns a placeholder for its data.
+        """
+        self.store_completed()
+        data_set = active_data_set()
+        key = (id(data_set), id(param))
+        index = self._counts.get(key, 0)
+        self._counts[key] = index + 1
+        self._pending.append((data_set, param, index, param.get_async()))
+        return self._placeholder(param)
+
+    def store_completed(self, wait: bool=False) -> int:
+        """
+        Stores the data of the points which have been processed, in
+        order. If wait all pending points are stored.
+
+        Returns:
+            the number of points stored
+        """
+        stored = 0
+        while self._pending and (wait or self._pending[0][3].done()):
+            data_set, param, index, future = self._pending.popleft()
+            self._store(data_set, param, index, future.result(), self.snake)
+            stored += 1
+        return stored
+
+    def flush(self) -> int:
+        return self.store_completed(wait=True)
+
+    @staticmethod
+    def _placeholder(param):
+        if hasattr(param, 'shapes'):
+            return tuple(np.full(shape, np.nan) for shape in param.shapes)
+        elif hasattr(param, 'shape'):
+            return np.full(param.shape, np.nan)
+        return float('nan')
+
+    @staticmethod
+    def _store(data_set, param, index: int, values,
+               snake: bool=False) -> None:
+        if data_set is None:
+            return
+        if hasattr(param, 'full_names'):
+            names = param.full_names
+        else:
+            names = (param.full_name,)
+            values = (values,)
+        for name, value in zip(names, values):
+            array = next(array for array in data_set.arrays.values()
+                         if array.full_name == name and not array.is_setpoint)
+            # the loop dimensions come before the dimensions of the value
+            loop_shape = array.shape[:len(array.shape) - np.ndim(value)]
+            loop_indices = [int(i) for i in
+                            np.unravel_index(index, loop_shape)]
+            if snake and len(loop_indices) > 1 and loop_indices[-2] % 2:
+                loop_indices[-1] = loop_shape[-1] - 1 - loop_indices[-1]
+            data_set.store(tuple(loop_indices), {array.array_id: value})
+
+
+class _AdaptiveSweep:
+    """
+    Measures the points of the grid of a 1D or 2D loop in the order chosen
+    by a learner of adaptive_sampling instead of running the loop. It is
+    called by _do_measurement with the dataset of the loop, so the data
+    ends up in the same arrays as for a normal sweep.
+
+    The sweep stops after max_points points, when the loss of the learner
+    drops below loss_goal or when the grid is sampled completely. The
+    points which are not measured are filled in by interpolation, the
+    sample_order array holds the number of each measured point (starting
+    at 1) and NaN for interpolated points. As the points are not measured
+    in order, the data is written when the sweep finishes.
+
+    Args:
+        learner: IntervalLearner or TriangulationLearner for the grid
+        set_params: tuple of (param, setpoints, delay) from the outer to
+            the inner sweep
+        actions: the parameters to measure and tasks to run at each point
+        adaptive_param: the parameter whose value the learner is told
+        max_points: maximal number of points to measure
+        loss_goal: the sweep stops when the loss drops below loss_goal
+    """
+
+    def __init__(self, learner, set_params: Sequence,
+                 actions: Sequence, adaptive_param,
+                 max_points: Optional[int]=None,
+                 loss_goal: Optional[float]=None) -> None:
+        self.learner = learner
+        self.set_params = tuple(set_params)
+        self.actions = tuple(actions)
+        self.adaptive_param = adaptive_param
+        self.max_points = max_points
+        self.loss_goal = loss_goal
+
+    def __call__(self, data_set: DataSet,
+                 bg_task: Optional[Callable]=None) -> DataSet:
+        ids = data_set.action_id_map
+        prefix = (0,) * (len(self.set_params) - 1)
+        set_ids = [ids[prefix[:k]] for k in range(len(self.set_params))]
+        meas_ids = [ids.get(prefix + (k,))
+                    for k in range(len(self.actions))]
+        adaptive_id = meas_ids[self.actions.index(self.adaptive_param)]
+
+        order = DataArray(name='sample_order', array_id='sample_order',
+                          label='sample order',
+                          set_arrays=data_set.arrays[adaptive_id].set_arrays,
+                          preset_data=np.full(
+                              data_set.arrays[adaptive_id].shape, np.nan))
+        data_set.add_array(order)
+        for i, value in enumerate(self.set_params[0][1]):
+            setpoints = {set_ids[0]: value}
+            if len(self.set_params) > 1:
+                setpoints[set_ids[1]] = self.set_params[1][1]
+            data_set.store((i,), setpoints)
+
+        station = qc.Station.default
+        if station:
+            data_set.add_metadata({'station': station.snapshot()})
+        data_set.add_metadata({'loop': {
+            'ts_start': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'use_threads': False}})
+        # the points are not measured in order, so they are all written
+        # in finalize
+        data_set.write_period = None
+
+        current = [None] * len(self.set_params)
+        try:
+            while (self.max_points is None or
+                   len(self.learner.points) < self.max_points):
+                if (self.loss_goal is not None and
+                        self.learner.loss() <= self.loss_goal):
+                    break
+                index = self.learner.ask()
+                if index is None:
+                    break
+                for k, (param, setpoints, delay) in enumerate(self.set_params):
+                    if current[k] != index[k]:
+                        param.set(setpoints[index[k]])
+                        time.sleep(delay)
+                        current[k] = index[k]
+
+                values = {'sample_order': len(self.learner.points) + 1}
+                for action, array_id in zip(self.actions, meas_ids):
+                    if array_id is None:
+                        action()
+                    else:
+                        values[array_id] = action.get()
+                data_set.store(index, values)
+                self.learner.tell(index, values[adaptive_id])
+                if bg_task is not None:
+                    bg_task()
+        finally:
+            self._fill_unmeasured(data_set, [array_id for array_id in meas_ids
+                                             if array_id is not None])
+            data_set.add_metadata({
+                'loop': {'ts_end': time.strftime('%Y-%m-%d %H:%M:%S')},
+                'adaptive': {'learner': type(self.learner).__name__,
+                             'adaptive_param': adaptive_id,
+                             'max_points': self.max_points,
+                             'loss_goal': self.loss_goal,
+                             'measured_points': len(self.learner.points)}})
+            data_set.finalize()
+        return data_set
+
+    def _fill_unmeasured(self, data_set: DataSet,
+                         array_ids: Sequence[str]) -> None:
+        # a triangulation needs at least three points
+        if len(self.learner.points) <= len(self.set_params):
+            return
+        unmeasured = np.isnan(data_set.arrays['sample_order'].ndarray)
+        everywhere = (slice(None),) * len(self.set_params)
+        filled = {}
+        for array_id in array_ids:
+            array = data_set.arrays[array_id]
+            try:
+                interpolated = self.learner.interpolate(
+                    [array.ndarray[point] for point in self.learner.points])
+            except Exception:
+                log.exception('Could not interpolate the unmeasured points '
+                              'of {}'.format(array_id))
+                continue
+            filled[array_id] = np.where(unmeasured, interpolated,
+                                        array.ndarray)
+        data_set.store(everywhere, filled)
+
+
 def _do_measurement_single(measurement: Measure, meas_params: tuple,
                            do_plots: Optional[bool]=True,
                            use_threads: bool=True) -> Tuple[QtPlot, DataSet]:
@@ -95,7 +406,10 @@ def _do_measurement_single(measurement: Measure, meas_params: tuple,
 
 def _do_measurement(loop: Loop, set_params: tuple, meas_params: tuple,
                     do_plots: Optional[bool]=True,
-                    use_threads: bool=True) -> Tuple[QtPlot, DataSet]:
+                    use_threads: bool=True,
+                    runner: Optional[Callable]=None,
+                    pipeline: Optional[_AcquisitionPipeline]=None
+                    ) -> Tuple[QtPlot, DataSet]:
     """
     The function to handle all the auxiliary magic of the T10 users, e.g.
     their plotting specifications, the device image annotation etc.
@@ -110,6 +424,12 @@ def _do_measurement(loop: Loop, set_params: tuple, meas_params: tuple,
         use_threads: Whether to use threads to parallelise simultaneous
             measurements. If only one thing is being measured at the time
             in loop, this does nothing.
+        runner: If given the loop is not run, instead runner is called
+            with the dataset of the loop and the LivePlot updating the
+            plot (None if not plotting) to measure the data, see
+            _AdaptiveSweep.
+        pipeline: The _AcquisitionPipeline of the loop if it is pipelined.
+            Its pending points are stored before the plots are saved.
     Returns:
         (plot, data)
     """
@@ -130,6 +450,8 @@ def _do_measurement(loop: Loop, set_params: tuple, meas_params: tuple,
         interrupted = False
 
         data = loop.get_data_set()
+        if pipeline is not None and data.write_period is not None:
+            data.write_period = max(data.write_period, pipeline.write_period)
 
         if do_plots:
             try:
@@ -141,16 +463,25 @@ def _do_measurement(loop: Loop, set_params: tuple, meas_params: tuple,
         else:
             plot = None
         try:
-            if do_plots:
-                _ = loop.with_bg_task(plot.update).run(use_threads=use_threads)
+            if runner is not None:
+                runner(data, LivePlot(plot) if do_plots else None)
+            elif do_plots:
+                _ = loop.with_bg_task(LivePlot(plot)).run(
+                    use_threads=use_threads)
             else:
                 _ = loop.run(use_threads=use_threads)
         except KeyboardInterrupt:
             interrupted = True
             print("Measurement Interrupted")
+        if pipeline is not None and pipeline.flush():
+            # the loop was interrupted before it stored the pending points
+            # and it has already finalized the dataset
+            data.finalize()
         if do_plots:
             # Ensure the correct scaling before saving
             try:
+                # the live plot may be throttled and decimated
+                plot.update()
                 plot.autorange()
                 plot.save()
             except (ClosedError, ConnectionError):
@@ -175,39 +506,23 @@ def _do_measurement(loop: Loop, set_params: tuple, meas_params: tuple,
 
 
 def _do_MatPlot(data,meas_params):
+    array_names = _array_names(data, meas_params)
+    title = _plot_title(data)
+    pdf_subfolder = CURRENT_EXPERIMENT.get('pdf_subfolder')
+    png_subfolder = CURRENT_EXPERIMENT.get('png_subfolder')
+    if background_rendering_enabled():
+        submit_render('{} plots'.format(title), _save_MatPlot_from_disk,
+                      os.getcwd(), data.location, data.io.base_location,
+                      array_names, title, pdf_subfolder, png_subfolder)
+        return
     plt.ioff()
-    plot, num_subplots = _plot_setup(data, meas_params, useQT=False)
-    # pad a bit more to prevent overlap between
-    # suptitle and title
-    plot.rescale_axis()
-    plot.fig.tight_layout(pad=3)
-
-    if 'pdf_subfolder' in CURRENT_EXPERIMENT:
-        title_list = plot.get_default_title().split(sep)
-        title_list.insert(-1, CURRENT_EXPERIMENT['pdf_subfolder'])
-        title = sep.join(title_list)
-        plot.save("{}.pdf".format(title))
-
-    if 'png_subfolder' in CURRENT_EXPERIMENT:
-        title_list = plot.get_default_title().split(sep)
-        title_list.insert(-1, CURRENT_EXPERIMENT['png_subfolder'])
-        title = sep.join(title_list)
-        plot.fig.savefig("{}.png".format(title),dpi=500)
-
-    if (pdfdisplay['combined'] or
-            (num_subplots == 1 and pdfdisplay['individual'])):
-        plot.fig.canvas.draw()
-        plt.show()
-    else:
-        plt.close(plot.fig)
-    if num_subplots > 1:
-        _save_individual_plots(data, meas_params,
-                               pdfdisplay['individual'])
+    _save_MatPlot(data, array_names, title, pdf_subfolder, png_subfolder,
+                  pdfdisplay['combined'], pdfdisplay['individual'])
     plt.ion()
 
 
 def do1d(inst_set, start, stop, num_points, delay, *inst_meas, do_plots=True,
-         use_threads=False):
+         use_threads=False, pipelined=False):
     """
 
     Args:
@@ -223,6 +538,9 @@ def do1d(inst_set, start, stop, num_points, delay, *inst_meas, do_plots=True,
              and can be displayed with show_num.
         use_threads: If True and if multiple things are being measured,
             multiple threads will be used to parallelise the waiting.
+        pipelined: If True the data of the parameters which support
+            asynchronous acquisition (Alazar channels) is processed while
+            the next point is set and acquired.
 
     Returns:
         plot, data : returns the plot and the dataset
@@ -236,8 +554,17 @@ def do1d(inst_set, start, stop, num_points, delay, *inst_meas, do_plots=True,
     set_params = (inst_set, start, stop),
     meas_params = _select_plottables(inst_meas)
 
-    plot, data = _do_measurement(loop, set_params, meas_params,
-                                 do_plots=do_plots, use_threads=use_threads)
+    if pipelined:
+        with _AcquisitionPipeline(inst_meas) as pipeline:
+            plot, data = _do_measurement(loop.then(Task(pipeline.flush)),
+                                         set_params, meas_params,
+                                         do_plots=do_plots,
+                                         use_threads=use_threads,
+                                         pipeline=pipeline)
+    else:
+        plot, data = _do_measurement(loop, set_params, meas_params,
+                                     do_plots=do_plots,
+                                     use_threads=use_threads)
 
     return plot, data
 
@@ -291,7 +618,9 @@ def do2d(inst_set, start, stop, num_points, delay,
          set_before_sweep: Optional[bool]=False,
          innerloop_repetitions: Optional[int]=1,
          innerloop_pre_tasks: Optional[Sequence]=None,
-         innerloop_post_tasks: Optional[Sequence]=None):
+         innerloop_post_tasks: Optional[Sequence]=None,
+         pipelined: bool=False,
+         snake: bool=False):
     """
 
     Args:
@@ -316,13 +645,38 @@ def do2d(inst_set, start, stop, num_points, delay,
             outer loop
         innerloop_post_tasks: Tasks to execute after each iteration of the
             outer loop
+        pipelined: If True the data of the parameters which support
+            asynchronous acquisition (Alazar channels) is processed while
+            the next point is set and acquired. Not supported with
+            innerloop_repetitions.
+        snake: If True the second instrument is swept from start2 to stop2
+            and back from stop2 to start2 on alternate steps of the first
+            instrument, which avoids sweeping it back to start2 before every
+            step. The data is stored on the same grid as a normal sweep.
+            set_before_sweep is ignored as the second instrument is already
+            at the first value of the next sweep. Not supported with
+            innerloop_repetitions. The data file is rewritten at every
+            periodic save during a reversed sweep, see _SnakeLoop.
+
+    Parameters of inst_meas which are BufferedReadouts (e.g. the conductance
+    of an SR830_ext or the ivconv_buffer of a Keysight_34465A_ext) are not
+    read at each point: their buffer is armed before each sweep of the
+    second instrument, triggered at each point after delay2 and the whole
+    sweep is read from the buffer at its end. They are not supported with
+    innerloop_repetitions, pipelined or snake.
 
     Returns:
         plot, data : returns the plot and the dataset
 
     """
 
+    buffered = [inst for inst in inst_meas
+                if isinstance(inst, BufferedReadout)]
+    # parameters are compared by identity, == of a parameter is deferred
+    buffered_ids = {id(inst) for inst in buffered}
     for inst in inst_meas:
+        if id(inst) in buffered_ids:
+            continue
         if getattr(inst, "setpoints", False):
             setpoints = inst.setpoints
             if isinstance(setpoints, Iterable):
@@ -330,16 +684,38 @@ def do2d(inst_set, start, stop, num_points, delay,
                     continue
             raise ValueError("3d plotting is not supported")
 
+    if pipelined and innerloop_repetitions > 1:
+        raise ValueError("pipelined is not supported with "
+                         "innerloop_repetitions")
+    if snake and innerloop_repetitions > 1:
+        # the direction alternates with the steps of the first instrument,
+        # all repetitions of a step would be swept in the same direction
+        raise ValueError("snake is not supported with "
+                         "innerloop_repetitions")
+    if buffered and (innerloop_repetitions > 1 or pipelined or snake):
+        raise ValueError("Buffered readouts are not supported with "
+                         "innerloop_repetitions, pipelined or snake")
+
+    if buffered:
+        inner_actions = ([Task(_trigger_buffers, buffered)] +
+                         [inst for inst in inst_meas
+                          if id(inst) not in buffered_ids])
+    else:
+        inner_actions = inst_meas
+
     actions = []
     for i_rep in range(innerloop_repetitions):
-        innerloop = qc.Loop(inst_set2.sweep(start2,
-                                            stop2,
-                                            num=num_points2),
-                            delay2).each(*inst_meas)
-        if set_before_sweep:
-            ateach = [innerloop, Task(inst_set2, start2)]
+        innerloop = _inner_loop(inst_set2.sweep(start2,
+                                                stop2,
+                                                num=num_points2),
+                                delay2, inner_actions, snake=snake)
+        if buffered:
+            ateach = ([Task(_arm_buffers, buffered), innerloop] +
+                      buffered)
         else:
             ateach = [innerloop]
+        if set_before_sweep and not snake:
+            ateach.append(Task(inst_set2, start2))
 
         if innerloop_pre_tasks is not None:
             ateach = list(innerloop_pre_tasks) + ateach
@@ -357,8 +733,177 @@ def do2d(inst_set, start, stop, num_points, delay,
                   (inst_set2, start2, stop2))
     meas_params = _select_plottables(inst_meas)
 
+    if pipelined:
+        with _AcquisitionPipeline(inst_meas, snake=snake) as pipeline:
+            plot, data = _do_measurement(outerloop.then(Task(pipeline.flush)),
+                                         set_params, meas_params,
+                                         do_plots=do_plots,
+                                         use_threads=use_threads,
+                                         pipeline=pipeline)
+    else:
+        try:
+            for readout in buffered:
+                readout.prepare_buffer(inst_set2.sweep(start2, stop2,
+                                                       num=num_points2))
+            plot, data = _do_measurement(outerloop, set_params, meas_params,
+                                         do_plots=do_plots,
+                                         use_threads=use_threads)
+        finally:
+            for readout in buffered:
+                readout.finish_buffer()
+
+    return plot, data
+
+
+def _arm_buffers(readouts: Sequence[BufferedReadout]) -> None:
+    for readout in readouts:
+        readout.arm_buffer()
+
+
+def _trigger_buffers(readouts: Sequence[BufferedReadout]) -> None:
+    for readout in readouts:
+        readout.trigger_buffer()
+
+
+def _adaptive_actions(inst_meas: Sequence, adaptive_param):
+    for inst in inst_meas:
+        if hasattr(inst, 'get') and (hasattr(inst, 'names') or
+                                     getattr(inst, 'shape', ())):
+            raise ValueError("Adaptive sweeps only support parameters "
+                             "returning a single number, got "
+                             "{}".format(inst.full_name))
+    measured = [inst for inst in inst_meas if hasattr(inst, 'get')]
+    if not measured:
+        raise ValueError("An adaptive sweep needs a parameter to measure")
+    if adaptive_param is None:
+        adaptive_param = measured[0]
+    elif not any(inst is adaptive_param for inst in measured):
+        raise ValueError("adaptive_param must be one of the measured "
+                         "parameters")
+    return adaptive_param
+
+
+def do1d_adaptive(inst_set, start, stop, num_points, delay, *inst_meas,
+                  max_points: Optional[int]=None,
+                  loss_goal: Optional[float]=None,
+                  initial_points: int=10,
+                  adaptive_param=None,
+                  do_plots=True):
+    """
+    Like do1d but measures only part of the num_points points, chosen
+    adaptively: after initial_points evenly spaced points the interval
+    between two measured points in which adaptive_param changes most is
+    split, so features are resolved with few points and flat regions are
+    sampled sparsely. The points which are not measured are linearly
+    interpolated, the sample_order array of the dataset marks the measured
+    points. See adaptive_sampling.IntervalLearner.
+
+    Args:
+        inst_set:  Instrument to sweep over
+        start:  Start of sweep
+        stop:  End of sweep
+        num_points:  Number of points of the grid (the resolution)
+        delay:  Delay at every step
+        *inst_meas:  any number of parameters returning a single number
+          to measure and/or tasks to perform at each point
+        max_points: maximal number of points to measure
+        loss_goal: stop when the largest loss of an interval (its length
+            with both axes scaled to 1) drops below loss_goal
+        initial_points: number of evenly spaced points measured first
+        adaptive_param: the parameter which decides where to measure,
+            default the first measured parameter
+        do_plots: Default True: If False no plots are produced.
+            Data is still saved and can be displayed with show_num.
+
+    Returns:
+        plot, data : returns the plot and the dataset
+
+    """
+    adaptive_param = _adaptive_actions(inst_meas, adaptive_param)
+    sweep = inst_set.sweep(start, stop, num=num_points)
+    loop = qc.Loop(sweep, delay).each(*inst_meas)
+
+    set_params = (inst_set, start, stop),
+    meas_params = _select_plottables(inst_meas)
+
+    runner = _AdaptiveSweep(IntervalLearner(num_points, initial_points),
+                            ((inst_set, list(sweep), delay),),
+                            inst_meas, adaptive_param,
+                            max_points=max_points, loss_goal=loss_goal)
+    plot, data = _do_measurement(loop, set_params, meas_params,
+                                 do_plots=do_plots, runner=runner)
+
+    return plot, data
+
+
+def do2d_adaptive(inst_set, start, stop, num_points, delay,
+                  inst_set2, start2, stop2, num_points2, delay2,
+                  *inst_meas,
+                  max_points: Optional[int]=None,
+                  loss_goal: Optional[float]=None,
+                  initial_points: int=100,
+                  adaptive_param=None,
+                  do_plots=True):
+    """
+    Like do2d but measures only part of the points of the grid, chosen
+    adaptively: after a coarse grid of about initial_points points the
+    triangles of the triangulation of the measured points across which
+    adaptive_param changes most are split, so features like lines or
+    edges are resolved with few points and flat regions are sampled
+    sparsely. The points which are not measured are linearly interpolated,
+    the sample_order array of the dataset marks the measured points. See
+    adaptive_sampling.TriangulationLearner.
+
+    Both instruments are set in arbitrary order, so this is not suited to
+    instruments which are slow to step or hysteretic.
+
+    Args:
+        inst_set:  Instrument to sweep over
+        start:  Start of sweep
+        stop:  End of sweep
+        num_points:  Number of points of the grid (the resolution)
+        delay:  Delay after setting the first instrument
+        inst_set2:  Second instrument to sweep over
+        start2:  Start of sweep for second instrument
+        stop2:  End of sweep for second instrument
+        num_points2:  Number of points of the grid for second instrument
+        delay2:  Delay after setting the second instrument
+        *inst_meas:  any number of parameters returning a single number
+          to measure and/or tasks to perform at each point
+        max_points: maximal number of points to measure
+        loss_goal: stop when the largest loss of a triangle drops below
+            loss_goal
+        initial_points: approximate number of points of the coarse grid
+            measured first, at least 3 along each axis
+        adaptive_param: the parameter which decides where to measure,
+            default the first measured parameter
+        do_plots: Default True: If False no plots are produced.
+            Data is still saved and can be displayed with show_num.
+
+    num_points and num_points2 must be at least 3.
+
+    Returns:
+        plot, data : returns the plot and the dataset
+
+    """
+    adaptive_param = _adaptive_actions(inst_meas, adaptive_param)
+    sweep = inst_set.sweep(start, stop, num=num_points)
+    sweep2 = inst_set2.sweep(start2, stop2, num=num_points2)
+    innerloop = qc.Loop(sweep2, delay2).each(*inst_meas)
+    outerloop = qc.Loop(sweep, delay).each(innerloop)
+
+    set_params = ((inst_set, start, stop),
+                  (inst_set2, start2, stop2))
+    meas_params = _select_plottables(inst_meas)
+
+    runner = _AdaptiveSweep(TriangulationLearner((num_points, num_points2),
+                                                 initial_points),
+                            ((inst_set, list(sweep), delay),
+                             (inst_set2, list(sweep2), delay2)),
+                            inst_meas, adaptive_param,
+                            max_points=max_points, loss_goal=loss_goal)
     plot, data = _do_measurement(outerloop, set_params, meas_params,
-                                 do_plots=do_plots, use_threads=use_threads)
+                                 do_plots=do_plots, runner=runner)
 
     return plot, data
 
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from qdev_wrappers.adaptive_sampling import IntervalLearner, \
+    TriangulationLearner
+
+
+def _run(learner, function, max_points=10**6):
+    while len(learner.points) < max_points:
+        index = learner.ask()
+        if index is None:
+            break
+        learner.tell(index, function(index))
+    return learner
+
+
+def _step(index):
+    return float(index[0] > 30)
+
+
+def _ridge(index):
+    return float(np.exp(-(index[0] - index[1])**2 / 4))
+
+
+def test_interval_learner_measures_every_point_once():
+    learner = _run(IntervalLearner(50, initial_points=5), _step)
+    assert sorted(learner.points) == [(i,) for i in range(50)]
+    assert learner.loss() == 0
+    assert learner.ask() is None
+
+
+def test_interval_learner_refines_the_step():
+    learner = _run(IntervalLearner(101, initial_points=5), _step,
+                   max_points=15)
+    assert {(30,), (31,)} <= set(learner.points)
+    np.testing.assert_array_equal(learner.interpolate(),
+                                  [_step((i,)) for i in range(101)])
+
+
+def test_interval_learner_needs_two_points():
+    with pytest.raises(ValueError):
+        IntervalLearner(1)
+
+
+def test_triangulation_learner_is_exhausted_on_a_small_grid():
+    learner = _run(TriangulationLearner((7, 9), initial_points=4), _ridge)
+    assert len(learner.points) == len(set(learner.points))
+    assert set(learner.points) == {(i, j) for i in range(7)
+                                   for j in range(9)}
+    assert learner.loss() == 0
+    assert learner.ask() is None
+
+
+@pytest.mark.parametrize('shape, initial_points',
+                         [((30, 30), 1), ((3, 3), 1), ((3, 40), 4)])
+def test_triangulation_learner_few_initial_points(shape, initial_points):
+    learner = _run(TriangulationLearner(shape, initial_points), _ridge,
+                   max_points=50)
+    assert len(learner.points) == min(50, shape[0] * shape[1])
+    assert learner.interpolate().shape == shape
+
+
+def test_triangulation_learner_needs_three_points_per_axis():
+    with pytest.raises(ValueError):
+        TriangulationLearner((2, 30))
+
+
+def test_triangulation_learner_reaches_loss_goal():
+    learner = TriangulationLearner((40, 40), initial_points=25)
+    while learner.loss() > 0.01:
+        index = learner.ask()
+        assert index is not None
+        learner.tell(index, _ridge(index))
+    assert len(learner.points) < 40 * 40
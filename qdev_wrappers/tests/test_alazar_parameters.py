@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import qcodes as qc
+from qcodes import Parameter
+
+from qdev_wrappers.alazar_controllers.ATSChannelController import \
+    ATSChannelController
+from qdev_wrappers.alazar_controllers.alazar_channel import AlazarChannel
+from qdev_wrappers.alazar_controllers.alazar_multidim_parameters import \
+    Alazar1DParameter, Alazar2DParameter
+from qdev_wrappers.alazar_controllers.simulated_alazar import \
+    SimulatedATS9360
+
+
+@pytest.fixture
+def controller():
+    alazar = SimulatedATS9360('test_params_alazar', seed=0)
+    alazar.set_tones('A', [(20e6, 0.1, 0.3)])
+    controller = ATSChannelController('test_params_controller', alazar.name)
+    controller.int_delay(2e-7)
+    controller.int_time(2e-6)
+    yield controller
+    controller.close()
+    alazar.close()
+
+
+def add_channel(controller, name, **kwargs):
+    channel = AlazarChannel(controller, name, demod=True,
+                            integrate_samples=False, **kwargs)
+    controller.channels.append(channel)
+    channel.demod_freq(20e6)
+    channel.num_averages(4)
+    return channel
+
+
+def test_setpoints_are_hashable_and_read_only(controller):
+    channel = add_channel(controller, 'trace', average_records=False)
+    channel.records_per_buffer(3)
+    channel.prepare_channel()
+    assert isinstance(channel.data, Alazar2DParameter)
+    outer, inner = channel.data.setpoints
+    assert inner.shape == channel.data.shape
+    for setpoints in (outer, inner):
+        hash(setpoints)
+        assert not setpoints.flags.writeable
+    np.testing.assert_array_equal(outer, [0, 1, 2])
+    np.testing.assert_array_equal(inner, np.tile(inner[0], (3, 1)))
+
+
+def test_loop_over_1d_and_2d_parameters(controller):
+    trace = add_channel(controller, 'trace')
+    records = add_channel(controller, 'records', average_records=False)
+    records.records_per_buffer(2)
+    trace.prepare_channel()
+    records.prepare_channel()
+    assert isinstance(trace.data, Alazar1DParameter)
+    assert isinstance(records.data, Alazar2DParameter)
+
+    sweep = Parameter('sweep', set_cmd=None)
+    loop = qc.Loop(sweep.sweep(0, 1, num=2)).each(trace.data, records.data)
+    data = loop.get_data_set(location=False)
+    loop.run(quiet=True)
+
+    trace_data = getattr(data, trace.data.full_name)
+    records_data = getattr(data, records.data.full_name)
+    assert trace_data.shape == (2,) + trace.data.shape
+    assert records_data.shape == (2,) + records.data.shape
+    assert np.all(np.isfinite(trace_data.ndarray))
+    assert np.all(np.isfinite(records_data.ndarray))
+    np.testing.assert_allclose(trace_data.set_arrays[1].ndarray[0],
+                               trace.data.setpoints[0])
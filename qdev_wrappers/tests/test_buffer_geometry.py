@@ -0,0 +1,46 @@
+import pytest
+
+from qdev_wrappers.alazar_controllers.buffer_geometry import \
+    BufferTimingModel, optimal_allocated_buffers, optimize_buffer_geometry
+
+MODEL = BufferTimingModel()
+SAMPLES_PER_RECORD = 1024**2
+# bytes of a record of a single channel
+RECORD_BYTES = 2 * SAMPLES_PER_RECORD
+MAX_BYTES = 20 * 1024**2
+
+
+def test_allocated_buffers_fit_in_max_bytes():
+    for records in (1, 2, 4, 8, 10):
+        allocated = optimal_allocated_buffers(MODEL, records, 100,
+                                              SAMPLES_PER_RECORD, 1e9,
+                                              max_allocated_bytes=MAX_BYTES)
+        assert allocated >= 1
+        assert allocated * records * RECORD_BYTES <= MAX_BYTES
+
+
+def test_two_buffers_allocated_if_they_fit():
+    allocated = optimal_allocated_buffers(MODEL, 4, 100, SAMPLES_PER_RECORD,
+                                          1e9, max_allocated_bytes=MAX_BYTES)
+    assert allocated >= 2
+
+
+def test_single_buffer_for_single_buffer_acquisition():
+    assert optimal_allocated_buffers(MODEL, 4, 1, SAMPLES_PER_RECORD,
+                                     1e9, max_allocated_bytes=MAX_BYTES) == 1
+
+
+def test_buffer_larger_than_max_bytes_raises():
+    with pytest.raises(ValueError):
+        optimal_allocated_buffers(MODEL, 16, 100, SAMPLES_PER_RECORD, 1e9,
+                                  max_allocated_bytes=MAX_BYTES)
+
+
+def test_optimized_geometry_fits_in_max_bytes():
+    geometry = optimize_buffer_geometry(MODEL, 100, SAMPLES_PER_RECORD, 1e9,
+                                        max_samples=10**9,
+                                        max_allocated_bytes=MAX_BYTES)
+    assert (geometry.records_per_buffer * geometry.buffers_per_acquisition
+            >= 100)
+    assert (geometry.allocated_buffers * geometry.records_per_buffer *
+            RECORD_BYTES <= MAX_BYTES)
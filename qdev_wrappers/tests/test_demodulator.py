@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from qdev_wrappers.alazar_controllers.demodulator import Demodulator
+
+SAMPLE_RATE = 1e9
+FILTER_SETTINGS = {'filter': 0, 'numtaps': 101, 'decimation': 1,
+                   'cic_order': 5}
+
+
+def _demodulator():
+    return Demodulator(1024, SAMPLE_RATE, FILTER_SETTINGS, [20e6])
+
+
+def test_integration_weights_average_the_window():
+    weights = _demodulator().integration_weights(2e-7, 5e-7)
+    assert weights.shape == (1024, 2)
+    assert np.all(np.isfinite(weights))
+
+
+@pytest.mark.parametrize('int_delay, int_time', [(2e-7, 0), (2e-6, 5e-7)])
+def test_empty_integration_window_is_rejected(int_delay, int_time):
+    with pytest.raises(ValueError):
+        _demodulator().integration_weights(int_delay, int_time)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import qcodes as qc
+from qcodes import Parameter
+
+from qdev_wrappers.alazar_controllers.ATSChannelController import \
+    ATSChannelController
+from qdev_wrappers.alazar_controllers.multiplexed_channel import \
+    AlazarMultiplexedChannel
+from qdev_wrappers.alazar_controllers.simulated_alazar import \
+    SimulatedATS9360
+
+
+@pytest.fixture
+def controller():
+    alazar = SimulatedATS9360('test_mux_alazar', seed=0)
+    controller = ATSChannelController('test_mux_controller', alazar.name)
+    alazar.set_tones('A', [(20e6, 0.05, 0.3), (35e6, 0.05, 0.3)])
+    controller.int_delay(2e-7)
+    controller.int_time(2e-6)
+    yield controller
+    controller.close()
+    alazar.close()
+
+
+def _readout(controller, average_records=True):
+    readout = AlazarMultiplexedChannel(controller, 'mux', [20e6, 35e6],
+                                       average_records=average_records)
+    readout.num_averages(4)
+    readout.prepare_channel()
+    return readout
+
+
+def test_setpoints_are_the_demod_freqs(controller):
+    readout = _readout(controller)
+    assert readout.data.get().shape == (2,)
+    np.testing.assert_array_equal(readout.data.setpoints[0], [20e6, 35e6])
+
+
+def test_retuning_requires_prepare_channel(controller):
+    readout = _readout(controller)
+    readout.demod_freqs([21e6, 36e6])
+    with pytest.raises(RuntimeError):
+        readout.data.get()
+    readout.prepare_channel()
+    np.testing.assert_array_equal(readout.data.setpoints[0], [21e6, 36e6])
+    assert readout.data.get().shape == (2,)
+
+
+def test_changing_the_shape_requires_prepare_channel(controller):
+    readout = _readout(controller, average_records=False)
+    readout.records_per_buffer(3)
+    with pytest.raises(RuntimeError):
+        readout.data.get()
+    readout.prepare_channel()
+    assert readout.data.shape == (2, 3)
+    assert readout.data.get().shape == (2, 3)
+
+
+@pytest.mark.parametrize('average_records', [True, False])
+def test_loop_over_multiplexed_data(controller, average_records):
+    readout = _readout(controller, average_records=average_records)
+    if not average_records:
+        readout.records_per_buffer(2)
+        readout.prepare_channel()
+    sweep = Parameter('sweep', set_cmd=None)
+    loop = qc.Loop(sweep.sweep(0, 1, num=2)).each(readout.data)
+    data = loop.get_data_set(location=False)
+    loop.run(quiet=True)
+    array = getattr(data, readout.data.full_name)
+    assert array.shape == (2,) + readout.data.shape
+    np.testing.assert_array_equal(array.set_arrays[1].ndarray[0],
+                                  [20e6, 35e6])
+    assert np.all(np.isfinite(array.ndarray))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from qdev_wrappers.alazar_controllers.ATS9360Controller import \
+    ATS9360Controller
+from qdev_wrappers.alazar_controllers.ATSChannelController import \
+    ATSChannelController
+from qdev_wrappers.alazar_controllers.alazar_channel import AlazarChannel
+from qdev_wrappers.alazar_controllers.discriminator import \
+    LinearDiscriminator
+from qdev_wrappers.alazar_controllers.simulated_alazar import \
+    SimulatedATS9360
+
+AMPLITUDE = 0.1
+
+
+@pytest.fixture
+def alazar():
+    alazar = SimulatedATS9360('test_sim_alazar', seed=0)
+    alazar.set_tones('A', [(20e6, AMPLITUDE, 0.3)])
+    alazar.noise(0.001)
+    yield alazar
+    alazar.close()
+
+
+def test_channel_controller_acquires(alazar):
+    controller = ATSChannelController('test_sim_controller', alazar.name)
+    try:
+        controller.int_delay(2e-7)
+        controller.int_time(2e-6)
+        channel = AlazarChannel(controller, 'channel', demod=True)
+        controller.channels.append(channel)
+        channel.demod_freq(20e6)
+        channel.num_averages(10)
+        channel.prepare_channel()
+        # the demodulated magnitude is half the amplitude of the tone
+        assert channel.data.get() == pytest.approx(AMPLITUDE / 2, rel=0.01)
+    finally:
+        controller.close()
+
+
+def test_ats9360_controller_acquires(alazar):
+    controller = ATS9360Controller('test_sim_ats9360', alazar.name,
+                                   integrate_samples=True)
+    try:
+        controller.int_delay(2e-7)
+        controller.int_time(2e-6)
+        controller.demod_freqs.add_demodulator(20e6)
+        controller.num_avg(10)
+        raw, magnitude, phase = controller.acquisition.get()
+        assert magnitude == pytest.approx(AMPLITUDE / 2, rel=0.01)
+        assert np.isfinite(phase)
+    finally:
+        controller.close()
+
+
+@pytest.mark.parametrize('records', [1, 3])
+def test_populations_keep_the_records_axis(alazar, records):
+    controller = ATSChannelController('test_sim_populations', alazar.name)
+    try:
+        controller.int_delay(2e-7)
+        controller.int_time(2e-6)
+        channel = AlazarChannel(controller, 'channel', demod=True,
+                                average_buffers=False,
+                                average_records=False)
+        controller.channels.append(channel)
+        channel.demod_freq(20e6)
+        channel.demod_type('populations')
+        channel.set_discriminator(LinearDiscriminator(axis=1, threshold=0))
+        channel.records_per_buffer(records)
+        channel.buffers_per_acquisition(10)
+        channel.prepare_channel()
+        populations = channel.data.get()
+        assert channel.data.shape == (records, 2)
+        assert populations.shape == (records, 2)
+        np.testing.assert_allclose(populations.sum(axis=1), 1)
+    finally:
+        controller.close()
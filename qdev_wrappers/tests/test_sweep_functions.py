@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from qcodes import ArrayParameter, Parameter
+from qcodes.data.data_set import DataSet
+from qcodes.data.io import DiskIO
+
+from qdev_wrappers.alazar_controllers.ATSChannelController import \
+    ATSChannelController
+from qdev_wrappers.alazar_controllers.alazar_channel import AlazarChannel
+from qdev_wrappers.alazar_controllers.alazar_multidim_parameters import \
+    Alazar1DParameter
+from qdev_wrappers.alazar_controllers.simulated_alazar import \
+    SimulatedATS9360
+from qdev_wrappers.customised_instruments.buffered_readout import \
+    BufferedReadout
+from qdev_wrappers.sweep_functions import do1d, do2d
+
+
+class _Buffer(BufferedReadout, ArrayParameter):
+    """
+    Buffer storing the value of source at each trigger.
+    """
+
+    def __init__(self, name, source):
+        super().__init__(name, shape=(1,), setpoint_names=('trigger',))
+        self.source = source
+        self.prepared = self.finished = 0
+        self._points = []
+
+    def _prepare_buffer(self, num_points):
+        self.prepared += 1
+
+    def arm_buffer(self):
+        self._points = []
+
+    def trigger_buffer(self):
+        self._points.append(self.source.get())
+
+    def get(self):
+        return np.array(self._points)
+
+    def finish_buffer(self):
+        self.finished += 1
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(DataSet, 'default_io', DiskIO(str(tmpdir)))
+
+
+def test_do2d_mixes_buffered_and_plain_readouts():
+    outer = Parameter('outer', set_cmd=None, initial_value=0)
+    inner = Parameter('inner', set_cmd=None, initial_value=0)
+    plain = Parameter('plain', get_cmd=lambda: 10 * outer() + inner())
+    buffer = _Buffer('buffer', plain)
+
+    _, data = do2d(outer, 0, 2, 3, 0, inner, 0, 3, 4, 0, buffer, plain,
+                   do_plots=False)
+
+    expected = 10 * np.arange(3)[:, None] + np.arange(4)
+    np.testing.assert_allclose(data.arrays['buffer'].ndarray, expected)
+    np.testing.assert_allclose(data.arrays['plain'].ndarray, expected)
+    assert (buffer.prepared, buffer.finished) == (1, 1)
+
+
+def test_do2d_finishes_the_buffers_if_preparing_fails():
+    outer = Parameter('outer', set_cmd=None, initial_value=0)
+    inner = Parameter('inner', set_cmd=None, initial_value=0)
+    buffer = _Buffer('buffer', outer)
+
+    def fail(num_points):
+        raise ValueError('buffer too small')
+    buffer._prepare_buffer = fail
+
+    with pytest.raises(ValueError):
+        do2d(outer, 0, 1, 2, 0, inner, 0, 1, 2, 0, buffer, do_plots=False)
+    assert buffer.finished == 1
+
+
+@pytest.fixture
+def alazar():
+    alazar = SimulatedATS9360('test_sweep_alazar', seed=0)
+    alazar.noise(0)
+    yield alazar
+    alazar.close()
+
+
+@pytest.fixture
+def controller(alazar):
+    controller = ATSChannelController('test_sweep_controller', alazar.name)
+    controller.int_delay(2e-7)
+    controller.int_time(2e-6)
+    yield controller
+    controller.close()
+
+
+def _data(controller, integrate_samples):
+    channel = AlazarChannel(controller, 'channel', demod=True,
+                            integrate_samples=integrate_samples)
+    controller.channels.append(channel)
+    channel.demod_freq(20e6)
+    channel.num_averages(4)
+    channel.prepare_channel()
+    return channel.data
+
+
+def _amplitude(alazar):
+    # the amplitude of the simulated tone follows the sweep so the data
+    # of every point differs
+    return Parameter('amplitude', initial_value=0.01, set_cmd=lambda value:
+                     alazar.set_tones('A', [(20e6, value, 0.3)]))
+
+
+def test_pipelined_do1d_matches_do1d(alazar, controller):
+    trace = _data(controller, integrate_samples=False)
+    assert isinstance(trace, Alazar1DParameter)
+    amplitude = _amplitude(alazar)
+    _, data = do1d(amplitude, 0.01, 0.1, 4, 0, trace, do_plots=False)
+    _, pipelined = do1d(amplitude, 0.01, 0.1, 4, 0, trace, do_plots=False,
+                        pipelined=True)
+    expected = data.arrays[trace.full_name].ndarray
+    assert np.all(np.isfinite(expected)) and np.ptp(expected) > 0
+    np.testing.assert_array_equal(
+        pipelined.arrays[trace.full_name].ndarray, expected)
+
+
+@pytest.mark.parametrize('snake', [False, True])
+def test_pipelined_do2d_matches_do2d(alazar, controller, snake):
+    point = _data(controller, integrate_samples=True)
+    amplitude = _amplitude(alazar)
+    offset = Parameter('offset', set_cmd=None, initial_value=0)
+    sweeps = (offset, 0, 1, 2, 0, amplitude, 0.01, 0.1, 3, 0)
+    _, data = do2d(*sweeps, point, do_plots=False)
+    _, pipelined = do2d(*sweeps, point, do_plots=False, pipelined=True,
+                        snake=snake)
+    expected = data.arrays[point.full_name].ndarray
+    assert np.all(np.isfinite(expected)) and np.ptp(expected) > 0
+    np.testing.assert_array_equal(
+        pipelined.arrays[point.full_name].ndarray, expected)
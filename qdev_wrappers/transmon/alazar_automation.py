@@ -5,7 +5,9 @@ import datetime
 from . import do_cavity_freq_sweep, find_extreme, set_calibration_val, \
     set_single_demod_freq, get_calibration_val, set_up_sequence, \
     sweep1d, measure, measure_ssb, sweep2d_ssb, check_seq_uploaded, \
-    get_demod_freq, get_t1, get_t2
+    get_demod_freq, get_t1, get_t2, set_integration_weights
+from qdev_wrappers.alazar_controllers.alazar_channel import AlazarChannel
+from qdev_wrappers.alazar_controllers.demodulator import matched_filter_weights
 
 from .sequencing import make_spectroscopy_SSB_sequence, make_rabi_sequence, \
     make_t1_sequence, make_ramsey_sequence
@@ -354,6 +356,61 @@ def do_t2_star(awg, alazar, acq_ctrl, qubit, start=0, stop=2e-6, step=20e-9,
     return data, plot1, plot2
 
 
+def calibrate_integration_weights(channel, ground_record=0, excited_record=1,
+                                  calib_update=True, qubit_index=None):
+    """
+    Automation function which measures the averaged demodulated traces of
+    the ground and excited state and calculates matched filter integration
+    weights from them. Assumes that a sequence is uploaded and the alazar
+    is in sequence mode such that the qubit is in the ground state in
+    record ground_record and in the excited state in record excited_record
+    (e.g. the first two elements of a rabi sequence with a pi pulse).
+
+    Args:
+        channel (AlazarChannel): demodulated records_vs_samples_trace
+            channel with records_per_buffer covering both records
+        ground_record (int) (default 0): record of the ground state
+        excited_record (int) (default 1): record of the excited state
+        calib_update (bool) (default True): whether to store the weights
+            with set_integration_weights
+        qubit_index (int) (default None): qubit to store the weights for
+
+    Returns:
+        weights to be set on integrating channels with
+            AlazarChannel.set_integration_weights
+    """
+    if not (channel._demod and channel._average_buffers and
+            not channel._average_records and not channel._integrate_samples):
+        raise RuntimeError('Integration weights are calibrated from a '
+                           'demodulated records_vs_samples_trace channel')
+    # the real and imaginary parts are acquired together by two channels
+    # with the settings of channel, which is left untouched
+    controller = channel._parent
+    quadratures = []
+    for demod_type in ('real', 'imag'):
+        quadrature = AlazarChannel(controller,
+                                   '{}_{}'.format(channel.short_name,
+                                                  demod_type),
+                                   demod=True,
+                                   alazar_channel=channel.alazar_channel(),
+                                   average_records=False,
+                                   integrate_samples=False)
+        quadrature.demod_freq(channel.demod_freq())
+        quadrature.demod_type(demod_type)
+        quadrature.records_per_buffer(channel.records_per_buffer())
+        quadrature.num_averages(channel.num_averages())
+        quadrature.prepare_channel()
+        quadratures.append(quadrature)
+    real, imag = controller.acquire_plan(
+        controller.acquisition_plan(quadratures))
+    trace = np.asarray(real) + 1j * np.asarray(imag)
+    weights = matched_filter_weights(trace[ground_record],
+                                     trace[excited_record])
+    if calib_update:
+        set_integration_weights(weights, qubit_index=qubit_index)
+    return weights
+
+
 def calibrate_pi_pulse(awg, alazar, acq_ctrl, qubit, start_dur=0,
                        stop_dur=200e-9, step_dur=1e-9, pi_pulse_amp=None,
                        qubit_power=None, freq_centre=None, freq_pm=10e6,
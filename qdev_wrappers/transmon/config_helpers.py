@@ -6,7 +6,7 @@ import pickle
 # import copy
 # from os.path import sep
 import logging
-# import numpy as np
+import numpy as np
 from shutil import copyfile
 from . import get_qubit_count, get_config_file, get_current_qubit, \
     get_local_config_file, get_local_scripts_location
@@ -230,6 +230,66 @@ def get_calibration_dict():
     return calib_dict
 
 
+def _get_integration_weights_file():
+    return get_local_scripts_location() + 'integration_weights.p'
+
+
+def get_integration_weights_dict():
+    """
+    Returns:
+        dict of the integration weights of the qubits by qubit index.
+        calib.config holds one number per qubit for each key so the
+        weights are kept in 'integration_weights.p' next to it.
+    """
+    filename = _get_integration_weights_file()
+    try:
+        weights_dict = pickle.load(open(filename, "rb"))
+    except FileNotFoundError:
+        weights_dict = {}
+    return weights_dict
+
+
+def set_integration_weights(weights, qubit_index: int=None):
+    """
+    Stores calibrated integration weights of a qubit, see
+    calibrate_integration_weights.
+
+    Args:
+        weights (complex numpy array or None): weights, None removes them
+        qubit_index (int): defaults to the current qubit or 0
+    """
+    qubit_index = _weights_qubit_index(qubit_index)
+    weights_dict = get_integration_weights_dict()
+    if weights is None:
+        weights_dict.pop(qubit_index, None)
+    else:
+        weights_dict[qubit_index] = np.array(weights, dtype=complex)
+    pickle.dump(weights_dict, open(_get_integration_weights_file(), 'wb'))
+
+
+def get_integration_weights(qubit_index: int=None):
+    """
+    Args:
+        qubit_index (int): defaults to the current qubit or 0
+
+    Returns:
+        integration weights of the qubit or None if not calibrated, to be
+        set with AlazarChannel.set_integration_weights
+    """
+    qubit_index = _weights_qubit_index(qubit_index)
+    return get_integration_weights_dict().get(qubit_index)
+
+
+def _weights_qubit_index(qubit_index):
+    if qubit_index is None:
+        qubit_index = get_current_qubit() or 0
+    qubit_count = get_qubit_count()
+    if qubit_count is not None and qubit_index >= qubit_count:
+        raise RuntimeError('qubit_index {} >= qubit_count {}'
+                           ''.format(qubit_index, qubit_count))
+    return qubit_index
+
+
 def print_pulse_settings():
     """
     Pretty prints pulse settings
@@ -1,6 +1,6 @@
 import qcodes as qc
 from qdev_wrappers.sweep_functions import _do_measurement, _do_measurement_single, \
-    _select_plottables
+    _select_plottables, _inner_loop
 
 
 def measure(meas_param, do_plots=True):
@@ -58,7 +58,7 @@ def sweep1d(meas_param, sweep_param, start, stop, step, delay=0.01,
 
 def sweep2d(meas_param, sweep_param1, start1, stop1, step1,
             sweep_param2, start2, stop2, step2, delay=0.01,
-            do_plots=True):
+            do_plots=True, snake=False):
     """
     Function which does a 2 dimensional sweep and optionally plots the results.
 
@@ -75,13 +75,16 @@ def sweep2d(meas_param, sweep_param1, start1, stop1, step1,
         delay (default 0.01): mimimum time to spend on each point
         do_plots: Default True: If False no plots are produced.
             Data is still saved and can be displayed with show_num.
+        snake (default False): sweep sweep_param2 in alternating
+            directions instead of returning to start2 for every value of
+            sweep_param1, the data is stored as for a normal sweep
 
     Returns:
         data (qcodes dataset)
         plot: QT plot
     """
-    innerloop = qc.Loop(sweep_param2.sweep(
-        start2, stop2, step2), delay).each(meas_param)
+    innerloop = _inner_loop(sweep_param2.sweep(
+        start2, stop2, step2), delay, (meas_param,), snake=snake)
 
     outerloop = qc.Loop(sweep_param1.sweep(
         start1, stop1, step1), delay).each(innerloop)